@@ -0,0 +1,40 @@
+# Разовый backfill: добавляет новые колонки в существующую БД (init_models)
+# и заполняет question_norm / question_hash для всех строк faq_entries.
+# Запуск: python -m app.backfill_faq_norm
+import asyncio
+from sqlalchemy import select
+
+from app.db import async_session_maker, init_models
+from app.models import FAQEntry
+from app.repositories.faq_repo import fill_question_norm
+from app.services.text_norm import normalize_many
+
+BATCH_SIZE = 500
+
+
+async def main():
+    await init_models()
+
+    updated = 0
+    last_id = 0
+    async with async_session_maker() as session:
+        while True:
+            result = await session.execute(
+                select(FAQEntry).where(FAQEntry.id > last_id).order_by(FAQEntry.id).limit(BATCH_SIZE)
+            )
+            batch = result.scalars().all()
+            if not batch:
+                break
+
+            for entry, norm in zip(batch, normalize_many(e.question for e in batch)):
+                fill_question_norm(entry, norm)
+            await session.commit()
+
+            updated += len(batch)
+            last_id = batch[-1].id
+
+    print(f"✅ question_norm заполнен для {updated} FAQ")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
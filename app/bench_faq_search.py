@@ -0,0 +1,73 @@
+# Бенчмарк поиска по FAQ: полный перебор WRatio vs BM25-отбор + WRatio
+# Запуск: python -m app.bench_faq_search [--sizes 1000 10000 100000] [--queries 200]
+import argparse
+import random
+import statistics
+import time
+
+from app.config import FAQ_SCORE_CUTOFF, FAQ_SHORTLIST_SIZE, FAQ_TOP_K
+from app.models import FAQEntry
+from app.services.faq_index import FAQIndex
+from app.services.text_norm import normalize
+
+WORDS = [
+    "заказ", "доставка", "оплата", "возврат", "гарантия", "карта", "курьер", "пункт", "выдача",
+    "скидка", "промокод", "рассрочка", "договор", "счёт", "чек", "товар", "склад", "регион",
+    "москва", "казань", "срок", "стоимость", "статус", "трек", "номер", "поддержка", "телефон",
+    "адрес", "отмена", "замена", "размер", "цвет", "наличие", "бонус", "баллы", "подписка",
+    "аккаунт", "пароль", "почта", "уведомление", "упаковка", "самовывоз", "юрлицо", "ндс",
+]
+STARTS = ["как", "где", "когда", "сколько", "можно ли", "почему", "что делать если", "есть ли"]
+
+
+def make_question(rng: random.Random) -> str:
+    return f"{rng.choice(STARTS)} {' '.join(rng.sample(WORDS, rng.randint(2, 5)))}?"
+
+
+def make_query(rng: random.Random, question: str) -> str:
+    # «живой» вопрос: выкидываем одно слово и добавляем случайное
+    tokens = question.rstrip("?").split()
+    if len(tokens) > 2:
+        tokens.pop(rng.randrange(1, len(tokens)))
+    tokens.insert(rng.randrange(1, len(tokens) + 1), rng.choice(WORDS))
+    return " ".join(tokens) + "?"
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(index: FAQIndex, queries: list[str]) -> tuple[float, float]:
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(normalize(q), limit=FAQ_TOP_K, score_cutoff=FAQ_SCORE_CUTOFF)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), percentile(timings, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} | {'mode':<10} | {'p50, ms':>8} | {'p99, ms':>8}")
+    for size in args.sizes:
+        rng = random.Random(size)
+        entries = [
+            FAQEntry(id=i, question=make_question(rng), answer="—")
+            for i in range(1, size + 1)
+        ]
+        queries = [make_query(rng, rng.choice(entries).question) for _ in range(args.queries)]
+
+        for mode, shortlist_size in (("full", 0), ("bm25", FAQ_SHORTLIST_SIZE)):
+            index = FAQIndex(shortlist_size=shortlist_size)
+            index.build(entries)
+            p50, p99 = run(index, queries)
+            print(f"{size:>8} | {mode:<10} | {p50:>8.2f} | {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,54 @@
 import asyncio
 import logging
+import time
+
+_started_at = time.perf_counter()  # до импорта aiogram / SQLAlchemy — их загрузка тоже входит в старт
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from app.config import BOT_TOKEN
+from app.config import BOT_TOKEN, WARMUP_ON_START, ANSWER_CACHE_SNAPSHOT
+from app.db import async_session_maker
+from app.repositories.admin_repo import load_admins
 from app.handlers import start, faq, ask, admin
-from app.scheduler import setup_scheduler
+from app.middlewares.db_session import DbSessionMiddleware
+from app.middlewares.rate_limit import RateLimitMiddleware
+from app.middlewares.user import UserMiddleware
+from app.scheduler import setup_scheduler, job_flush_counters
+from app.services import text_norm
+from app.services.answer_cache import answer_cache
+from app.services.faq_service import load_faq_index, load_semantic_cache
+from app.services.llm_provider import close_http_session
 
 # Включаем логи
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+async def warm_up():
+    """
+    Фоновый прогрев: словари pymorphy2, индекс FAQ и индекс похожих вопросов кэша.
+    Бот уже принимает сообщения; вопрос, пришедший раньше, дождётся той же сборки индекса.
+    """
+    start = time.perf_counter()
+    await asyncio.to_thread(text_norm.warm_up)
+    async with async_session_maker() as session:
+        await load_faq_index(session)
+        await load_semantic_cache(session)
+    logger.info(f"🔥 Прогрев завершён за {time.perf_counter() - start:.2f} с")
+
+
+def _on_warm_up_done(task: asyncio.Task) -> None:
+    # ошибка прогрева не останавливает бота (индекс соберётся при первом вопросе), но должна попасть в лог
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error(f"❌ Прогрев не удался: {error!r}", exc_info=error)
+
+
 async def main():
     # Проверяем, что токен есть
     if not BOT_TOKEN:
@@ -26,17 +60,45 @@ async def main():
     )
     dp = Dispatcher(storage=MemoryStorage())
 
+    # Одна сессия БД на апдейт (открывается при первом обращении), коммит в конце
+    dp.update.outer_middleware(DbSessionMiddleware())
+    # Внутренний users.id → data["db_user_id"] (из кэша, новых пользователей регистрирует)
+    dp.update.outer_middleware(UserMiddleware())
+    # Лимит сообщений на пользователя — до роутеров; backend="db" берёт db_user_id
+    dp.update.outer_middleware(RateLimitMiddleware())
+
     # Подключаем роутеры
     dp.include_router(start.router)
     dp.include_router(faq.router)
     dp.include_router(ask.router)
     dp.include_router(admin.router)
+    dp.include_router(admin.deny_router)
+
+    # Словари и индекс FAQ грузим в фоне, не задерживая старт polling
+    if WARMUP_ON_START:
+        warmup_task = asyncio.create_task(warm_up())
+        warmup_task.add_done_callback(_on_warm_up_done)
+
+    # Админы из БД — до приёма апдейтов (иначе их /admin получит отказ)
+    async with async_session_maker() as session:
+        await load_admins(session)
 
     # Запускаем шедулер
     setup_scheduler()
 
-    logger.info("🚀 Бот запущен")
-    await dp.start_polling(bot)
+    # Тёплый старт L1-кэша ответов из снимка
+    if ANSWER_CACHE_SNAPSHOT:
+        answer_cache.load(ANSWER_CACHE_SNAPSHOT)
+
+    logger.info(f"🚀 Бот запущен за {time.perf_counter() - _started_at:.2f} с")
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # несохранённые счётчики hits / popularity
+        await job_flush_counters()
+        await close_http_session()
+        if ANSWER_CACHE_SNAPSHOT:
+            answer_cache.save(ANSWER_CACHE_SNAPSHOT)
 
 
 if __name__ == "__main__":
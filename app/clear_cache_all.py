@@ -2,11 +2,12 @@
 import asyncio
 from sqlalchemy import delete
 from app.db import async_session_maker
-from app.models import GPTCache
+from app.models import GPTCache, GPTCacheDependency
 
 async def main():
     async with async_session_maker() as session:
         await session.execute(delete(GPTCache))
+        await session.execute(delete(GPTCacheDependency))
         await session.commit()
         print("✅ gpt_cache очищен полностью")
 
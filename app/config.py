@@ -8,16 +8,74 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./db.sqlite3")
 
+# === База данных: пул соединений и SQLite ===
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))                    # постоянных соединений в пуле
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))             # сверх пула под пиковую нагрузку
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))           # ожидание свободного соединения, сек
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))           # пересоздавать соединения старше N сек
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"          # проверка соединения перед выдачей (не для SQLite)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # asyncpg: prepared statements на соединение
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")         # WAL: чтения не ждут запись
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")        # в WAL fsync только на checkpoint
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # ждать блокировку вместо "database is locked"
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # байт, 0 — без mmap
+
 # === LLM провайдер ===
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "yandex")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")  # любой OpenAI-совместимый API
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+LLM_HEDGE_PROVIDER = os.getenv("LLM_HEDGE_PROVIDER", "")               # запасной провайдер для hedged-запросов (пусто — выкл.)
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))    # задержка хеджирования = этот квантиль задержек основного
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "3000"))    # задержка, пока истории мало
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "1000"))  # нижняя граница задержки хеджирования
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
 YANDEX_CATALOG_ID = os.getenv("YANDEX_CATALOG_ID")
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))                  # полный запрос к LLM
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))    # установка соединения
+LLM_POOL_LIMIT = int(os.getenv("LLM_POOL_LIMIT", "100"))                 # соединений в пуле всего
+LLM_POOL_LIMIT_PER_HOST = int(os.getenv("LLM_POOL_LIMIT_PER_HOST", "20"))  # соединений на один хост
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))  # сколько держать простаивающее соединение
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"                 # показывать ответ LLM по мере генерации
+LLM_STREAM_EDIT_INTERVAL = float(os.getenv("LLM_STREAM_EDIT_INTERVAL", "1.0"))  # сек. между правками сообщения (лимиты Telegram)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))        # одновременных запросов к LLM
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "50"))                    # ожидающих сверх этого — сразу отказ
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))     # ошибок подряд до открытия breaker
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_ERROR_CACHE_SECONDS = int(os.getenv("LLM_ERROR_CACHE_SECONDS", "30"))  # негативный кэш ошибки LLM
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "600"))          # бюджет FAQ-контекста в промпте
+LLM_CHUNK_MAX_TOKENS = int(os.getenv("LLM_CHUNK_MAX_TOKENS", "250"))      # не больше на один FAQ (ответ режется по предложениям)
+LLM_SINGLE_FLIGHT_TIMEOUT = float(os.getenv("LLM_SINGLE_FLIGHT_TIMEOUT", "60"))  # сек. на один склеенный вызов LLM
 
 # === Кэш и лимиты ===
 CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "72"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "10000"))     # ответов в L1-кэше процесса
+ANSWER_CACHE_SNAPSHOT = os.getenv("ANSWER_CACHE_SNAPSHOT", "")       # файл снимка L1-кэша при остановке (пусто — выкл.)
+GPT_CACHE_SIMILARITY = float(os.getenv("GPT_CACHE_SIMILARITY", "90"))  # порог похожести вопроса для ответа из кэша (0 — выкл.)
+COUNTERS_FLUSH_SECONDS = int(os.getenv("COUNTERS_FLUSH_SECONDS", "30"))  # как часто писать hits / popularity в БД
 MAX_MSG_PER_MIN = int(os.getenv("MAX_MSG_PER_MIN", "10"))
+MAX_LLM_PER_MIN = int(os.getenv("MAX_LLM_PER_MIN", "3"))            # вопросов к LLM в минуту (строже общего лимита)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")      # memory (в процессе) / db (usage_limits, общий для реплик)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # пользователей в памяти лимитера
 TOP_N_FAQ = int(os.getenv("TOP_N_FAQ", "8"))
+FAQ_PAGE_CACHE_SECONDS = float(os.getenv("FAQ_PAGE_CACHE_SECONDS", "60"))  # кэш клавиатур страниц FAQ (0 — выкл.)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "100000"))  # tg_id → users.id в памяти процесса
+
+# === Поиск по FAQ ===
+FAQ_TOP_K = int(os.getenv("FAQ_TOP_K", "3"))                        # сколько кандидатов предлагать
+FAQ_SCORE_CUTOFF = float(os.getenv("FAQ_SCORE_CUTOFF", "40"))       # минимальный fuzzy-скор кандидата
+# политика ответа по лучшему скору: >= AUTO — сразу ответ, >= CLARIFY — уточнение, ниже — сразу LLM
+FAQ_AUTO_ANSWER_SCORE = float(os.getenv("FAQ_AUTO_ANSWER_SCORE", "85"))
+FAQ_CLARIFY_SCORE = float(os.getenv("FAQ_CLARIFY_SCORE", "55"))
+FAQ_MIN_MARGIN = float(os.getenv("FAQ_MIN_MARGIN", "10"))            # отрыв лучшего от второго для автоответа
+FAQ_SHORTLIST_SIZE = int(os.getenv("FAQ_SHORTLIST_SIZE", "200"))    # кандидатов после BM25 (0 — всегда полный перебор)
+FAQ_SEARCH_BACKEND = os.getenv("FAQ_SEARCH_BACKEND", "fuzzy")        # fuzzy (RapidFuzz) / tfidf (векторный, нужен numpy)
+FAQ_VECTORS_PATH = os.getenv("FAQ_VECTORS_PATH", "./faq_vectors.f32")
+FAQ_VECTOR_DIM = int(os.getenv("FAQ_VECTOR_DIM", "4096"))
+LEMMA_CACHE_SIZE = int(os.getenv("LEMMA_CACHE_SIZE", "50000"))     # токенов в LRU-кэше лемматизатора
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"          # грузить pymorphy2 и индекс FAQ в фоне при старте
 
 # === Админы ===
 ADMINS = [int(x.strip()) for x in os.getenv("ADMINS", "").split(",") if x.strip()]
+ADMIN_REFRESH_SECONDS = int(os.getenv("ADMIN_REFRESH_SECONDS", "60"))  # перечитывать таблицу admins раз в N сек
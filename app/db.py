@@ -1,14 +1,100 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import logging
+import time
+
+from sqlalchemy import event, exc, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel
-from app.config import DATABASE_URL
+from app.config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE,
+)
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул с метриками выдачи соединений:
+      db.pool.checkout_ms  — ожидание соединения (включая открытие нового)
+      db.pool.saturation   — доля занятых соединений от pool_size + max_overflow в момент выдачи
+      db.pool.timeout      — не дождались соединения за pool_timeout
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            metrics.inc("db.pool.timeout")
+            raise
+        metrics.observe("db.pool.checkout_ms", (time.perf_counter() - start) * 1000)
+        capacity = self.size() + max(self._max_overflow, 0)
+        metrics.observe("db.pool.saturation", self.checkedout() / capacity)
+        return record
+
+
+# === Профили движка по типу БД ===
+def engine_options(url: str) -> dict:
+    """
+    Параметры create_async_engine для DATABASE_URL:
+      - SQLite :memory: — пул по умолчанию (одно общее соединение);
+      - SQLite-файл — пул без pre-ping (соединение с файлом не рвётся), PRAGMA — в apply_sqlite_pragmas;
+      - остальные (PostgreSQL) — пул с pre-ping и recycle; для asyncpg — кэш prepared statements.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+
+    options = {
+        "poolclass": MeteredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if backend != "sqlite":
+        options["pool_pre_ping"] = DB_POOL_PRE_PING
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def apply_sqlite_pragmas(engine: AsyncEngine) -> None:
+    """
+    PRAGMA на каждое новое соединение с SQLite: WAL (чтения не ждут запись),
+    synchronous, busy_timeout (ждать блокировку вместо "database is locked"), mmap.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+
+def create_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        echo=False,        # Можно включить True для логов SQL-запросов
+        future=True,
+        **engine_options(url),
+    )
+    apply_sqlite_pragmas(engine)
+    return engine
+
 
 # Создаём движок
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,        # Можно включить True для логов SQL-запросов
-    future=True
-)
+engine = create_engine()
 
 # Фабрика сессий
 async_session_maker = sessionmaker(
@@ -22,10 +108,105 @@ async def get_session() -> AsyncSession:
     async with async_session_maker() as session:
         yield session
 
+
+# === Unit of work ===
+# Флаг в session.info: сессией управляет DbSessionMiddleware (один коммит на апдейт)
+UNIT_OF_WORK = "unit_of_work"
+# Флаг в session.info: в unit of work уже были записи (flush) — коммит только в конце апдейта
+UOW_HAS_WRITES = "uow_has_writes"
+
+
+async def commit_or_flush(session: AsyncSession) -> None:
+    """
+    Завершение записи в репозиториях: в unit of work — только flush
+    (коммит один, в конце апдейта), в остальных случаях (скрипты, шедулер, тесты) — commit.
+    """
+    if session.info.get(UNIT_OF_WORK):
+        await session.flush()
+        session.info[UOW_HAS_WRITES] = True
+    else:
+        await session.commit()
+
+
+async def release_connection(session: AsyncSession) -> bool:
+    """
+    Возвращает соединение в пул перед долгим ожиданием сети (LLM),
+    чтобы апдейт не держал его секундами. Возвращает True, если отпустил.
+
+    Завершается только транзакция без записей (commit пустой, объекты не истекают —
+    expire_on_commit=False). Если в unit of work уже что-то записано, соединение
+    остаётся за апдейтом: промежуточный коммит нарушил бы «один коммит на апдейт» —
+    записи стали бы постоянными, даже если хендлер потом упадёт.
+    """
+    if not session.in_transaction():
+        return True
+    if session.info.get(UNIT_OF_WORK) and (
+        session.info.get(UOW_HAS_WRITES) or session.new or session.dirty or session.deleted
+    ):
+        return False
+    await session.commit()
+    return True
+
+
+def _add_missing_columns(sync_conn) -> None:
+    """
+    create_all не трогает существующие таблицы — добавляем в них новые
+    (nullable) колонки и индексы моделей, чтобы старая БД поднималась без миграций.
+    """
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes and index.name in _MERGE_BEFORE_UNIQUE:
+                _MERGE_BEFORE_UNIQUE[index.name](sync_conn)
+            index.create(sync_conn, checkfirst=True)
+
+
+def _merge_usage_limits(sync_conn) -> None:
+    """
+    До ux_usage_limits_user_window счётчик мог лечь несколькими строками на одно
+    (user_id, window_start). Суммируем count в строку с максимальным id, остальные удаляем —
+    иначе уникальный индекс не создастся, а удаление без суммы потеряло бы счётчики.
+    """
+    merged = sync_conn.execute(text(
+        "UPDATE usage_limits SET count = ("
+        "  SELECT SUM(d.count) FROM usage_limits AS d"
+        "  WHERE d.user_id = usage_limits.user_id AND d.window_start = usage_limits.window_start"
+        ") WHERE id IN ("
+        "  SELECT MAX(id) FROM usage_limits GROUP BY user_id, window_start HAVING COUNT(*) > 1"
+        ")"
+    )).rowcount
+    if not merged:
+        return
+    removed = sync_conn.execute(text(
+        "DELETE FROM usage_limits WHERE id NOT IN ("
+        "  SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM usage_limits GROUP BY user_id, window_start) AS keep"
+        ")"
+    )).rowcount
+    logger.warning(f"[DB MIGRATE] usage_limits: {removed} дублирующих строк слиты в {merged} (count суммирован)")
+
+
+# Уникальные индексы, которые добавлены к уже существующим таблицам и требуют
+# подготовки данных. Для остальных индексов строки не трогаем: дубликаты — ошибка create.
+_MERGE_BEFORE_UNIQUE = {
+    "ux_usage_limits_user_window": _merge_usage_limits,
+}
+
+
 # Функция инициализации моделей (создание таблиц)
 async def init_models():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
 
 async def reset_db():
     """Удаляет ВСЕ таблицы и создаёт заново (⚠️ все данные будут потеряны)"""
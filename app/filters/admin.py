@@ -0,0 +1,13 @@
+from aiogram.filters import Filter
+from aiogram.types import TelegramObject, User
+
+from app.services.admin_cache import admin_set
+
+
+class IsAdmin(Filter):
+    """
+    Пропускает только админов (ADMINS ∪ таблица admins) — проверка по admin_set, без запроса в БД.
+    """
+
+    async def __call__(self, event: TelegramObject, event_from_user: User | None = None) -> bool:
+        return event_from_user is not None and event_from_user.id in admin_set
@@ -4,13 +4,20 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
+from app.filters.admin import IsAdmin
 from app.keyboards.admin_inline import admin_inline_kb
-from app.config import ADMINS
-from app.db import async_session_maker
-from app.models import Admin
+from app.middlewares.db_session import UnitOfWork
 from app.repositories import faq_repo, unanswered_repo
 
+# Все хендлеры админки — только для админов: одна проверка на роутер (O(1), admin_set)
 router = Router()
+router.message.filter(IsAdmin())
+router.callback_query.filter(IsAdmin())
+
+# Подключается после router: /admin и кнопки админки от остальных пользователей
+deny_router = Router()
+
+ADMIN_CALLBACK_PREFIXES = ("admin:", "del_faq:", "edit_faq:", "add_from_unanswered:")
 
 
 # === FSM для добавления FAQ ===
@@ -27,24 +34,19 @@ class EditFAQStates(StatesGroup):
 # === Команда /admin ===
 @router.message(Command("admin"))
 async def admin_menu(message: Message):
-    user_id = message.from_user.id
+    # доступ уже проверен фильтром роутера
+    await message.answer("⚙️ Админ-панель", reply_markup=admin_inline_kb())
 
-    # Проверяем доступ
-    is_admin = False
-    if user_id in ADMINS:
-        is_admin = True
-    else:
-        async with async_session_maker() as session:
-            admin = await session.get(Admin, user_id)
-            if admin:
-                is_admin = True
 
-    if not is_admin:
-        await message.answer("⛔ У вас нет доступа к админке.")
-        return
+# === Нет доступа ===
+@deny_router.message(Command("admin"))
+async def admin_denied(message: Message):
+    await message.answer("⛔ У вас нет доступа к админке.")
 
-    # Если админ → показываем меню
-    await message.answer("⚙️ Админ-панель", reply_markup=admin_inline_kb())
+
+@deny_router.callback_query(F.data.startswith(ADMIN_CALLBACK_PREFIXES))
+async def admin_callback_denied(callback: CallbackQuery):
+    await callback.answer("⛔ Нет доступа", show_alert=True)
 
 
 # === Добавление FAQ ===
@@ -63,13 +65,12 @@ async def add_faq_question(message: Message, state: FSMContext):
 
 
 @router.message(AddFAQStates.waiting_for_answer, F.text)
-async def add_faq_answer(message: Message, state: FSMContext):
+async def add_faq_answer(message: Message, state: FSMContext, uow: UnitOfWork):
     data = await state.get_data()
     question = data.get("new_question")
     answer = message.text.strip()
 
-    async with async_session_maker() as session:
-        await faq_repo.add_faq(session, question, answer)
+    await faq_repo.add_faq(uow.session, question, answer)
 
     await message.answer(f"✅ Вопрос добавлен в FAQ:\n\n❓ {question}\n💡 {answer}")
     await state.clear()
@@ -77,11 +78,10 @@ async def add_faq_answer(message: Message, state: FSMContext):
 
 # === Удаление FAQ ===
 @router.callback_query(F.data == "admin:delete")
-async def admin_delete(callback: CallbackQuery):
+async def admin_delete(callback: CallbackQuery, uow: UnitOfWork):
     await callback.answer()
 
-    async with async_session_maker() as session:
-        faqs = await faq_repo.all_faqs(session)
+    faqs = await faq_repo.all_faqs(uow.session)
 
     if not faqs:
         await callback.message.answer("📭 База FAQ пуста.")
@@ -97,11 +97,10 @@ async def admin_delete(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("del_faq:"))
-async def confirm_delete(callback: CallbackQuery):
+async def confirm_delete(callback: CallbackQuery, uow: UnitOfWork):
     faq_id = int(callback.data.split(":")[1])
 
-    async with async_session_maker() as session:
-        success = await faq_repo.delete_faq(session, faq_id)
+    success = await faq_repo.delete_faq(uow.session, faq_id)
 
     if success:
         await callback.message.answer(f"✅ Вопрос #{faq_id} удалён.")
@@ -113,11 +112,10 @@ async def confirm_delete(callback: CallbackQuery):
 
 # === Редактирование FAQ ===
 @router.callback_query(F.data == "admin:edit")
-async def admin_edit(callback: CallbackQuery):
+async def admin_edit(callback: CallbackQuery, uow: UnitOfWork):
     await callback.answer()
 
-    async with async_session_maker() as session:
-        faqs = await faq_repo.all_faqs(session)
+    faqs = await faq_repo.all_faqs(uow.session)
 
     if not faqs:
         await callback.message.answer("📭 База FAQ пуста.")
@@ -143,14 +141,12 @@ async def start_edit(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(EditFAQStates.waiting_for_new_answer, F.text)
-async def save_edit(message: Message, state: FSMContext):
+async def save_edit(message: Message, state: FSMContext, uow: UnitOfWork):
     data = await state.get_data()
     faq_id = data.get("edit_faq_id")
     new_answer = message.text.strip()
 
-    async with async_session_maker() as session:
-        success = await faq_repo.update_faq(session, faq_id=faq_id, answer=new_answer)
-
+    success = await faq_repo.update_faq(uow.session, faq_id=faq_id, answer=new_answer)
 
     if success:
         await message.answer(f"✅ Ответ обновлён для FAQ #{faq_id}")
@@ -161,11 +157,10 @@ async def save_edit(message: Message, state: FSMContext):
 
 # === Непокрытые вопросы ===
 @router.callback_query(F.data == "admin:unanswered")
-async def admin_unanswered(callback: CallbackQuery):
+async def admin_unanswered(callback: CallbackQuery, uow: UnitOfWork):
     await callback.answer()
 
-    async with async_session_maker() as session:
-        questions = await unanswered_repo.get_recent_unanswered(session, limit=5)
+    questions = await unanswered_repo.get_recent_unanswered(uow.session, limit=5)
 
     if not questions:
         await callback.message.answer("📭 Нет непросмотренных вопросов.")
@@ -185,12 +180,11 @@ async def admin_unanswered(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("add_from_unanswered:"))
-async def add_from_unanswered(callback: CallbackQuery, state: FSMContext):
+async def add_from_unanswered(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
     q_id = int(callback.data.split(":")[1])
 
-    async with async_session_maker() as session:
-        questions = await unanswered_repo.get_recent_unanswered(session, limit=10)
-        q = next((x for x in questions if x.id == q_id), None)
+    questions = await unanswered_repo.get_recent_unanswered(uow.session, limit=10)
+    q = next((x for x in questions if x.id == q_id), None)
 
     if not q:
         await callback.message.answer("⚠️ Вопрос не найден.")
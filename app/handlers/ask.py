@@ -1,13 +1,87 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from app.db import async_session_maker
+from app.config import LLM_STREAMING, LLM_STREAM_EDIT_INTERVAL
+from app.middlewares.db_session import UnitOfWork
 from app.services import faq_service
 from app.repositories import faq_repo
+from app.services.counters import faq_popularity
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = "⏳ Думаю над ответом…"
+
+
+class StreamingReply:
+    """
+    Ответ LLM по мере генерации: плейсхолдер, затем edit_text накопленного текста
+    не чаще LLM_STREAM_EDIT_INTERVAL (Telegram ограничивает частоту правок).
+    Если ответ пришёл из кэша, плейсхолдер не отправляется — сразу итоговое сообщение.
+    """
+
+    def __init__(self, chat_message: Message):
+        self.chat_message = chat_message
+        self.sent: Optional[Message] = None
+        self.shown = ""
+        self.next_edit_at = 0.0
+
+    async def update(self, text: str) -> None:
+        if self.sent is None:
+            self.sent = await self.chat_message.answer(text or PLACEHOLDER)
+            self.shown = text or PLACEHOLDER
+            self.next_edit_at = time.monotonic() + LLM_STREAM_EDIT_INTERVAL
+            return
+        if not text or text == self.shown or time.monotonic() < self.next_edit_at:
+            return
+        await self._edit(text + " ▌", final=False)
+
+    async def finish(self, text: str) -> None:
+        if self.sent is None:
+            await self.chat_message.answer(text)
+        elif text != self.shown:
+            await self._edit(text, final=True)
+
+    async def _edit(self, text: str, final: bool) -> None:
+        try:
+            await self.sent.edit_text(text)
+            self.shown = text
+        except TelegramRetryAfter as e:
+            if not final:
+                self.next_edit_at = time.monotonic() + e.retry_after  # пропускаем промежуточные правки
+                return
+            await asyncio.sleep(e.retry_after)
+            await self.sent.edit_text(text)
+            self.shown = text
+        except TelegramBadRequest as e:
+            # промежуточный текст может оборвать HTML-разметку — ждём следующего куска
+            if final:
+                raise
+            logger.debug(f"[STREAM] Пропущена правка: {e}")
+        self.next_edit_at = time.monotonic() + LLM_STREAM_EDIT_INTERVAL
+
+
+async def answer_with_llm(chat_message: Message, session, user_id: int, text: str, context_faqs) -> None:
+    """
+    Ответ из кэша или LLM; при LLM_STREAMING сообщение обновляется по мере генерации.
+    """
+    reply = StreamingReply(chat_message)
+    gpt_answer = await faq_service.get_answer_from_gpt_cache_or_llm(
+        session,
+        user_id=user_id,
+        text=text,
+        context_faqs=context_faqs,
+        on_partial=reply.update if LLM_STREAMING else None,
+    )
+    await reply.finish(gpt_answer)
 
 
 # === FSM ===
@@ -52,7 +126,7 @@ async def reject_non_text(message: Message):
 
 # === 4. Обработка текстового вопроса ===
 @router.message(AskStates.waiting_for_question, F.text)
-async def handle_free_text(message: Message, state: FSMContext):
+async def handle_free_text(message: Message, state: FSMContext, uow: UnitOfWork):
     text = message.text.strip()
 
     if len(text) > 512:
@@ -60,13 +134,13 @@ async def handle_free_text(message: Message, state: FSMContext):
         return
 
     user_id = message.from_user.id
+    session = uow.session
 
-    async with async_session_maker() as session:
-        answer, candidates, need_clarification = await faq_service.get_answer_from_faq(
-            session, user_id, text
-        )
+    answer, candidates, need_clarification = await faq_service.get_answer_from_faq(
+        session, user_id, text
+    )
 
-    if answer:  # exact match
+    if answer:  # exact или уверенный fuzzy-match
         await message.answer(answer)
         await state.clear()
         return
@@ -86,51 +160,40 @@ async def handle_free_text(message: Message, state: FSMContext):
         await message.answer("❓ Я не нашёл точный ответ. Вы имели в виду:", reply_markup=kb)
         return
 
-    # fallback: вообще нет кандидатов → сразу GPT
-    async with async_session_maker() as session:
-        gpt_answer = await faq_service.get_answer_from_gpt_cache_or_llm(
-            session,
-            user_id=user_id,
-            text=text,
-            context_faqs=[],
-        )
-    await message.answer(gpt_answer)
+    # низкая уверенность или нет кандидатов → сразу GPT (кандидаты идут в контекст)
+    await answer_with_llm(message, session, user_id, text, context_faqs=candidates)
     await state.clear()
 
 
 # === 5. Обработка выбора пользователя при уточнении ===
 @router.callback_query(F.data.startswith("clarify:"))
-async def handle_clarification(callback: CallbackQuery, state: FSMContext):
+async def handle_clarification(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
     data = await state.get_data()
     orig_question = data.get("orig_question")
     candidates_ids = data.get("candidates_ids", [])
 
     choice = callback.data.split(":")[1]
+    session = uow.session
+
+    if choice == "none":
+        # подтянем тех же кандидатов (top-3), что показывали пользователю, — одним запросом
+        context_faqs = await faq_repo.get_many_by_ids(session, candidates_ids[:3])
 
-    async with async_session_maker() as session:
-        if choice == "none":
-            # подтянем тех же кандидатов (top-3), что показывали пользователю
-            context_faqs = []
-            for cid in candidates_ids[:3]:
-                faq = await faq_repo.get_by_id(session, cid)
-                if faq:
-                    context_faqs.append(faq)
-
-            gpt_answer = await faq_service.get_answer_from_gpt_cache_or_llm(
-                session,
-                user_id=callback.from_user.id,
-                text=orig_question,
-                context_faqs=context_faqs,  # <-- передаём контекст!
-            )
-            await callback.message.answer(gpt_answer)
+        await answer_with_llm(
+            callback.message,
+            session,
+            user_id=callback.from_user.id,
+            text=orig_question,
+            context_faqs=context_faqs,  # <-- передаём контекст!
+        )
+    else:
+        faq_id = int(choice)
+        faq_entry = await faq_repo.get_by_id(session, faq_id)
+        if faq_entry:
+            faq_popularity.add(faq_id)
+            await callback.message.answer(f"💡 {faq_entry.answer}")
         else:
-            faq_id = int(choice)
-            faq_entry = await faq_service.faq_repo.get_by_id(session, faq_id)
-            if faq_entry:
-                await faq_service.faq_repo.inc_popularity(session, faq_id)
-                await callback.message.answer(f"💡 {faq_entry.answer}")
-            else:
-                await callback.message.answer("❌ Этот вариант больше недоступен.")
+            await callback.message.answer("❌ Этот вариант больше недоступен.")
 
     await state.clear()
     await callback.answer()
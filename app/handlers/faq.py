@@ -1,52 +1,70 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from app.db import async_session_maker
-from app.keyboards.faq_inline import faq_list_kb
+from app.keyboards.faq_inline import faq_page_kb, faq_pages
+from app.middlewares.db_session import UnitOfWork
 from app.config import TOP_N_FAQ
 from app.repositories import faq_repo
+from app.services.counters import faq_popularity
+from app.services.faq_index import faq_index
 
 router = Router()
 
 
-# === Хендлер на кнопку 📋 FAQ ===
-@router.message(F.text == "📋 FAQ")
-async def show_faq_list(message: Message):
-    async with async_session_maker() as session:
-        # Считаем общее количество FAQ
-        total_count = len(await faq_repo.all_for_search(session))
+# === Страница списка FAQ (из кэша клавиатур или keyset-запросом) ===
+async def _page_keyboard(page_key: str, uow: UnitOfWork):
+    """
+    page_key — хвост callback_data после "faq:page:": "n:{popularity}:{id}" / "p:{...}",
+    пустая строка (или старый номер страницы) — первая страница.
+    Возвращает клавиатуру или None, если страница пустая.
+    """
+    found, kb = faq_pages.get(page_key, faq_index.version)
+    if found:
+        return kb
+
+    parts = page_key.split(":")
+    cursor, backward = None, False
+    if len(parts) == 3 and parts[0] in ("n", "p"):
+        try:
+            cursor, backward = (int(parts[1]), int(parts[2])), parts[0] == "p"
+        except ValueError:
+            page_key = ""  # callback_data присылает клиент — битый курсор → первая страница
+
+    version = faq_index.version  # до запроса: изменение во время запроса не закэшируется как новое
+    faq_items, has_more = await faq_repo.top_faq_page(uow.session, TOP_N_FAQ, cursor, backward)
+
+    kb = None
+    if faq_items:
+        if backward:
+            kb = faq_page_kb(faq_items, has_prev=has_more, has_next=True)
+        else:
+            kb = faq_page_kb(faq_items, has_prev=cursor is not None, has_next=has_more)
+    faq_pages.set(page_key, version, kb)
+    return kb
 
-        # Берём первую страницу (offset=0)
-        faq_items = await faq_repo.top_faq(session, TOP_N_FAQ, offset=0)
 
-    if not faq_items:
+# === Хендлер на кнопку 📋 FAQ ===
+@router.message(F.text == "📋 FAQ")
+async def show_faq_list(message: Message, uow: UnitOfWork):
+    kb = await _page_keyboard("", uow)
+    if kb is None:
         await message.answer("❌ В базе пока нет FAQ.")
         return
 
-    kb = faq_list_kb(faq_items)
-
-    # Добавляем кнопку "Далее", если есть больше вопросов
-    if total_count > TOP_N_FAQ:
-        from aiogram.types import InlineKeyboardButton
-        kb.inline_keyboard.append([
-            InlineKeyboardButton(text="➡️ Далее", callback_data="faq:page:1")
-        ])
-
     await message.answer("📋 Часто задаваемые вопросы:", reply_markup=kb)
 
 
 # === Хендлер на нажатие вопроса ===
 @router.callback_query(F.data.startswith("faq:") & ~F.data.startswith("faq:page"))
-async def faq_answer(callback: CallbackQuery):
+async def faq_answer(callback: CallbackQuery, uow: UnitOfWork):
     faq_id = int(callback.data.split(":")[1])
 
-    async with async_session_maker() as session:
-        faq_entry = await faq_repo.get_by_id(session, faq_id)
-        if not faq_entry:
-            await callback.answer("❌ Вопрос не найден", show_alert=True)
-            return
+    faq_entry = await faq_repo.get_by_id(uow.session, faq_id)
+    if not faq_entry:
+        await callback.answer("❌ Вопрос не найден", show_alert=True)
+        return
 
-        # Увеличиваем популярность
-        await faq_repo.inc_popularity(session, faq_id)
+    # Увеличиваем популярность (в БД уйдёт пачкой)
+    faq_popularity.add(faq_id)
 
     await callback.message.answer(f"💡 {faq_entry.answer}")
     await callback.answer()
@@ -54,28 +72,11 @@ async def faq_answer(callback: CallbackQuery):
 
 # === Хендлер пагинации (следующая/предыдущая страница) ===
 @router.callback_query(F.data.startswith("faq:page:"))
-async def faq_pagination(callback: CallbackQuery):
-    page = int(callback.data.split(":")[2])
-    offset = page * TOP_N_FAQ
-
-    async with async_session_maker() as session:
-        total_count = len(await faq_repo.all_for_search(session))
-        faq_items = await faq_repo.top_faq(session, TOP_N_FAQ, offset=offset)
-
-    if not faq_items:
+async def faq_pagination(callback: CallbackQuery, uow: UnitOfWork):
+    kb = await _page_keyboard(callback.data[len("faq:page:"):], uow)
+    if kb is None:
         await callback.answer("⚠️ Больше вопросов нет", show_alert=True)
         return
 
-    kb = faq_list_kb(faq_items)
-
-    from aiogram.types import InlineKeyboardButton
-    nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"faq:page:{page-1}"))
-    if offset + TOP_N_FAQ < total_count:
-        nav_row.append(InlineKeyboardButton(text="➡️ Далее", callback_data=f"faq:page:{page+1}"))
-    if nav_row:
-        kb.inline_keyboard.append(nav_row)
-
     await callback.message.edit_text("📋 Часто задаваемые вопросы:", reply_markup=kb)
     await callback.answer()
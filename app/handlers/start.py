@@ -3,31 +3,16 @@ from aiogram.filters import CommandStart
 from aiogram.types import Message
 
 from app.keyboards.reply import main_menu_kb
-from app.db import async_session_maker
-from app.models import User
-from sqlalchemy import select
-from datetime import datetime, UTC
+from app.middlewares.db_session import UnitOfWork
+from app.repositories import user_repo
 
 router = Router()
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
-    user_tg_id = message.from_user.id
-
-    # Проверяем, есть ли пользователь в БД
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.tg_id == user_tg_id))
-        user = result.scalar_one_or_none()
-
-        if not user:
-            # Если нет — создаём нового
-            user = User(
-                tg_id=user_tg_id,
-                created_at=datetime.now(UTC)
-            )
-            session.add(user)
-            await session.commit()
+async def cmd_start(message: Message, uow: UnitOfWork):
+    # Регистрируем пользователя, если его ещё нет (обычно уже сделал UserMiddleware — тогда ответ из кэша)
+    await user_repo.get_or_create_id(uow.session, message.from_user.id)
 
     # Отправляем приветствие
     text = (
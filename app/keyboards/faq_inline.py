@@ -1,5 +1,10 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import Sequence
+
+from app.config import FAQ_PAGE_CACHE_SECONDS
 from app.models import FAQEntry
 
 
@@ -17,3 +22,55 @@ def faq_list_kb(faq_items: Sequence[FAQEntry]) -> InlineKeyboardMarkup:
             )
         ])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def faq_page_kb(faq_items: Sequence[FAQEntry], has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """
+    Страница списка FAQ с навигацией. Курсоры — (popularity, id) крайних вопросов:
+    faq:page:p:{popularity}:{id} — страница перед первым, faq:page:n:{...} — после последнего.
+    """
+    kb = faq_list_kb(faq_items)
+    nav_row = []
+    if has_prev:
+        first = faq_items[0]
+        nav_row.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"faq:page:p:{first.popularity}:{first.id}"))
+    if has_next:
+        last = faq_items[-1]
+        nav_row.append(InlineKeyboardButton(text="➡️ Далее", callback_data=f"faq:page:n:{last.popularity}:{last.id}"))
+    if nav_row:
+        kb.inline_keyboard.append(nav_row)
+    return kb
+
+
+class PageKeyboardCache:
+    """
+    Готовые клавиатуры страниц FAQ: ключ страницы → (клавиатура, версия FAQ, expires_at).
+    Запись недействительна, если набор FAQ изменился (faq_index.version) или истёк TTL —
+    TTL нужен, чтобы порядок догонял изменения popularity.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[Optional[InlineKeyboardMarkup], int, float]] = OrderedDict()
+
+    def get(self, key: str, version: int) -> tuple[bool, Optional[InlineKeyboardMarkup]]:
+        """(найдено ли, клавиатура); None — страница пустая."""
+        item = self._data.get(key)
+        if item is None or item[1] != version or item[2] <= time.monotonic():
+            return False, None
+        return True, item[0]
+
+    def set(self, key: str, version: int, kb: Optional[InlineKeyboardMarkup]) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._data[key] = (kb, version, time.monotonic() + self.ttl_seconds)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+faq_pages = PageKeyboardCache(FAQ_PAGE_CACHE_SECONDS)
@@ -0,0 +1,80 @@
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import UNIT_OF_WORK, async_session_maker
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """
+    Сессия БД на один апдейт. Создаётся при первом обращении к .session —
+    апдейты, которым БД не нужна (меню, FSM, отклонённые), соединение не берут.
+    Репозитории внутри делают flush (app.db.commit_or_flush), коммит — один, в finish().
+    """
+
+    def __init__(self, session_maker=async_session_maker):
+        self._session_maker = session_maker
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_maker()
+            self._session.info[UNIT_OF_WORK] = True
+            metrics.inc("db.uow.opened")
+        return self._session
+
+    async def finish(self, error: bool = False) -> None:
+        """
+        Коммит (или откат при ошибке хендлера) и закрытие сессии, если она открывалась.
+        close() выполняется всегда — соединение возвращается в пул даже при отмене.
+        """
+        if self._session is None:
+            return
+        session, self._session = self._session, None
+        try:
+            if error:
+                metrics.inc("db.uow.rollback")
+                await session.rollback()
+            else:
+                await session.commit()
+        finally:
+            await session.close()
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на Dispatcher.update: кладёт в data["uow"] UnitOfWork,
+    после хендлера коммитит, при исключении (включая отмену задачи при остановке
+    polling) — откатывает и пробрасывает его дальше.
+    Хендлеры берут сессию как uow.session.
+    """
+
+    def __init__(self, session_maker=async_session_maker):
+        self.session_maker = session_maker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        uow = data["uow"] = UnitOfWork(self.session_maker)
+        failed = True
+        try:
+            result = await handler(event, data)
+            failed = False
+        finally:
+            # BaseException (CancelledError) тоже: сессия откатывается и закрывается
+            await uow.finish(error=failed)
+        return result
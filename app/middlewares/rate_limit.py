@@ -0,0 +1,66 @@
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from app.config import MAX_MSG_PER_MIN, RATE_LIMIT_BACKEND
+from app.db import async_session_maker
+from app.repositories import limits_repo
+from app.services.admin_cache import admin_set
+from app.services.metrics import metrics
+from app.services.rate_limiter import SlidingWindowLimiter, message_limiter
+
+logger = logging.getLogger(__name__)
+
+LIMIT_TEXT = "⏳ Слишком много сообщений. Подождите минуту и попробуйте снова."
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на Dispatcher.update: не пускает к хендлерам пользователя,
+    превысившего MAX_MSG_PER_MIN сообщений / нажатий в минуту.
+
+    backend="memory" — скользящее окно в памяти процесса (проверка без БД);
+    backend="db" — счётчик в usage_limits (общий для нескольких реплик, но запрос в БД на каждое событие);
+    users.id берётся из data["db_user_id"] (UserMiddleware выше по цепочке), без повторного поиска.
+    Админы не ограничиваются. Более строгий лимит на вопросы к LLM — в faq_service.
+    """
+
+    def __init__(self, limiter: SlidingWindowLimiter = message_limiter, backend: str = RATE_LIMIT_BACKEND):
+        self.limiter = limiter
+        self.backend = backend
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is None or user.id in admin_set:
+            return await handler(event, data)
+
+        if await self._allowed(user.id, data.get("db_user_id")):
+            return await handler(event, data)
+
+        metrics.inc("rate_limit.rejected")
+        logger.info(f"[RATE LIMIT] tg_id={user.id} превысил {MAX_MSG_PER_MIN} событий/мин")
+        if isinstance(event, Update):
+            await self._notify(event, user.id)
+        return None
+
+    async def _allowed(self, tg_id: int, db_user_id: int | None) -> bool:
+        if self.backend != "db":
+            return self.limiter.hit(tg_id)
+        if db_user_id is None:
+            return True  # бот или апдейт без пользователя — в usage_limits писать некуда
+        # своя сессия: check_and_increment коммитит сразу, а сессия апдейта коммитится только в конце
+        async with async_session_maker() as session:
+            return await limits_repo.check_and_increment(session, db_user_id, MAX_MSG_PER_MIN)
+
+    async def _notify(self, update: Update, tg_id: int) -> None:
+        if update.callback_query:
+            await update.callback_query.answer(LIMIT_TEXT)  # на нажатие отвечать нужно всегда
+        elif update.message and (self.backend == "db" or self.limiter.should_warn(tg_id)):
+            await update.message.answer(LIMIT_TEXT)
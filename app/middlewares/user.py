@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from app.repositories import user_repo
+
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на Dispatcher.update (после DbSessionMiddleware): один раз за апдейт
+    находит внутренний users.id по Telegram id и кладёт его в data["db_user_id"].
+    Незнакомого пользователя регистрирует; известные id берутся из кэша user_repo без запроса в БД.
+    Ключ намеренно не "user_id": в хендлерах и faq_service user_id — это Telegram id,
+    а db_user_id — для записей с внешним ключом на users (usage_limits).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            db_user_id = user_repo.cached_id(user.id)
+            if db_user_id is None:
+                db_user_id = await user_repo.get_or_create_id(data["uow"].session, user.id)
+            data["db_user_id"] = db_user_id
+        return await handler(event, data)
@@ -1,5 +1,5 @@
 from sqlmodel import SQLModel, Field, Column, ForeignKey
-from sqlalchemy import Text, DateTime, Integer, String, Float, DateTime
+from sqlalchemy import Text, DateTime, Integer, String, Float, DateTime, Index
 from datetime import datetime, UTC
 from typing import Optional
 
@@ -20,11 +20,18 @@ class FAQEntry(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     question: str = Field(sa_column=Column(Text, nullable=False))
     answer: str = Field(sa_column=Column(Text, nullable=False))
+    # нормализованный вопрос и его SHA-256 — exact-match одним индексированным запросом
+    question_norm: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    question_hash: Optional[str] = Field(default=None, sa_column=Column(String(64), index=True, nullable=True))
     popularity: int = Field(default=0, nullable=False)
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC), sa_column=Column(DateTime(timezone=True), nullable=False))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC), sa_column=Column(DateTime(timezone=True), nullable=False))
 
 
+# под сортировку списка FAQ (popularity DESC, id) и keyset-пагинацию по ней
+Index("ix_faq_entries_popularity_id", FAQEntry.__table__.c.popularity.desc(), FAQEntry.__table__.c.id)
+
+
 # === Unanswered Questions ===
 class UnansweredQuestion(SQLModel, table=True):
     __tablename__ = "unanswered_questions"
@@ -42,14 +49,33 @@ class GPTCache(SQLModel, table=True):
 
     id: Optional[int] = Field(default=None, primary_key=True)
     qhash: str = Field(sa_column=Column(String(64), unique=True, index=True, nullable=False))
+    # нормализованный вопрос — для поиска перефразированных вопросов в кэше
+    question_norm: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    # версии FAQ-контекста ("id@updated_at,..."), с которым сгенерирован ответ
+    context_key: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
     answer: str = Field(sa_column=Column(Text, nullable=False))
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC), sa_column=Column(DateTime(timezone=True), nullable=False))
     hits: int = Field(default=0, nullable=False)
 
 
+# === GPT Cache → FAQ (обратная связь для точечной инвалидации) ===
+class GPTCacheDependency(SQLModel, table=True):
+    __tablename__ = "gpt_cache_deps"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    qhash: str = Field(sa_column=Column(String(64), index=True, nullable=False))
+    # без FK: зависимость удаляется вместе с ответом, а не вместе с FAQ
+    faq_id: int = Field(index=True, nullable=False)
+
+
 # === Usage Limits ===
 class UsageLimit(SQLModel, table=True):
     __tablename__ = "usage_limits"
+    __table_args__ = (
+        # одна строка на пользователя и окно — на нём держится INSERT ... ON CONFLICT
+        Index("ux_usage_limits_user_window", "user_id", "window_start", unique=True),
+        Index("ix_usage_limits_window_start", "window_start"),  # для cleanup_old_limits
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id", nullable=False)
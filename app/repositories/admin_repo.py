@@ -0,0 +1,46 @@
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Admin, User
+from app.repositories import user_repo
+from app.services.admin_cache import admin_set
+
+
+async def admin_tg_ids(session: AsyncSession) -> set[int]:
+    """
+    Telegram id всех админов из таблицы admins (admins.user_id → users.id).
+    """
+    result = await session.execute(select(User.tg_id).join(Admin, Admin.user_id == User.id))
+    return set(result.scalars().all())
+
+
+async def load_admins(session: AsyncSession) -> None:
+    """
+    Перечитывает таблицу admins в admin_set (при старте и шедулером).
+    """
+    admin_set.build(await admin_tg_ids(session))
+
+
+async def add_admin(session: AsyncSession, tg_id: int) -> None:
+    """
+    Делает пользователя админом (регистрирует, если его ещё нет); доступ — сразу, без ожидания шедулера.
+    """
+    user_id = await user_repo.get_or_create_id(session, tg_id)
+    if await session.get(Admin, user_id) is None:
+        session.add(Admin(user_id=user_id))
+        await session.commit()
+    admin_set.add(tg_id)
+
+
+async def remove_admin(session: AsyncSession, tg_id: int) -> bool:
+    """
+    Снимает права админа. Возвращает False, если пользователь админом не был.
+    """
+    user_id = await user_repo.get_id_by_tg_id(session, tg_id)
+    removed = False
+    if user_id is not None:
+        result = await session.execute(delete(Admin).where(Admin.user_id == user_id))
+        await session.commit()
+        removed = bool(result.rowcount)
+    admin_set.discard(tg_id)
+    return removed
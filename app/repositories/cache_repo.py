@@ -1,10 +1,18 @@
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, UTC, timedelta
 from typing import Optional
 
-from app.models import GPTCache
+from app.models import GPTCache, GPTCacheDependency
 from app.config import CACHE_TTL_HOURS
+from app.db import commit_or_flush
+
+def as_utc(dt: datetime) -> datetime:
+    """
+    SQLite отдаёт DateTime(timezone=True) без tzinfo — считаем такие значения UTC.
+    """
+    return dt if dt.tzinfo else dt.replace(tzinfo=UTC)
+
 
 async def get_by_hash(session: AsyncSession, qhash: str) -> Optional[GPTCache]:
     """
@@ -16,11 +24,22 @@ async def get_by_hash(session: AsyncSession, qhash: str) -> Optional[GPTCache]:
     return result.scalar_one_or_none()
 
 
-async def upsert(session: AsyncSession, qhash: str, answer: str, fresh: bool = False) -> GPTCache:
+async def upsert(
+    session: AsyncSession,
+    qhash: str,
+    answer: str,
+    fresh: bool = False,
+    question_norm: Optional[str] = None,
+    context_key: Optional[str] = None,
+    faq_ids: Optional[list[int]] = None,
+) -> GPTCache:
     """
     Обновляет или добавляет запись в кэше.
     fresh=True → сбрасывает created_at и обновляет answer (после LLM).
     fresh=False → только увеличивает hits (при попадании в кэш).
+    question_norm — нормализованный вопрос (для поиска похожих вопросов).
+    context_key / faq_ids — FAQ-контекст ответа; по faq_ids ответ инвалидируется
+    при изменении или удалении этих FAQ.
     """
     entry = await get_by_hash(session, qhash)
 
@@ -28,20 +47,79 @@ async def upsert(session: AsyncSession, qhash: str, answer: str, fresh: bool = F
         if fresh:
             entry.answer = answer
             entry.created_at = datetime.now(UTC)
+        if question_norm is not None:
+            entry.question_norm = question_norm
+        if context_key is not None:
+            entry.context_key = context_key
         entry.hits += 1
     else:
         entry = GPTCache(
             qhash=qhash,
+            question_norm=question_norm,
+            context_key=context_key,
             answer=answer,
             created_at=datetime.now(UTC),
             hits=0 if fresh else 1  # можно начать с 0 при свежей записи
         )
         session.add(entry)
 
-    await session.commit()
+    if faq_ids is not None:
+        await session.execute(delete(GPTCacheDependency).where(GPTCacheDependency.qhash == qhash))
+        session.add_all(GPTCacheDependency(qhash=qhash, faq_id=faq_id) for faq_id in set(faq_ids))
+
+    await commit_or_flush(session)
     await session.refresh(entry)
     return entry
 
+
+async def add_hits(session: AsyncSession, deltas: dict[str, int]) -> None:
+    """
+    Пакетное атомарное UPDATE gpt_cache SET hits = hits + :delta по qhash.
+    Коммит — на вызывающем.
+    """
+    if not deltas:
+        return
+    table = GPTCache.__table__
+    await session.execute(
+        update(table)
+        .where(table.c.qhash == bindparam("b_qhash"))
+        .values(hits=table.c.hits + bindparam("delta")),
+        [{"b_qhash": h, "delta": delta} for h, delta in deltas.items()],
+    )
+
+
+async def invalidate_by_faq(session: AsyncSession, faq_id: int) -> list[str]:
+    """
+    Удаляет из кэша ответы, сгенерированные с этим FAQ в контексте.
+    Возвращает qhash удалённых записей.
+    """
+    result = await session.execute(
+        select(GPTCacheDependency.qhash).where(GPTCacheDependency.faq_id == faq_id)
+    )
+    hashes = list(set(result.scalars().all()))
+    if hashes:
+        await session.execute(delete(GPTCache).where(GPTCache.qhash.in_(hashes)))
+        await session.execute(delete(GPTCacheDependency).where(GPTCacheDependency.qhash.in_(hashes)))
+        await commit_or_flush(session)
+    return hashes
+
+async def fresh_questions(session: AsyncSession) -> list[tuple[str, str, str, datetime]]:
+    """
+    (qhash, question_norm, context_key, created_at) неустаревших записей — для индекса похожих вопросов.
+    """
+    cutoff = datetime.now(UTC) - timedelta(hours=CACHE_TTL_HOURS)
+    result = await session.execute(
+        select(GPTCache.qhash, GPTCache.question_norm, GPTCache.context_key, GPTCache.created_at).where(
+            GPTCache.question_norm.is_not(None),
+            GPTCache.created_at >= cutoff,
+        )
+    )
+    return [
+        (qhash, norm, context_key or "", as_utc(created_at))
+        for qhash, norm, context_key, created_at in result.all()
+    ]
+
+
 async def cleanup_expired_cache(session: AsyncSession) -> int:
     """
     Удаляет кэшированные ответы старше CACHE_TTL_HOURS.
@@ -52,5 +130,9 @@ async def cleanup_expired_cache(session: AsyncSession) -> int:
         delete(GPTCache).where(GPTCache.created_at < cutoff)
     )
     deleted = result.rowcount or 0
+    # зависимости удалённых ответов
+    await session.execute(
+        delete(GPTCacheDependency).where(GPTCacheDependency.qhash.not_in(select(GPTCache.qhash)))
+    )
     await session.commit()
     return deleted
\ No newline at end of file
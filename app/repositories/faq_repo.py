@@ -1,16 +1,46 @@
-from sqlalchemy import select, desc, update, delete
+from sqlalchemy import select, desc, update, delete, bindparam, or_, and_
+from sqlalchemy.orm import load_only
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from datetime import datetime, UTC
+from app.db import commit_or_flush
 from app.models import FAQEntry
+from app.repositories import cache_repo
+from app.services.answer_cache import answer_cache
+from app.services.faq_index import faq_index
+from app.services.semantic_cache import semantic_cache
+from app.services.text_norm import hash_norm, normalize
+
+
+def fill_question_norm(entry: FAQEntry, norm: Optional[str] = None) -> FAQEntry:
+    """
+    Заполняет question_norm / question_hash (norm можно передать готовым, например из normalize_many).
+    """
+    entry.question_norm = norm if norm is not None else normalize(entry.question)
+    entry.question_hash = hash_norm(entry.question_norm)
+    return entry
+
+
+async def invalidate_cached_answers(session: AsyncSession, faq_id: int) -> None:
+    """
+    Сбрасывает ответы LLM, сгенерированные с этим FAQ в контексте:
+    записи gpt_cache (по обратной связи gpt_cache_deps), L1 и индекс похожих вопросов.
+    Остальной кэш не трогается.
+    """
+    for h in await cache_repo.invalidate_by_faq(session, faq_id):
+        answer_cache.discard(h)
+        semantic_cache.remove(h)
 
 
 # === CRUD ===
+# Правки FAQ коммитятся сразу (и в unit of work): индекс FAQ и кэши в памяти
+# обновляются после записи и не должны увидеть изменение, которое потом откатится.
 async def create_faq(session: AsyncSession, question: str, answer: str) -> FAQEntry:
-    entry = FAQEntry(question=question, answer=answer)
+    entry = fill_question_norm(FAQEntry(question=question, answer=answer))
     session.add(entry)
     await session.commit()
     await session.refresh(entry)
+    faq_index.upsert(entry)
     return entry
 
 
@@ -21,6 +51,30 @@ async def get_by_id(session: AsyncSession, faq_id: int) -> FAQEntry | None:
     return result.scalar_one_or_none()
 
 
+async def get_many_by_ids(session: AsyncSession, faq_ids: list[int]) -> list[FAQEntry]:
+    """
+    Несколько FAQ одним запросом (WHERE id IN ...) в порядке faq_ids; отсутствующие пропускаются.
+    """
+    if not faq_ids:
+        return []
+    result = await session.execute(select(FAQEntry).where(FAQEntry.id.in_(faq_ids)))
+    by_id = {faq.id: faq for faq in result.scalars().all()}
+    return [by_id[faq_id] for faq_id in dict.fromkeys(faq_ids) if faq_id in by_id]
+
+
+async def get_by_question_norm(session: AsyncSession, norm: str) -> FAQEntry | None:
+    """
+    Exact-match по сохранённому нормализованному вопросу (индекс по question_hash).
+    """
+    result = await session.execute(
+        select(FAQEntry)
+        .where(FAQEntry.question_hash == hash_norm(norm), FAQEntry.question_norm == norm)
+        .order_by(FAQEntry.id)
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
 async def update_faq(session: AsyncSession, faq_id: int, *, answer: str) -> bool:
     res = await session.execute(select(FAQEntry).where(FAQEntry.id == faq_id))
     faq = res.scalar_one_or_none()
@@ -29,6 +83,8 @@ async def update_faq(session: AsyncSession, faq_id: int, *, answer: str) -> bool
     faq.answer = answer
     faq.updated_at = datetime.now(UTC)
     await session.commit()
+    faq_index.upsert(faq)
+    await invalidate_cached_answers(session, faq_id)
     return True
 
 
@@ -38,23 +94,74 @@ async def delete_faq(session: AsyncSession, faq_id: int) -> bool:
         return False
     await session.delete(entry)
     await session.commit()
+    faq_index.remove(faq_id)
+    await invalidate_cached_answers(session, faq_id)
     return True
 
 
 # === Топ вопросов (по популярности) ===
-async def top_faq(session: AsyncSession, limit: int, offset: int = 0) -> list[FAQEntry]:
-    result = await session.execute(
-        select(FAQEntry).order_by(desc(FAQEntry.popularity), FAQEntry.id).limit(limit).offset(offset)
-    )
-    return result.scalars().all()
+async def top_faq_page(
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[tuple[int, int]] = None,
+    backward: bool = False,
+) -> tuple[list[FAQEntry], bool]:
+    """
+    Keyset-пагинация в порядке popularity DESC, id (индекс ix_faq_entries_popularity_id):
+    страница сразу после cursor = (popularity, id) или, при backward, сразу перед ним.
+    Возвращает (вопросы в порядке показа, есть ли ещё записи в этом направлении).
+
+    Загружаются только id / question / popularity — текст ответа для списка не нужен.
+    """
+    query = select(FAQEntry).options(load_only(FAQEntry.id, FAQEntry.question, FAQEntry.popularity))
+    if cursor is not None:
+        popularity, faq_id = cursor
+        if backward:
+            query = query.where(or_(
+                FAQEntry.popularity > popularity,
+                and_(FAQEntry.popularity == popularity, FAQEntry.id < faq_id),
+            ))
+        else:
+            query = query.where(or_(
+                FAQEntry.popularity < popularity,
+                and_(FAQEntry.popularity == popularity, FAQEntry.id > faq_id),
+            ))
+    order = (FAQEntry.popularity, desc(FAQEntry.id)) if backward else (desc(FAQEntry.popularity), FAQEntry.id)
+
+    # limit + 1: лишняя строка говорит, есть ли следующая страница, без COUNT(*)
+    result = await session.execute(query.order_by(*order).limit(limit + 1))
+    items = list(result.scalars().all())
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backward:
+        items.reverse()
+    return items, has_more
 
 
 # === Увеличение популярности ===
 async def inc_popularity(session: AsyncSession, faq_id: int) -> None:
-    entry = await get_by_id(session, faq_id)
-    if entry:
-        entry.popularity += 1
-        await session.commit()
+    """
+    Сразу пишет +1 в БД. На пути пользователя используется
+    буфер app.services.counters.faq_popularity (пишется пачкой шедулером).
+    """
+    await add_popularity(session, {faq_id: 1})
+    await commit_or_flush(session)
+
+
+async def add_popularity(session: AsyncSession, deltas: dict[int, int]) -> None:
+    """
+    Пакетное атомарное UPDATE faq_entries SET popularity = popularity + :delta
+    (один statement, executemany по всем id). Коммит — на вызывающем.
+    """
+    if not deltas:
+        return
+    table = FAQEntry.__table__
+    await session.execute(
+        update(table)
+        .where(table.c.id == bindparam("faq_id"))
+        .values(popularity=table.c.popularity + bindparam("delta")),
+        [{"faq_id": faq_id, "delta": delta} for faq_id, delta in deltas.items()],
+    )
 
 
 async def all_for_search(session: AsyncSession) -> list[FAQEntry]:
@@ -63,10 +170,11 @@ async def all_for_search(session: AsyncSession) -> list[FAQEntry]:
 
 # === Добавить FAQ ===
 async def add_faq(session: AsyncSession, question: str, answer: str) -> FAQEntry:
-    entry = FAQEntry(question=question, answer=answer, popularity=0)
+    entry = fill_question_norm(FAQEntry(question=question, answer=answer, popularity=0))
     session.add(entry)
     await session.commit()
     await session.refresh(entry)
+    faq_index.upsert(entry)
     return entry
 
 # === Удалить FAQ ===
@@ -78,6 +186,8 @@ async def delete_faq(session: AsyncSession, faq_id: int) -> bool:
 
     await session.delete(entry)
     await session.commit()
+    faq_index.remove(faq_id)
+    await invalidate_cached_answers(session, faq_id)
     return True
 
 
@@ -89,7 +199,10 @@ async def update_faq_answer(session: AsyncSession, faq_id: int, new_answer: str)
         return False
 
     entry.answer = new_answer
+    entry.updated_at = datetime.now(UTC)
     await session.commit()
+    faq_index.upsert(entry)
+    await invalidate_cached_answers(session, faq_id)
     return True
 
 
@@ -1,9 +1,16 @@
 from sqlalchemy import select, delete
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, UTC, timedelta
 
 from app.models import UsageLimit
 
+# INSERT ... ON CONFLICT есть в этих диалектах (в SQLite RETURNING — с 3.35)
+_UPSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
 
 async def check_and_increment(
     session: AsyncSession,
@@ -15,11 +22,42 @@ async def check_and_increment(
     Возвращает:
       True  — если лимит ещё не превышен (запрос разрешён),
       False — если лимит превышен.
+
+    PostgreSQL / SQLite: один атомарный запрос
+      INSERT ... ON CONFLICT (user_id, window_start)
+      DO UPDATE SET count = count + 1 WHERE count < :max
+      RETURNING count
+    — без гонки между репликами: пустой RETURNING значит, что лимит исчерпан.
     """
 
     now = datetime.now(UTC)
     window_start = now.replace(second=0, microsecond=0)  # начало текущей минуты
 
+    insert = _UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+    if insert is None:
+        return await _check_and_increment_select(session, user_id, max_per_minute, window_start)
+
+    table = UsageLimit.__table__
+    stmt = insert(table).values(user_id=user_id, window_start=window_start, count=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.window_start],
+        set_={"count": table.c["count"] + 1},
+        where=table.c["count"] < max_per_minute,
+    ).returning(table.c["count"])
+
+    result = await session.execute(stmt)
+    allowed = result.scalar_one_or_none() is not None
+    await session.commit()
+    return allowed
+
+
+async def _check_and_increment_select(
+    session: AsyncSession,
+    user_id: int,
+    max_per_minute: int,
+    window_start: datetime,
+) -> bool:
+    """Запасной путь для прочих БД: SELECT + UPDATE/INSERT (не атомарно)."""
     # Ищем запись для пользователя в этом окне
     result = await session.execute(
         select(UsageLimit).where(
@@ -46,15 +84,24 @@ async def check_and_increment(
     return True
 
 
-async def cleanup_old_limits(session: AsyncSession, keep_minutes: int = 5) -> int:
+async def cleanup_old_limits(session: AsyncSession, keep_minutes: int = 5, batch_size: int = 1000) -> int:
     """
-    Удаляет старые записи из таблицы usage_limits (старше N минут).
+    Удаляет старые записи из таблицы usage_limits (старше N минут)
+    пачками по batch_size строк, с коммитом после каждой — таблица
+    не блокируется надолго одним большим DELETE.
     Возвращает количество удалённых записей.
     """
     cutoff = datetime.now(UTC) - timedelta(minutes=keep_minutes)
-    result = await session.execute(
-        delete(UsageLimit).where(UsageLimit.window_start < cutoff)
-    )
-    deleted = result.rowcount or 0
-    await session.commit()
-    return deleted
+    deleted = 0
+    while True:
+        batch = (
+            select(UsageLimit.id)
+            .where(UsageLimit.window_start < cutoff)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        result = await session.execute(delete(UsageLimit).where(UsageLimit.id.in_(batch)))
+        await session.commit()
+        deleted += result.rowcount or 0
+        if (result.rowcount or 0) < batch_size:
+            return deleted
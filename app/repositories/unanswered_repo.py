@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, UTC
 from typing import List
 
+from app.db import commit_or_flush
 from app.models import UnansweredQuestion
 
 
@@ -17,7 +18,7 @@ async def add_unanswered(session: AsyncSession, user_id: int, question_text: str
         created_at=datetime.now(UTC),
     )
     session.add(entry)
-    await session.commit()
+    await commit_or_flush(session)
     await session.refresh(entry)
     return entry
 
@@ -47,5 +48,5 @@ async def delete_unanswered(session: AsyncSession, question_id: int) -> bool:
         return False
 
     await session.delete(entry)
-    await session.commit()
+    await commit_or_flush(session)
     return True
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from datetime import datetime, UTC
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import USER_CACHE_SIZE
+from app.models import User
+
+# INSERT ... ON CONFLICT DO NOTHING RETURNING есть в этих диалектах
+_UPSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# === Кэш tg_id → users.id (id пользователя не меняется — инвалидация не нужна) ===
+_ids: OrderedDict[int, int] = OrderedDict()
+
+
+def cached_id(tg_id: int) -> Optional[int]:
+    user_id = _ids.get(tg_id)
+    if user_id is not None:
+        _ids.move_to_end(tg_id)
+    return user_id
+
+
+def _remember(tg_id: int, user_id: int) -> int:
+    _ids[tg_id] = user_id
+    _ids.move_to_end(tg_id)
+    while len(_ids) > USER_CACHE_SIZE:
+        _ids.popitem(last=False)
+    return user_id
+
+
+def clear_cache() -> None:
+    _ids.clear()
+
+
+async def get_id_by_tg_id(session: AsyncSession, tg_id: int) -> Optional[int]:
+    """
+    Внутренний users.id по Telegram id (None — пользователь ещё не зарегистрирован).
+    """
+    user_id = cached_id(tg_id)
+    if user_id is not None:
+        return user_id
+    result = await session.execute(select(User.id).where(User.tg_id == tg_id))
+    user_id = result.scalar_one_or_none()
+    return _remember(tg_id, user_id) if user_id is not None else None
+
+
+async def get_or_create_id(session: AsyncSession, tg_id: int) -> int:
+    """
+    users.id по Telegram id; нового пользователя регистрирует.
+
+    PostgreSQL / SQLite: INSERT ... ON CONFLICT (tg_id) DO NOTHING RETURNING id —
+    одновременные /start одного пользователя не дают IntegrityError; пустой RETURNING
+    значит, что строка уже есть, и id дочитывается SELECT-ом.
+    Вставка коммитится сразу (и в unit of work): в кэш не должен попасть id откатанной строки.
+    """
+    user_id = await get_id_by_tg_id(session, tg_id)
+    if user_id is not None:
+        return user_id
+
+    insert = _UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+    if insert is None:
+        return await _get_or_create_id_select(session, tg_id)
+
+    table = User.__table__
+    stmt = (
+        insert(table)
+        .values(tg_id=tg_id, created_at=datetime.now(UTC))
+        .on_conflict_do_nothing(index_elements=[table.c.tg_id])
+        .returning(table.c.id)
+    )
+    user_id = (await session.execute(stmt)).scalar_one_or_none()
+    await session.commit()
+    if user_id is None:
+        user_id = (await session.execute(select(User.id).where(User.tg_id == tg_id))).scalar_one()
+    return _remember(tg_id, user_id)
+
+
+async def _get_or_create_id_select(session: AsyncSession, tg_id: int) -> int:
+    """Запасной путь для прочих БД: INSERT, при гонке — откат и повторное чтение."""
+    user = User(tg_id=tg_id, created_at=datetime.now(UTC))
+    session.add(user)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        result = await session.execute(select(User.id).where(User.tg_id == tg_id))
+        return _remember(tg_id, result.scalar_one())
+    return _remember(tg_id, user.id)
@@ -1,11 +1,18 @@
 import asyncio
 import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
+from datetime import datetime, timedelta, UTC
 
+from app.config import CACHE_TTL_HOURS, COUNTERS_FLUSH_SECONDS, ADMIN_REFRESH_SECONDS
 from app.db import async_session_maker
+from app.repositories.admin_repo import load_admins
 from app.repositories.limits_repo import cleanup_old_limits
 from app.repositories.cache_repo import cleanup_expired_cache
+from app.services.answer_cache import answer_cache
+from app.services.counters import flush_counters
+from app.services.metrics import metrics
+from app.services.semantic_cache import semantic_cache
+from app.services.text_norm import lemma_cache
 
 logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
@@ -21,13 +28,37 @@ async def job_cleanup_limits():
 async def job_cleanup_cache():
     async with async_session_maker() as session:
         deleted = await cleanup_expired_cache(session)
+        semantic_cache.prune(datetime.now(UTC) - timedelta(hours=CACHE_TTL_HOURS))
         if deleted:
             logger.info(f"[Scheduler] Удалено {deleted} устаревших записей из gpt_cache в {datetime.now()}")
 
 
+async def job_flush_counters():
+    async with async_session_maker() as session:
+        await flush_counters(session)
+
+
+async def job_refresh_admins():
+    # изменения таблицы admins в обход admin_repo (вручную, другой репликой)
+    async with async_session_maker() as session:
+        await load_admins(session)
+
+
+async def job_log_metrics():
+    # снимок метрик для подбора порогов / лимитов по реальному трафику
+    logger.info(f"[Scheduler] Метрики: {metrics.snapshot()}")
+    logger.info(f"[Scheduler] L1-кэш ответов: {answer_cache.stats()}, леммы: {lemma_cache.info()}")
+
+
 def setup_scheduler():
     # чистим лимиты каждые 30 минут
     scheduler.add_job(job_cleanup_limits, "interval", minutes=30)
     # чистим кэш раз в час
     scheduler.add_job(job_cleanup_cache, "interval", hours=1)
+    # пишем накопленные hits / popularity пачкой
+    scheduler.add_job(job_flush_counters, "interval", seconds=COUNTERS_FLUSH_SECONDS, max_instances=1)
+    # перечитываем список админов
+    scheduler.add_job(job_refresh_admins, "interval", seconds=ADMIN_REFRESH_SECONDS, max_instances=1)
+    # пишем метрики в лог каждые 15 минут
+    scheduler.add_job(job_log_metrics, "interval", minutes=15)
     scheduler.start()
@@ -1,6 +1,8 @@
 import asyncio
 from app.db import async_session_maker
 from app.models import FAQEntry
+from app.repositories.faq_repo import fill_question_norm
+from app.services.text_norm import normalize_many
 from datetime import datetime, UTC
 
 faq_data = [
@@ -18,7 +20,8 @@ faq_data = [
 
 async def seed_faq():
     async with async_session_maker() as session:
-        for question, answer in faq_data:
+        norms = normalize_many(question for question, _ in faq_data)
+        for (question, answer), norm in zip(faq_data, norms):
             entry = FAQEntry(
                 question=question,
                 answer=answer,
@@ -26,7 +29,7 @@ async def seed_faq():
                 created_at=datetime.now(UTC),
                 updated_at=datetime.now(UTC),
             )
-            session.add(entry)
+            session.add(fill_question_norm(entry, norm))
         await session.commit()
     print("✅ FAQ успешно загружен в базу")
 
@@ -0,0 +1,38 @@
+import time
+from typing import Iterable, Optional
+
+from app.config import ADMINS
+
+
+class AdminSet:
+    """
+    Telegram id админов в памяти процесса: ADMINS из .env ∪ таблица admins.
+    Проверка доступа — O(1) без запроса в БД. Таблица перечитывается при старте
+    и шедулером (ADMIN_REFRESH_SECONDS); admin_repo обновляет набор сразу при изменениях.
+    """
+
+    def __init__(self, static_ids: Iterable[int] = ADMINS):
+        self.static_ids = frozenset(static_ids)
+        self._ids: frozenset[int] = self.static_ids
+        self.loaded_at: Optional[float] = None
+
+    def __contains__(self, tg_id: int) -> bool:
+        return tg_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def build(self, tg_ids: Iterable[int]) -> None:
+        # новый frozenset целиком: читатели не видят набор в процессе замены
+        self._ids = self.static_ids | frozenset(tg_ids)
+        self.loaded_at = time.monotonic()
+
+    def add(self, tg_id: int) -> None:
+        self._ids = self._ids | {tg_id}
+
+    def discard(self, tg_id: int) -> None:
+        if tg_id not in self.static_ids:  # админов из .env таблица не отменяет
+            self._ids = self._ids - {tg_id}
+
+
+admin_set = AdminSet()
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from app.config import ANSWER_CACHE_SIZE, CACHE_TTL_HOURS
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """
+    L1-кэш ответов в памяти процесса перед таблицей gpt_cache:
+    qhash → (answer, expires_at), LRU-вытеснение при переполнении.
+    Срок жизни тот же, что у gpt_cache: created_at + CACHE_TTL_HOURS.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, qhash: str) -> Optional[str]:
+        item = self._data.get(qhash)
+        if item is None or item[1] <= time.time():
+            if item is not None:
+                del self._data[qhash]  # устарело
+            self.misses += 1
+            return None
+        self._data.move_to_end(qhash)
+        self.hits += 1
+        return item[0]
+
+    def set(
+        self,
+        qhash: str,
+        answer: str,
+        created_at: Optional[datetime] = None,
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        created_at — время записи в gpt_cache (по умолчанию сейчас),
+        ttl_seconds — свой срок жизни вместо CACHE_TTL_HOURS.
+        """
+        start = created_at.timestamp() if created_at else time.time()
+        expires_at = start + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        if expires_at <= time.time():
+            return
+        self._data[qhash] = (answer, expires_at)
+        self._data.move_to_end(qhash)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, qhash: str) -> None:
+        self._data.pop(qhash, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    # === Снимок на диск (тёплый рестарт) ===
+    def save(self, path: str) -> None:
+        now = time.time()
+        data = [[h, answer, expires_at] for h, (answer, expires_at) in self._data.items() if expires_at > now]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"[ANSWER CACHE] Снимок сохранён: {len(data)} ответов → {path}")
+
+    def load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f"[ANSWER CACHE] Не удалось прочитать снимок {path}")
+            return
+        now = time.time()
+        for h, answer, expires_at in data:  # порядок сохранён: от старых к свежим
+            if expires_at > now:
+                self._data[h] = (answer, expires_at)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        logger.info(f"[ANSWER CACHE] Снимок загружен: {len(self._data)} ответов из {path}")
+
+
+# === Общий L1-кэш процесса ===
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, CACHE_TTL_HOURS * 3600)
@@ -0,0 +1,73 @@
+import logging
+from collections import defaultdict
+from typing import Hashable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repositories import cache_repo, faq_repo
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """
+    Накопитель приращений счётчиков в памяти: id → delta.
+    Запросы пользователей только увеличивают delta, а в БД всё уходит
+    пачкой при flush (шедулер раз в COUNTERS_FLUSH_SECONDS и при остановке бота).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._pending: dict[Hashable, int] = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, key: Hashable, delta: int = 1) -> None:
+        self._pending[key] += delta
+
+    def pending(self, key: Hashable) -> int:
+        return self._pending.get(key, 0)
+
+    def drain(self) -> dict:
+        """Забирает накопленные приращения и обнуляет буфер."""
+        pending, self._pending = dict(self._pending), defaultdict(int)
+        return pending
+
+    def restore(self, deltas: dict) -> None:
+        """Возвращает приращения в буфер (запись в БД не удалась)."""
+        for key, delta in deltas.items():
+            self._pending[key] += delta
+
+    def clear(self) -> None:
+        self._pending.clear()
+
+
+# === Счётчики процесса ===
+faq_popularity = CounterBuffer("faq.popularity")  # faq_id → +popularity
+cache_hits = CounterBuffer("gpt_cache.hits")      # qhash → +hits
+
+
+async def flush_counters(session: AsyncSession) -> int:
+    """
+    Пишет накопленные приращения в БД (атомарные UPDATE x = x + :delta).
+    Возвращает число обновлённых id; при ошибке приращения остаются в буфере.
+    """
+    popularity = faq_popularity.drain()
+    hits = cache_hits.drain()
+    if not popularity and not hits:
+        return 0
+    try:
+        await faq_repo.add_popularity(session, popularity)
+        await cache_repo.add_hits(session, hits)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        faq_popularity.restore(popularity)
+        cache_hits.restore(hits)
+        metrics.inc("counters.flush_error")
+        logger.exception("[COUNTERS] Не удалось записать счётчики, повтор при следующем flush")
+        return 0
+    metrics.inc("counters.flushed", len(popularity) + len(hits))
+    return len(popularity) + len(hits)
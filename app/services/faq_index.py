@@ -0,0 +1,254 @@
+import heapq
+import logging
+import math
+import threading
+from collections import Counter
+from typing import Iterable, Optional
+
+from rapidfuzz import fuzz, process
+
+from app.config import FAQ_SHORTLIST_SIZE, FAQ_SEARCH_BACKEND, FAQ_VECTORS_PATH, FAQ_VECTOR_DIM
+from app.models import FAQEntry
+from app.services.text_norm import normalize, normalize_many
+from app.services.vector_index import TfidfVectorIndex, np
+
+logger = logging.getLogger(__name__)
+
+# параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# леммы, встречающиеся в большей доле вопросов, не участвуют в отборе кандидатов
+MAX_DF_RATIO = 0.5
+
+
+class FAQIndex:
+    """
+    Процессный индекс FAQ для поиска без обращения к БД:
+    - нормализованные вопросы (считаются один раз, а не на каждое сообщение)
+    - хэш-таблица norm → id для exact-match за O(1)
+    - id → FAQEntry (отвязанная от сессии копия) для выдачи ответа
+    - плотные списки choices / ids для пакетного скоринга rapidfuzz
+    - инвертированный индекс лемма → {id: tf} для отбора кандидатов по BM25
+
+    Строится один раз при старте (build) и обновляется точечно
+    из faq_repo при добавлении / изменении / удалении FAQ.
+    build идёт в отдельном потоке по снимку из БД: изменения, пришедшие
+    во время сборки, откладываются и применяются поверх готового индекса.
+
+    backend="tfidf" переключает fuzzy-шаг на векторный поиск (TfidfVectorIndex),
+    exact-match при этом остаётся хэш-таблицей.
+    """
+
+    def __init__(self, shortlist_size: int = FAQ_SHORTLIST_SIZE, backend: str = "fuzzy"):
+        self.shortlist_size = shortlist_size
+        self._vectors: Optional[TfidfVectorIndex] = None
+        if backend == "tfidf":
+            if np is None:
+                logger.warning("[FAQ INDEX] FAQ_SEARCH_BACKEND=tfidf, но numpy не установлен — используется fuzzy")
+            else:
+                self._vectors = TfidfVectorIndex(FAQ_VECTORS_PATH, FAQ_VECTOR_DIM)
+        self._entries: dict[int, FAQEntry] = {}
+        self._norms: dict[int, str] = {}
+        self._id_by_norm: dict[str, int] = {}
+        self._choices: list[str] = []
+        self._choice_ids: list[int] = []
+        self._dirty = False
+        self._postings: dict[str, dict[int, int]] = {}
+        self._doc_len: dict[int, int] = {}
+        self._total_len = 0
+        self.ready = False
+        # растёт при любом изменении набора FAQ — по нему сбрасываются кэши, зависящие от списка
+        self.version = 0
+        # изменения во время build: faq_id → FAQEntry (None — удалён); None — build не идёт
+        self._pending: Optional[dict[int, Optional[FAQEntry]]] = None
+        self._mutation_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def build(self, entries: Iterable[FAQEntry]) -> None:
+        """Полностью перестраивает индекс по списку FAQEntry."""
+        with self._mutation_lock:
+            self.reset()
+            self._pending = {}
+        built = False
+        try:
+            entries = list(entries)
+            # сохранённый question_norm используем как есть, лемматизируем только строки без него
+            missing = [e for e in entries if not e.question_norm]
+            computed = dict(zip((e.id for e in missing), normalize_many(e.question for e in missing)))
+            for entry in entries:
+                self._put(entry, entry.question_norm or computed[entry.id])
+            if self._vectors is not None:
+                self._vectors.build(self._norms.items())
+            built = True
+        finally:
+            with self._mutation_lock:
+                pending, self._pending = self._pending, None
+                if built:
+                    # правки FAQ, закоммиченные после чтения снимка из БД
+                    for faq_id, entry in pending.items():
+                        if entry is None:
+                            self._remove(faq_id)
+                        else:
+                            self._upsert(entry)
+                    self.ready = True
+                    self.version += 1
+        logger.info(f"[FAQ INDEX] Построен индекс: {len(self._entries)} вопросов (отложенных правок: {len(pending)})")
+
+    def reset(self) -> None:
+        """Сбрасывает индекс (следующий поиск построит его заново)."""
+        self._entries.clear()
+        self._norms.clear()
+        self._id_by_norm.clear()
+        self._choices = []
+        self._choice_ids = []
+        self._dirty = False
+        self._postings.clear()
+        self._doc_len.clear()
+        self._total_len = 0
+        self.ready = False
+
+    def upsert(self, entry: FAQEntry) -> None:
+        """Добавляет или обновляет один FAQ (вызывается из faq_repo)."""
+        with self._mutation_lock:
+            self.version += 1
+            if self._pending is not None:
+                self._pending[entry.id] = FAQEntry.model_validate(entry.model_dump())
+                return
+            if not self.ready:
+                return  # индекс ещё не построен — build подхватит запись из БД
+            self._upsert(entry)
+
+    def remove(self, faq_id: int) -> None:
+        """Удаляет FAQ из индекса (вызывается из faq_repo)."""
+        with self._mutation_lock:
+            self.version += 1
+            if self._pending is not None:
+                self._pending[faq_id] = None
+                return
+            self._remove(faq_id)
+
+    def _upsert(self, entry: FAQEntry) -> None:
+        self._remove(entry.id)
+        self._put(entry, normalize(entry.question))
+        if self._vectors is not None:
+            self._vectors.upsert(entry.id, self._norms[entry.id])
+
+    def _remove(self, faq_id: int) -> None:
+        self._entries.pop(faq_id, None)
+        norm = self._norms.pop(faq_id, None)
+        if norm is None:
+            return
+        if self._vectors is not None:
+            self._vectors.remove(faq_id)
+        self._dirty = True
+        for lemma in set(norm.split()):
+            postings = self._postings.get(lemma)
+            if postings is not None:
+                postings.pop(faq_id, None)
+                if not postings:
+                    del self._postings[lemma]
+        self._total_len -= self._doc_len.pop(faq_id, 0)
+        if self._id_by_norm.get(norm) == faq_id:
+            del self._id_by_norm[norm]
+            # если такой же нормализованный вопрос есть у другого FAQ — переназначаем
+            for other_id, other_norm in self._norms.items():
+                if other_norm == norm:
+                    self._id_by_norm[norm] = other_id
+                    break
+
+    def get(self, faq_id: int) -> Optional[FAQEntry]:
+        return self._entries.get(faq_id)
+
+    def exact(self, norm_q: str) -> Optional[FAQEntry]:
+        """Exact-match по нормализованному тексту."""
+        faq_id = self._id_by_norm.get(norm_q)
+        return self._entries.get(faq_id) if faq_id is not None else None
+
+    def items(self) -> list[tuple[FAQEntry, str]]:
+        """Пары (FAQEntry, нормализованный вопрос) для fuzzy-поиска."""
+        return [(self._entries[faq_id], norm) for faq_id, norm in self._norms.items()]
+
+    def search(self, norm_q: str, limit: int, score_cutoff: float = 0) -> list[tuple[FAQEntry, float]]:
+        """
+        Fuzzy-поиск top-k одним нативным вызовом rapidfuzz.process.extract.
+        Кандидаты со скором ниже score_cutoff отбрасываются внутри rapidfuzz.
+
+        Если база больше shortlist_size, WRatio считается только для
+        кандидатов из BM25-отбора; пустой отбор → полный перебор.
+        """
+        if self._vectors is not None:
+            # поколение от другого воркера может знать FAQ, которых нет в этом процессе
+            return [
+                (self._entries[faq_id], score)
+                for faq_id, score in self._vectors.search(norm_q, limit, score_cutoff)
+                if faq_id in self._entries
+            ]
+
+        if self._dirty:
+            self._choice_ids = list(self._norms)
+            self._choices = list(self._norms.values())
+            self._dirty = False
+
+        choice_ids, choices = self._choice_ids, self._choices
+        if 0 < self.shortlist_size < len(self._norms):
+            shortlist = self.shortlist(norm_q, self.shortlist_size)
+            if shortlist:
+                choice_ids = shortlist
+                choices = [self._norms[faq_id] for faq_id in shortlist]
+
+        matches = process.extract(
+            norm_q,
+            choices,
+            scorer=fuzz.WRatio,
+            limit=limit,
+            score_cutoff=score_cutoff,
+        )
+        return [(self._entries[choice_ids[idx]], score) for _, score, idx in matches]
+
+    def shortlist(self, norm_q: str, size: int) -> list[int]:
+        """
+        Отбор до size кандидатов, у которых есть общие леммы с вопросом,
+        по убыванию BM25-скора.
+        """
+        n_docs = len(self._norms)
+        if not n_docs:
+            return []
+
+        terms = [t for t in set(norm_q.split()) if t in self._postings]
+        # слишком частые леммы («как», «в») почти не различают вопросы,
+        # а их списки самые длинные — пропускаем, если есть более редкие
+        rare = [t for t in terms if len(self._postings[t]) <= n_docs * MAX_DF_RATIO]
+        if rare:
+            terms = rare
+
+        avg_len = self._total_len / n_docs
+        scores: dict[int, float] = {}
+        for term in terms:
+            postings = self._postings[term]
+            df = len(postings)
+            idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1)
+            for faq_id, tf in postings.items():
+                norm_len = 1 - BM25_B + BM25_B * self._doc_len[faq_id] / avg_len
+                scores[faq_id] = scores.get(faq_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm_len)
+
+        return heapq.nlargest(size, scores, key=scores.__getitem__)
+
+    def _put(self, entry: FAQEntry, norm: str) -> None:
+        # храним копию, чтобы не держать ORM-объекты чужих сессий
+        entry = FAQEntry.model_validate(entry.model_dump())
+        self._entries[entry.id] = entry
+        self._norms[entry.id] = norm
+        self._id_by_norm.setdefault(norm, entry.id)
+        self._dirty = True
+
+        lemmas = norm.split()
+        for lemma, tf in Counter(lemmas).items():
+            self._postings.setdefault(lemma, {})[entry.id] = tf
+        self._doc_len[entry.id] = len(lemmas)
+        self._total_len += len(lemmas)
+
+
+# === Общий индекс процесса ===
+faq_index = FAQIndex(backend=FAQ_SEARCH_BACKEND)
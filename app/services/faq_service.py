@@ -1,29 +1,150 @@
+import asyncio
+import hashlib
 import logging
+import time
 from datetime import datetime, timedelta, UTC
 from sqlalchemy.ext.asyncio import AsyncSession
-from rapidfuzz import fuzz
 
-from app.models import FAQEntry
+from app.db import release_connection
+from app.models import FAQEntry, GPTCache
 from app.repositories import faq_repo, cache_repo
-from app.repositories.faq_repo import inc_popularity, all_for_search
-from app.services.text_norm import normalize, qhash
-from app.config import CACHE_TTL_HOURS
-from typing import Optional
-from app.services.llm_provider import get_llm_provider
+from app.repositories.faq_repo import all_for_search
+from app.services.admin_cache import admin_set
+from app.services.answer_cache import AnswerCache, answer_cache
+from app.services.counters import cache_hits, faq_popularity
+from app.services.faq_index import faq_index
+from app.services.metrics import metrics
+from app.services.prompt_builder import build_context, estimate_tokens
+from app.services.rate_limiter import llm_limiter
+from app.services.semantic_cache import semantic_cache
+from app.services.single_flight import SingleFlight
+from app.services.text_norm import hash_norm, normalize, shorten
+from app.config import (
+    CACHE_TTL_HOURS, GPT_CACHE_SIMILARITY, FAQ_TOP_K, FAQ_SCORE_CUTOFF,
+    FAQ_AUTO_ANSWER_SCORE, FAQ_CLARIFY_SCORE, FAQ_MIN_MARGIN, LLM_SINGLE_FLIGHT_TIMEOUT,
+    LLM_ERROR_CACHE_SECONDS, MAX_LLM_PER_MIN,
+)
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from app.services.llm_dispatcher import llm_dispatcher
+from app.services.llm_provider import LLMError
+from app.services.llm_router import get_llm_provider
 
 logger = logging.getLogger(__name__)
-THRESHOLD_FAQ = 70  # порог уверенности для fuzzy-match
+_index_lock = asyncio.Lock()
+LLM_LIMIT_TEXT = "⏳ Слишком много вопросов к ИИ подряд. Попробуйте через минуту."
+# одинаковые вопросы, пришедшие одновременно, → один вызов LLM на ключ кэша
+_llm_flight = SingleFlight("llm.single_flight", timeout=LLM_SINGLE_FLIGHT_TIMEOUT)
+# негативный кэш: ошибка LLM по ключу — отдельно от L1 (не считается попаданием и не попадает в снимок)
+llm_error_cache = AnswerCache(maxsize=1000, ttl_seconds=LLM_ERROR_CACHE_SECONDS)
 
-def _make_cache_key(text: str, context_faqs: Optional[list[FAQEntry]]) -> str:
+def _context_key(context_faqs: Optional[list[FAQEntry]]) -> str:
     """
-    Ключ кэша учитывает и вопрос, и ID FAQ-контекста (если он есть).
-    Это предотвращает возврат старой версии без контекста.
+    Версия FAQ-контекста: "id@updated_at" по возрастанию id.
+    Правка FAQ меняет updated_at, а значит и ключ — старый ответ больше не находится.
     """
-    base = normalize(text)
-    if context_faqs:
-        ctx_ids = ",".join(str(f.id) for f in context_faqs)
-        base = f"{base}::ctx={ctx_ids}"
-    return qhash(base)
+    if not context_faqs:
+        return ""
+    return ",".join(
+        f"{f.id}@{cache_repo.as_utc(f.updated_at).isoformat()}"
+        for f in sorted(context_faqs, key=lambda f: f.id)
+    )
+
+
+def _make_cache_key(norm_q: str, context_key: str) -> str:
+    """
+    Ключ кэша учитывает и вопрос, и версию FAQ-контекста (если он есть).
+    norm_q уже нормализован и хэшируется как есть (hash_norm): без контекста ключ
+    равен qhash(text), но без второй лемматизации. "id@updated_at" через normalize
+    пропускать тоже нельзя (склеит разные версии и засорит кэш лемм).
+    """
+    if not context_key:
+        return hash_norm(norm_q)
+    return hashlib.sha256(f"{norm_q}::ctx={context_key}".encode("utf-8")).hexdigest()
+
+
+async def load_faq_index(session: AsyncSession) -> None:
+    """
+    Строит процессный индекс FAQ из БД (при старте бота или при первом поиске).
+    Нормализация вопросов идёт в отдельном потоке, чтобы не блокировать event loop;
+    параллельные вызовы ждут одну и ту же сборку.
+    """
+    async with _index_lock:
+        if faq_index.ready:
+            return
+        entries = await all_for_search(session)
+        await asyncio.to_thread(faq_index.build, entries)
+
+
+def decide(scored: list[tuple[FAQEntry, float]]) -> str:
+    """
+    Политика по скорам кандидатов (по убыванию):
+      - "auto"    — лучший >= FAQ_AUTO_ANSWER_SCORE и отрыв от второго >= FAQ_MIN_MARGIN
+      - "clarify" — лучший >= FAQ_CLARIFY_SCORE (или высокий, но без отрыва)
+      - "llm"     — ниже FAQ_CLARIFY_SCORE или кандидатов нет
+    """
+    if not scored:
+        return "llm"
+    top = scored[0][1]
+    second = scored[1][1] if len(scored) > 1 else 0.0
+    if top >= FAQ_AUTO_ANSWER_SCORE and top - second >= FAQ_MIN_MARGIN:
+        return "auto"
+    if top >= FAQ_CLARIFY_SCORE:
+        return "clarify"
+    return "llm"
+
+
+def _record_decision(decision: str, text: str, scored: list[tuple[FAQEntry, float]]) -> None:
+    """
+    Пишет решение в лог и метрики — по ним подбираются пороги на реальном трафике.
+    Текст вопроса (персональные данные) — только на уровне DEBUG.
+    """
+    top = scored[0][1] if scored else 0.0
+    second = scored[1][1] if len(scored) > 1 else 0.0
+    faq_id = scored[0][0].id if scored else None
+    metrics.inc(f"faq.decision.{decision}")
+    if scored:
+        metrics.observe(f"faq.top_score.{decision}", top)
+    logger.info(
+        f"[FAQ DECISION] decision={decision} top={top:.1f} second={second:.1f} "
+        f"margin={top - second:.1f} faq_id={faq_id}"
+    )
+    logger.debug(f"[FAQ DECISION] decision={decision} q={shorten(text, 80)!r}")
+
+
+async def load_semantic_cache(session: AsyncSession) -> None:
+    """
+    Загружает в память нормализованные вопросы неустаревших ответов gpt_cache.
+    """
+    semantic_cache.build(await cache_repo.fresh_questions(session))
+
+
+def _is_fresh(entry: Optional[GPTCache]) -> bool:
+    if not entry:
+        return False
+    return datetime.now(UTC) - cache_repo.as_utc(entry.created_at) <= timedelta(hours=CACHE_TTL_HOURS)
+
+
+async def _find_similar_cached(session: AsyncSession, norm_q: str, context_key: str = "") -> Optional[GPTCache]:
+    """
+    Ищет закэшированный ответ на похожий (перефразированный) вопрос с тем же FAQ-контекстом.
+    """
+    if GPT_CACHE_SIMILARITY <= 0:
+        return None
+    if not semantic_cache.ready:
+        await load_semantic_cache(session)
+
+    match = semantic_cache.lookup(norm_q, score_cutoff=GPT_CACHE_SIMILARITY, context_key=context_key)
+    if not match:
+        return None
+    h, score = match
+    entry = await cache_repo.get_by_hash(session, h)
+    if not _is_fresh(entry):
+        semantic_cache.remove(h)  # запись удалена или устарела
+        return None
+    logger.info(f"[CACHE SEMANTIC HIT] Похожий вопрос qhash={h}, score={score:.1f}")
+    return entry
+
 
 async def get_answer_from_faq(
     session: AsyncSession,
@@ -32,29 +153,43 @@ async def get_answer_from_faq(
 ) -> tuple[str | None, list[FAQEntry], bool]:
     """
     Возвращает:
-      - answer: строка (если найден exact или из GPT/cache); иначе None
-      - candidates: список FAQEntry (для уточнения пользователем)
-      - need_clarification: True, если нужно спросить пользователя (только fuzzy)
+      - answer: строка (exact или уверенный fuzzy-match); иначе None
+      - candidates: список FAQEntry (для уточнения пользователем или как контекст для LLM)
+      - need_clarification: True, если нужно спросить пользователя
+    Если answer is None и need_clarification False — вопрос сразу уходит в LLM.
     """
 
     norm_q = normalize(text)
-    candidates = await all_for_search(session)
 
     # === 1. Exact match ===
-    for faq in candidates:
-        if normalize(faq.question) == norm_q:
-            await inc_popularity(session, faq.id)
-            return faq.answer, [faq], False
+    # индекс в памяти → O(1); иначе (индекс ещё строится, короткий скрипт) — один индексированный запрос
+    if faq_index.ready:
+        faq = faq_index.exact(norm_q)
+    else:
+        faq = await faq_repo.get_by_question_norm(session, norm_q)
+        if not faq:
+            await load_faq_index(session)
+            faq = faq_index.exact(norm_q)  # строки без question_norm (до backfill)
+    if faq:
+        metrics.inc("faq.decision.exact")
+        faq_popularity.add(faq.id)
+        return faq.answer, [faq], False
+
+    # === 2. Fuzzy search + политика по порогам ===
+    scored = faq_index.search(norm_q, limit=FAQ_TOP_K, score_cutoff=FAQ_SCORE_CUTOFF)
+    decision = decide(scored)
+    _record_decision(decision, text, scored)
+    candidates = [faq for faq, _ in scored]
 
-    # === 2. Fuzzy search (только кандидаты, без автоответа) ===
-    if not candidates:
-        return None, [], False
+    if decision == "auto":
+        best = candidates[0]
+        faq_popularity.add(best.id)
+        return best.answer, [best], False
 
-    scored = [(faq, fuzz.WRatio(norm_q, normalize(faq.question))) for faq in candidates]
-    scored.sort(key=lambda x: x[1], reverse=True)
-    top3 = [faq for faq, _ in scored[:3]]
+    if decision == "clarify":
+        return None, candidates, True  # пользователь выбирает вручную
 
-    return None, top3, True  # пользователь должен выбрать вручную
+    return None, candidates, False  # сразу в LLM, кандидаты — контекст
 
 
 async def get_answer_from_gpt_cache_or_llm(
@@ -62,38 +197,207 @@ async def get_answer_from_gpt_cache_or_llm(
     user_id: int,
     text: str,
     context_faqs=None,
+    on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> str:
     """
     Проверка кэша → если устарело или нет → запрос в LLM с контекстом.
+    Ключ кэша включает версии FAQ из context_faqs.
+    on_partial — если задан, ответ LLM запрашивается потоком и колбэк получает
+    накопленный текст по мере генерации ("" — перед запросом, для плейсхолдера).
+    В кэш пишется только итоговый текст; ошибки LLM в gpt_cache и L1 не попадают —
+    сообщение об ошибке держится в llm_error_cache только LLM_ERROR_CACHE_SECONDS.
     """
     norm_q = normalize(text)
-    h = qhash(norm_q)
+    ctx_key = _context_key(context_faqs)
+    h = _make_cache_key(norm_q, ctx_key)
+
+    # 1. Проверка кэша: L1 в памяти, затем gpt_cache (точное совпадение, похожий вопрос)
+    cached = answer_cache.get(h)
+    if cached is not None:
+        metrics.inc("gpt_cache.l1_hit")
+        cache_hits.add(h)
+        return cached
+    error_message = llm_error_cache.get(h)
+    if error_message is not None:
+        # негативная запись: строки в gpt_cache нет — hits не считаем
+        metrics.inc("gpt_cache.error_hit")
+        return error_message
 
-    # 1. Проверка кэша
     entry = await cache_repo.get_by_hash(session, h)
-    if entry:
-        age = datetime.now(UTC) - entry.created_at
-        if age <= timedelta(hours=CACHE_TTL_HOURS):
-            entry.hits += 1
-            await session.commit()
-            logger.info(f"[CACHE HIT] Ответ для qhash={h} взят из кэша")
-            return entry.answer  # ответ из кэша
-        else:
+    if _is_fresh(entry):
+        metrics.inc("gpt_cache.exact_hit")
+        logger.info(f"[CACHE HIT] Ответ для qhash={h} взят из кэша")
+    else:
+        if entry:
             logger.info(f"[CACHE EXPIRED] Ответ для qhash={h} устарел")
+        entry = await _find_similar_cached(session, norm_q, ctx_key)
+        if entry:
+            metrics.inc("gpt_cache.semantic_hit")
+
+    if entry:
+        cache_hits.add(entry.qhash)  # в БД уйдёт пачкой (flush_counters)
+        answer_cache.set(h, entry.answer, cache_repo.as_utc(entry.created_at))
+        return entry.answer  # ответ из кэша
+    metrics.inc("gpt_cache.miss")
+
+    # Отдельный, более строгий лимит на платные вызовы LLM
+    if user_id not in admin_set and not llm_limiter.hit(user_id):
+        metrics.inc("rate_limit.llm_rejected")
+        logger.info(f"[RATE LIMIT] user_id={user_id} превысил {MAX_LLM_PER_MIN} вопросов к LLM/мин")
+        return LLM_LIMIT_TEXT
+
+    # 2. Одновременные промахи по тому же ключу ждут один вызов LLM
+    # (правки сообщения лидера — внутри вызова, поэтому их ошибки гасятся в _isolate_partial)
+    on_partial = _isolate_partial(on_partial, h)
+    try:
+        return await _llm_flight.do(
+            h, lambda: _ask_llm_and_cache(session, h, text, norm_q, ctx_key, context_faqs, on_partial)
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"[LLM TIMEOUT] Нет ответа за {LLM_SINGLE_FLIGHT_TIMEOUT} с для qhash={h}")
+        error_message = LLMError.user_message
+    except LLMError as e:
+        logger.warning(f"[LLM ERROR] {type(e).__name__}: {e} (qhash={h})")
+        error_message = e.user_message
+    metrics.inc("llm.error")
+    # негативный кэш: повтор того же вопроса сразу получит ту же ошибку, не нагружая LLM
+    llm_error_cache.set(h, error_message)
+    return error_message
+
+
+@asynccontextmanager
+async def _llm_call() -> AsyncIterator[None]:
+    """
+    Слот диспетчера (лимит параллельности, circuit breaker) — только на сам вызов провайдера.
+    Любая ошибка провайдера (aiohttp, разбор JSON, ...) приводится к LLMError,
+    чтобы дойти до негативного кэша, а не вылететь из хендлера.
+    """
+    async with llm_dispatcher.slot():
+        try:
+            yield
+        except LLMError:
+            raise
+        except Exception as e:
+            raise LLMError(f"{type(e).__name__}: {e}") from e
+
+
+def _isolate_partial(
+    on_partial: Optional[Callable[[str], Awaitable[None]]], h: str
+) -> Optional[Callable[[str], Awaitable[None]]]:
+    """
+    Колбэк одного пользователя выполняется внутри single-flight, который ждут и другие.
+    Ошибка Telegram (бот заблокирован, flood-wait, сообщение удалено) не должна
+    доходить до них и обрывать уже оплаченный ответ: логируем, дальнейшие правки
+    пропускаем, поток дочитываем — ответ попадёт в кэш и вернётся всем.
+    """
+    if on_partial is None:
+        return None
+    failed = False
+
+    async def safe_partial(text: str) -> None:
+        nonlocal failed
+        if failed:
+            return
+        try:
+            await on_partial(text)
+        except Exception as e:
+            failed = True
+            metrics.inc("llm.partial_error")
+            logger.warning(f"[STREAM] Правка сообщения не удалась, дальше без правок: {type(e).__name__}: {e} (qhash={h})")
 
-    # 2. Формируем список контекстных блоков
-    context_chunks = []
+    return safe_partial
+
+
+async def _stream_answer(
+    provider,
+    text: str,
+    context_chunks: list[str],
+    on_partial: Callable[[str], Awaitable[None]],
+) -> str:
+    """
+    Поток ответа LLM. Чтение потока идёт в отдельной задаче внутри слота диспетчера,
+    on_partial (правки сообщения в Telegram) — снаружи: flood-wait Telegram не держит
+    слот и не считается ошибкой LLM. Пока идёт правка, куски копятся —
+    следующая правка получит весь накопленный текст.
+    """
+    parts: list[str] = []
+    changed = asyncio.Event()
+
+    async def read_stream() -> None:
+        async with _llm_call():
+            start = time.perf_counter()
+            async for chunk in provider.stream(text, context_chunks):
+                if not parts:
+                    # время до первого куска — то, что пользователь воспринимает как задержку
+                    metrics.observe("llm.first_chunk_ms", (time.perf_counter() - start) * 1000)
+                parts.append(chunk)
+                changed.set()
+
+    reader = asyncio.create_task(read_stream())
+    try:
+        while not reader.done():
+            waiter = asyncio.create_task(changed.wait())
+            await asyncio.wait({reader, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if changed.is_set() and not reader.done():
+                changed.clear()
+                await on_partial("".join(parts))
+        reader.result()  # ошибка провайдера (LLMError)
+    finally:
+        if not reader.done():
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+    return "".join(parts)
+
+
+async def _ask_llm_and_cache(
+    session: AsyncSession,
+    h: str,
+    text: str,
+    norm_q: str,
+    ctx_key: str,
+    context_faqs: Optional[list[FAQEntry]],
+    on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> str:
+    """
+    Промах кэша: запрос в LLM с FAQ-контекстом и сохранение ответа во все уровни кэша.
+    """
+    # Контекст в пределах бюджета токенов: лучшие FAQ первыми, длинные ответы обрезаны
+    context_chunks = build_context(context_faqs or [])
+    prompt_tokens = estimate_tokens(text) + sum(estimate_tokens(c) for c in context_chunks)
+    metrics.observe("llm.prompt_tokens", prompt_tokens)
     if context_faqs:
-        for faq in context_faqs:
-            context_chunks.append(f"Вопрос: {faq.question}\nОтвет: {faq.answer}")
+        full_tokens = sum(estimate_tokens(f"Вопрос: {f.question}\nОтвет: {f.answer}") for f in context_faqs)
+        logger.info(
+            f"[PROMPT] qhash={h} ~{prompt_tokens} токенов, контекст {len(context_chunks)}/{len(context_faqs)} FAQ "
+            f"~{prompt_tokens - estimate_tokens(text)} токенов (без обрезки ~{full_tokens})"
+        )
 
-    # 3. Вызов LLM-провайдера (YandexGPT)
+    # Вызов LLM-провайдера (LLM_PROVIDER) через диспетчер: лимит параллельности,
+    # очередь и circuit breaker; ошибка → LLMError, до кэша не доходит
     provider = get_llm_provider()
-    llm_answer = await provider.answer(text, context_chunks)
-    logger.info(f"[LLM REQUEST] Вызван YandexGPT для qhash={h}")
+    # ответ LLM ждём секунды — соединение из пула на это время не держим
+    # (только если апдейт ещё ничего не записал: иначе ждём с соединением, но без промежуточного коммита)
+    await release_connection(session)
+    if on_partial is None:
+        async with _llm_call():
+            llm_answer = await provider.answer(text, context_chunks)
+    else:
+        await on_partial("")
+        llm_answer = await _stream_answer(provider, text, context_chunks, on_partial)
+    logger.info(f"[LLM REQUEST] Вызван {provider.name} для qhash={h}")
 
-    # 4. Сохраняем в кэш
-    await cache_repo.upsert(session, h, llm_answer, fresh=True)
+    # Сохраняем в кэш
+    saved = await cache_repo.upsert(
+        session, h, llm_answer,
+        fresh=True,
+        question_norm=norm_q,
+        context_key=ctx_key,
+        faq_ids=[faq.id for faq in context_faqs or []],
+    )
+    answer_cache.set(h, llm_answer, cache_repo.as_utc(saved.created_at))
+    if semantic_cache.ready:
+        semantic_cache.add(h, norm_q, cache_repo.as_utc(saved.created_at), ctx_key)
     logger.info(f"[CACHE SAVE] Ответ сохранён в кэш для qhash={h}")
 
     return llm_answer
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from app.config import (
+    LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN_SECONDS,
+)
+from app.services.llm_provider import LLMError
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LLMOverloaded(LLMError):
+    """Очередь к LLM заполнена — отказываем сразу, а не держим пользователя."""
+    user_message = "⚠️ Сейчас очень много вопросов, попробуйте через минуту."
+
+
+class LLMUnavailable(LLMError):
+    """Circuit breaker открыт: LLM недавно подряд отвечала ошибками."""
+    user_message = "⚠️ Сервис ответов временно недоступен, попробуйте позже."
+
+
+class LLMDispatcher:
+    """
+    Ограничитель вызовов LLM:
+    - не больше max_concurrency запросов одновременно (семафор)
+    - не больше max_queue ожидающих; следующий сразу получает LLMOverloaded
+    - circuit breaker: после breaker_threshold ошибок подряд вызовы отклоняются
+      (LLMUnavailable) на cooldown секунд, затем пропускается один пробный запрос:
+      успех закрывает breaker, ошибка — снова открывает.
+
+    Использование:
+        async with llm_dispatcher.slot():
+            answer = await provider.answer(...)
+    Исключение внутри блока считается ошибкой LLM.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, breaker_threshold: int, cooldown: float):
+        self.max_queue = max_queue
+        self.breaker_threshold = breaker_threshold
+        self.cooldown = cooldown
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        trial = self._admit()
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self._release_trial(trial)
+            metrics.inc("llm.dispatcher.rejected_queue")
+            raise LLMOverloaded("очередь к LLM заполнена")
+
+        start = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self._release_trial(trial)
+            raise
+        finally:
+            self._waiting -= 1
+        metrics.observe("llm.dispatcher.queue_wait_ms", (time.perf_counter() - start) * 1000)
+
+        try:
+            yield
+        except asyncio.CancelledError:
+            self._release_trial(trial)
+            raise
+        except Exception:
+            self._on_failure(trial)
+            raise
+        else:
+            self._on_success()
+        finally:
+            self._semaphore.release()
+
+    def _admit(self) -> bool:
+        """Проверка breaker; True — это пробный запрос в half-open."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        metrics.inc("llm.dispatcher.rejected_open")
+        raise LLMUnavailable("circuit breaker открыт")
+
+    def _release_trial(self, trial: bool) -> None:
+        if trial:
+            self._trial_running = False
+
+    def _on_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("[LLM BREAKER] Пробный запрос успешен — breaker закрыт")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def _on_failure(self, trial: bool) -> None:
+        metrics.inc("llm.dispatcher.failure")
+        self._failures += 1
+        self._release_trial(trial)
+        if trial or self._failures >= self.breaker_threshold:
+            self._opened_at = time.monotonic()
+            metrics.inc("llm.dispatcher.breaker_opened")
+            logger.warning(
+                f"[LLM BREAKER] Открыт на {self.cooldown:.0f} с после {self._failures} ошибок подряд"
+            )
+
+
+# === Общий диспетчер процесса ===
+llm_dispatcher = LLMDispatcher(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_queue=LLM_MAX_QUEUE,
+    breaker_threshold=LLM_BREAKER_THRESHOLD,
+    cooldown=LLM_BREAKER_COOLDOWN_SECONDS,
+)
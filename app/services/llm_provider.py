@@ -1,28 +1,86 @@
-import requests
-from app.config import YANDEX_API_KEY, YANDEX_CATALOG_ID
-import os
+import asyncio
+import json
 import logging
+import os
+from typing import AsyncIterator, Optional
+
+import aiohttp
+
+from app.config import (
+    YANDEX_API_KEY, YANDEX_CATALOG_ID, OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL,
+    LLM_TIMEOUT_SECONDS, LLM_CONNECT_TIMEOUT_SECONDS,
+    LLM_POOL_LIMIT, LLM_POOL_LIMIT_PER_HOST, LLM_KEEPALIVE_SECONDS,
+)
 
 logger = logging.getLogger(__name__)
 
+YANDEX_GPT_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+SYSTEM_PROMPT = "Ты — помощник поддержки. Отвечай кратко и по делу."
+
+# === Общая HTTP-сессия процесса ===
+# одна сессия с пулом keep-alive соединений: TLS-рукопожатие не на каждый запрос
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую aiohttp-сессию (создаётся при первом вызове внутри event loop).
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=LLM_POOL_LIMIT,
+            limit_per_host=LLM_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=LLM_KEEPALIVE_SECONDS,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=LLM_TIMEOUT_SECONDS, sock_connect=LLM_CONNECT_TIMEOUT_SECONDS)
+        _http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _http_session
+
+
+async def close_http_session() -> None:
+    """Закрывает общую сессию (при остановке бота)."""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+class LLMError(Exception):
+    """
+    Ошибка LLM (HTTP-ошибка, таймаут, пустой ответ). Такие ответы не кэшируются,
+    пользователю показывается user_message.
+    """
+    user_message = "⚠️ Не удалось получить ответ, попробуйте чуть позже."
+
+
 class LLMProvider:
+    name = "llm"
+
     async def answer(self, question: str, context_chunks: list[str]) -> str:
         raise NotImplementedError
 
+    async def stream(self, question: str, context_chunks: list[str]) -> AsyncIterator[str]:
+        """
+        Ответ по частям (новые куски текста по мере генерации).
+        По умолчанию — весь ответ одним куском.
+        """
+        yield await self.answer(question, context_chunks)
+
 
 class YandexGPTProvider(LLMProvider):
-    def __init__(self):
+    name = "yandex"
+
+    def __init__(self, url: str = YANDEX_GPT_URL):
         self.api_key = YANDEX_API_KEY
         self.catalog_id = YANDEX_CATALOG_ID
         self.model = os.getenv("YANDEX_MODEL", "yandexgpt-lite")
-        self.url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-
-    async def answer(self, question: str, context_chunks: list[str]) -> str:
-        if not self.api_key or not self.catalog_id:
-            return "⚠️ Ошибка: не заданы ключ API или каталог Yandex."
+        self.url = url
 
+    def _payload(self, question: str, context_chunks: list[str], stream: bool) -> dict:
         messages = [
-            {"role": "system", "text": "Ты — помощник поддержки. Отвечай кратко и по делу."}
+            {"role": "system", "text": SYSTEM_PROMPT}
         ]
 
         if context_chunks:
@@ -30,40 +88,180 @@ class YandexGPTProvider(LLMProvider):
 
         messages.append({"role": "user", "text": question})
 
-        payload = {
+        return {
             "modelUri": f"gpt://{self.catalog_id}/{self.model}",
             "completionOptions": {
-                "stream": False,
+                "stream": stream,
                 "temperature": 0.6,
                 "maxTokens": "500"
             },
             "messages": messages
         }
 
-        headers = {
+    def _headers(self) -> dict:
+        return {
             "Content-Type": "application/json",
             "Authorization": f"Api-Key {self.api_key}"
         }
 
+    def _check_config(self) -> None:
+        if not self.api_key or not self.catalog_id:
+            raise LLMError("не заданы ключ API или каталог Yandex")
+
+    async def answer(self, question: str, context_chunks: list[str]) -> str:
+        self._check_config()
+        payload = self._payload(question, context_chunks, stream=False)
+        headers = self._headers()
+
         try:
             logger.debug(f"[YANDEX REQUEST] {payload}")
-            response = requests.post(self.url, headers=headers, json=payload, timeout=30)
+            async with get_http_session().post(self.url, headers=headers, json=payload) as response:
+                if response.status != 200:
+                    body = await response.text()
+                    logger.error(f"[YANDEX ERROR RESPONSE] {body}")  # <-- теперь видим тело ошибки
+                    raise LLMError(f"YandexGPT вернул {response.status}")
 
-            if response.status_code != 200:
-                logger.error(f"[YANDEX ERROR RESPONSE] {response.text}")  # <-- теперь видим тело ошибки
-                return f"⚠️ Ошибка при обращении к YandexGPT: {response.text}"
-
-            data = response.json()
-            return data.get("result", {}).get("alternatives", [{}])[0].get("message", {}).get("text", "⚠️ Нет текста в ответе")
-        except Exception as e:
+                data = await response.json()
+        except asyncio.TimeoutError as e:
+            logger.error(f"[YANDEX TIMEOUT] Нет ответа за {LLM_TIMEOUT_SECONDS} с")
+            raise LLMError("превышено время ожидания YandexGPT") from e
+        except (aiohttp.ClientError, ValueError) as e:
             logger.exception("Ошибка при запросе к YandexGPT")
-            return f"⚠️ Ошибка при обращении к YandexGPT: {e}"
+            raise LLMError(f"ошибка соединения с YandexGPT: {e}") from e
+
+        text = data.get("result", {}).get("alternatives", [{}])[0].get("message", {}).get("text")
+        if not text:
+            raise LLMError("нет текста в ответе YandexGPT")
+        return text
+
+    async def stream(self, question: str, context_chunks: list[str]) -> AsyncIterator[str]:
+        """
+        stream=True: YandexGPT присылает JSON-строки, в каждой — весь текст на данный момент;
+        наружу отдаём только прирост.
+        """
+        self._check_config()
+        payload = self._payload(question, context_chunks, stream=True)
+        text = ""
+        try:
+            logger.debug(f"[YANDEX STREAM REQUEST] {payload}")
+            async with get_http_session().post(self.url, headers=self._headers(), json=payload) as response:
+                if response.status != 200:
+                    body = await response.text()
+                    logger.error(f"[YANDEX ERROR RESPONSE] {body}")
+                    raise LLMError(f"YandexGPT вернул {response.status}")
+
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    current = data.get("result", {}).get("alternatives", [{}])[0].get("message", {}).get("text", "")
+                    if len(current) > len(text):
+                        yield current[len(text):]
+                        text = current
+        except asyncio.TimeoutError as e:
+            logger.error(f"[YANDEX TIMEOUT] Нет ответа за {LLM_TIMEOUT_SECONDS} с")
+            raise LLMError("превышено время ожидания YandexGPT") from e
+        except (aiohttp.ClientError, ValueError) as e:
+            logger.exception("Ошибка при потоковом запросе к YandexGPT")
+            raise LLMError(f"ошибка потока YandexGPT: {e}") from e
+        if not text:
+            raise LLMError("нет текста в ответе YandexGPT")
 
 
-# === Фабрика для получения провайдера ===
-def get_llm_provider() -> LLMProvider:
+class OpenAICompatibleProvider(LLMProvider):
     """
-    Возвращает активный LLM-провайдер.
-    Сейчас доступен только YandexGPT.
+    Любой сервис с OpenAI Chat Completions API (OpenAI, vLLM, LM Studio, прокси):
+    POST {base_url}/chat/completions, потоковый режим — Server-Sent Events.
     """
-    return YandexGPTProvider()
+    name = "openai"
+
+    def __init__(self, base_url: str = OPENAI_BASE_URL, api_key: Optional[str] = OPENAI_API_KEY, model: str = OPENAI_MODEL):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model = model
+
+    def _payload(self, question: str, context_chunks: list[str], stream: bool) -> dict:
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if context_chunks:
+            messages.append({"role": "user", "content": "Контекст:\n" + "\n".join(context_chunks)})
+        messages.append({"role": "user", "content": question})
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.6,
+            "max_tokens": 500,
+            "stream": stream,
+        }
+
+    def _headers(self) -> dict:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+    async def answer(self, question: str, context_chunks: list[str]) -> str:
+        if not self.api_key:
+            raise LLMError("не задан OPENAI_API_KEY")
+        payload = self._payload(question, context_chunks, stream=False)
+        try:
+            async with get_http_session().post(self.url, headers=self._headers(), json=payload) as response:
+                if response.status != 200:
+                    logger.error(f"[OPENAI ERROR RESPONSE] {await response.text()}")
+                    raise LLMError(f"OpenAI API вернул {response.status}")
+                data = await response.json()
+        except asyncio.TimeoutError as e:
+            logger.error(f"[OPENAI TIMEOUT] Нет ответа за {LLM_TIMEOUT_SECONDS} с")
+            raise LLMError("превышено время ожидания OpenAI API") from e
+        except (aiohttp.ClientError, ValueError) as e:
+            logger.exception("Ошибка при запросе к OpenAI API")
+            raise LLMError(f"ошибка соединения с OpenAI API: {e}") from e
+
+        text = (data.get("choices") or [{}])[0].get("message", {}).get("content")
+        if not text:
+            raise LLMError("нет текста в ответе OpenAI API")
+        return text
+
+    async def stream(self, question: str, context_chunks: list[str]) -> AsyncIterator[str]:
+        if not self.api_key:
+            raise LLMError("не задан OPENAI_API_KEY")
+        payload = self._payload(question, context_chunks, stream=True)
+        got_text = False
+        try:
+            async with get_http_session().post(self.url, headers=self._headers(), json=payload) as response:
+                if response.status != 200:
+                    logger.error(f"[OPENAI ERROR RESPONSE] {await response.text()}")
+                    raise LLMError(f"OpenAI API вернул {response.status}")
+
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    delta = (json.loads(data).get("choices") or [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        got_text = True
+                        yield delta
+        except asyncio.TimeoutError as e:
+            logger.error(f"[OPENAI TIMEOUT] Нет ответа за {LLM_TIMEOUT_SECONDS} с")
+            raise LLMError("превышено время ожидания OpenAI API") from e
+        except (aiohttp.ClientError, ValueError) as e:
+            logger.exception("Ошибка при потоковом запросе к OpenAI API")
+            raise LLMError(f"ошибка потока OpenAI API: {e}") from e
+        if not got_text:
+            raise LLMError("нет текста в ответе OpenAI API")
+
+
+# === Реестр провайдеров (LLM_PROVIDER / LLM_HEDGE_PROVIDER) ===
+PROVIDERS: dict[str, type[LLMProvider]] = {
+    "yandex": YandexGPTProvider,
+    "openai": OpenAICompatibleProvider,
+}
+
+
+def create_provider(name: str) -> LLMProvider:
+    try:
+        return PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(f"❌ Неизвестный LLM-провайдер {name!r}, доступны: {', '.join(PROVIDERS)}") from None
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+from app.config import (
+    LLM_PROVIDER, LLM_HEDGE_PROVIDER, LLM_HEDGE_QUANTILE, LLM_HEDGE_DELAY_MS, LLM_HEDGE_MIN_DELAY_MS,
+    LLM_HEDGE_MIN_SAMPLES,
+)
+from app.services.llm_provider import LLMError, LLMProvider, create_provider
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TimedProvider(LLMProvider):
+    """
+    Обёртка, пишущая задержки провайдера в метрики:
+      llm.latency_ms.<name>      — полный ответ (answer)
+      llm.first_chunk_ms.<name>  — первый кусок потока (stream)
+    Время пишется и для ошибок, и для отменённых вызовов (проигравший hedge):
+    иначе медленный хвост выпадает из выборки, p95 занижается и хеджей становится всё больше.
+    """
+
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.name = provider.name
+
+    async def answer(self, question: str, context_chunks: list[str]) -> str:
+        start = time.perf_counter()
+        try:
+            return await self.provider.answer(question, context_chunks)
+        finally:
+            metrics.observe(f"llm.latency_ms.{self.name}", (time.perf_counter() - start) * 1000)
+
+    async def stream(self, question: str, context_chunks: list[str]) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        first = True
+        try:
+            async for chunk in self.provider.stream(question, context_chunks):
+                if first:
+                    metrics.observe(f"llm.first_chunk_ms.{self.name}", (time.perf_counter() - start) * 1000)
+                    first = False
+                yield chunk
+        finally:
+            if first:  # ошибка, отмена или закрытие до первого куска
+                metrics.observe(f"llm.first_chunk_ms.{self.name}", (time.perf_counter() - start) * 1000)
+
+
+class HedgedProvider(LLMProvider):
+    """
+    Hedged-запросы: если основной провайдер не ответил за задержку хеджирования
+    (LLM_HEDGE_QUANTILE его задержек, по умолчанию p95), тот же запрос уходит
+    запасному; берётся первый успешный ответ, второй запрос отменяется.
+    Ошибка основного до истечения задержки → запасной запускается сразу.
+
+    Пока истории меньше LLM_HEDGE_MIN_SAMPLES, задержка — LLM_HEDGE_DELAY_MS;
+    в любом случае не меньше LLM_HEDGE_MIN_DELAY_MS.
+    Для stream «ответом» считается первый кусок текста.
+    """
+
+    def __init__(self, primary: LLMProvider, secondary: LLMProvider):
+        self.primary = primary
+        self.secondary = secondary
+        self.name = f"{primary.name}+{secondary.name}"
+
+    def hedge_delay(self, metric: str) -> float:
+        """Задержка перед запасным запросом, сек."""
+        hist = metrics.histogram(f"{metric}.{self.primary.name}")
+        delay_ms = hist.quantile(LLM_HEDGE_QUANTILE) if hist.count >= LLM_HEDGE_MIN_SAMPLES else None
+        delay_ms = delay_ms if delay_ms is not None else LLM_HEDGE_DELAY_MS
+        return max(delay_ms, LLM_HEDGE_MIN_DELAY_MS) / 1000
+
+    async def answer(self, question: str, context_chunks: list[str]) -> str:
+        return await self._race(
+            lambda provider: provider.answer(question, context_chunks),
+            self.hedge_delay("llm.latency_ms"),
+        )
+
+    async def stream(self, question: str, context_chunks: list[str]) -> AsyncIterator[str]:
+        streams = {}
+
+        async def first_chunk(provider: LLMProvider):
+            agen = streams[provider] = provider.stream(question, context_chunks)
+            return provider, await agen.__anext__()
+
+        winner, first = await self._race(first_chunk, self.hedge_delay("llm.first_chunk_ms"))
+        for provider, agen in streams.items():
+            if provider is not winner:
+                await agen.aclose()
+        yield first
+        async for chunk in streams[winner]:
+            yield chunk
+
+    async def _race(self, call, delay: float):
+        """
+        Запускает call(primary), через delay (или сразу после его ошибки) — call(secondary).
+        Возвращает первый успешный результат, остальные задачи отменяет.
+        """
+        tasks = {asyncio.create_task(call(self.primary)): self.primary}
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                timeout = None if hedged else delay
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = tasks.pop(task)
+                    if task.exception() is None:
+                        if provider is self.secondary:
+                            metrics.inc("llm.hedge.won_secondary")
+                        return task.result()
+                    error = task.exception()
+                    logger.warning(f"[LLM HEDGE] {provider.name} ответил ошибкой: {error}")
+                if not hedged:
+                    # основной не успел за delay или упал — запрос запасному
+                    hedged = True
+                    metrics.inc("llm.hedge.fired")
+                    logger.info(f"[LLM HEDGE] Запрос продублирован в {self.secondary.name} (delay={delay:.2f} с)")
+                    tasks[asyncio.create_task(call(self.secondary))] = self.secondary
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        if isinstance(error, StopAsyncIteration):
+            raise LLMError("пустой поток ответа")
+        raise error
+
+
+# === Провайдер процесса ===
+_provider: Optional[LLMProvider] = None
+
+
+def build_provider(name: str = LLM_PROVIDER, hedge_name: str = LLM_HEDGE_PROVIDER) -> LLMProvider:
+    primary = TimedProvider(create_provider(name))
+    if not hedge_name or hedge_name == name:
+        return primary
+    return HedgedProvider(primary, TimedProvider(create_provider(hedge_name)))
+
+
+def get_llm_provider() -> LLMProvider:
+    """
+    Возвращает активный LLM-провайдер (один на процесс): LLM_PROVIDER,
+    с хеджированием в LLM_HEDGE_PROVIDER, если он задан.
+    """
+    global _provider
+    if _provider is None:
+        _provider = build_provider()
+        logger.info(f"[LLM] Провайдер: {_provider.name}")
+    return _provider
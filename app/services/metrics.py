@@ -0,0 +1,78 @@
+import threading
+from collections import defaultdict, deque
+
+
+class Histogram:
+    """
+    Скользящее окно последних значений + общие count / sum.
+    Квантили считаются по окну, поэтому отражают текущую нагрузку.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self._values: deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self._values.append(value)
+
+    def quantile(self, q: float) -> float | None:
+        if not self._values:
+            return None
+        values = sorted(self._values)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """
+    Простые процессные метрики: счётчики и гистограммы по имени.
+    Снимок периодически пишется в лог шедулером.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = defaultdict(int)
+        self._histograms: dict[str, Histogram] = {}
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self.histogram(name).observe(value)
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self._histograms.get(name)
+        if hist is None:
+            hist = self._histograms[name] = Histogram()
+        return hist
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {name: h.summary() for name, h in self._histograms.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,95 @@
+import math
+import re
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable
+
+from app.config import LLM_CONTEXT_TOKENS, LLM_CHUNK_MAX_TOKENS
+from app.models import FAQEntry
+
+# грубая оценка для русского текста: ~3 символа на токен (с запасом, чтобы не превысить бюджет)
+CHARS_PER_TOKEN = 3
+# кусок контекста меньше этого уже не помогает модели — не добавляем
+MIN_CHUNK_TOKENS = 30
+CHUNK_CACHE_SIZE = 2048
+
+SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_sentences(text: str, max_tokens: int) -> str:
+    """
+    Обрезает текст до max_tokens по границе предложения.
+    Если не влезает даже первое предложение — режет по слову и ставит «…».
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    result = ""
+    for sentence in SENTENCE_RE.split(text.strip()):
+        candidate = f"{result} {sentence}" if result else sentence
+        if len(candidate) > max_chars:
+            break
+        result = candidate
+    if result:
+        return result
+    return text[:max_chars - 1].rsplit(" ", 1)[0].rstrip(",;:—- ") + "…"
+
+
+# === Кэш отрисованных кусков: (faq_id, updated_at, лимит) → текст ===
+_chunk_cache: OrderedDict[tuple[int, datetime, int], str] = OrderedDict()
+
+
+def render_chunk(faq: FAQEntry, max_tokens: int) -> str:
+    """
+    Блок контекста «Вопрос / Ответ» для одного FAQ не длиннее max_tokens.
+    Правка FAQ меняет updated_at, поэтому устаревший текст из кэша не берётся.
+    """
+    key = (faq.id, faq.updated_at, max_tokens)
+    chunk = _chunk_cache.get(key)
+    if chunk is not None:
+        _chunk_cache.move_to_end(key)
+        return chunk
+
+    # вопрос тоже входит в бюджет: длинный вопрос режется, ответу остаётся не меньше половины
+    question = truncate_sentences(faq.question, max(1, max_tokens // 2))
+    header = f"Вопрос: {question}\nОтвет: "
+    answer_budget = max(1, max_tokens - estimate_tokens(header))
+    chunk = header + truncate_sentences(faq.answer, answer_budget)
+
+    _chunk_cache[key] = chunk
+    while len(_chunk_cache) > CHUNK_CACHE_SIZE:
+        _chunk_cache.popitem(last=False)
+    return chunk
+
+
+def build_context(
+    context_faqs: Iterable[FAQEntry],
+    budget: int = LLM_CONTEXT_TOKENS,
+    chunk_max_tokens: int = LLM_CHUNK_MAX_TOKENS,
+) -> list[str]:
+    """
+    Собирает контекст для LLM в пределах budget токенов.
+    context_faqs — по убыванию скора (как их возвращает поиск по FAQ):
+    лучшие кандидаты берутся первыми, длинные ответы обрезаются по предложениям,
+    остальные отбрасываются, когда бюджет кончился.
+    """
+    chunks = []
+    seen = set()
+    remaining = budget
+    for faq in context_faqs:
+        if faq.id in seen:
+            continue
+        seen.add(faq.id)
+        limit = min(chunk_max_tokens, remaining)
+        if limit < MIN_CHUNK_TOKENS:
+            break
+        chunk = render_chunk(faq, limit)
+        if estimate_tokens(chunk) > remaining:
+            continue  # не уложился даже обрезанным — бюджет не превышаем
+        chunks.append(chunk)
+        remaining -= estimate_tokens(chunk)
+    return chunks
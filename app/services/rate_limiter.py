@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from app.config import MAX_MSG_PER_MIN, MAX_LLM_PER_MIN, RATE_LIMIT_MAX_KEYS
+
+
+class SlidingWindowLimiter:
+    """
+    Ограничение «не больше limit событий за window секунд» на ключ (tg id).
+
+    Скользящее окно приближается двумя фиксированными: текущим и предыдущим,
+    вклад предыдущего убывает линейно. На ключ — три числа, проверка O(1).
+
+    Ключи хранятся в порядке последнего обращения: ключи, молчавшие дольше
+    двух окон (их счётчики уже ни на что не влияют), и всё сверх max_keys
+    вытесняются с начала очереди.
+    """
+
+    def __init__(self, limit: int, window: float = 60.0, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        # key → [номер окна, событий в текущем окне, в предыдущем, предупреждён ли в этом окне]
+        self._state: OrderedDict[Hashable, list] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def hit(self, key: Hashable, now: float | None = None) -> bool:
+        """Регистрирует событие; False — лимит исчерпан (событие не засчитывается)."""
+        now = time.monotonic() if now is None else now
+        window_no, elapsed = divmod(now, self.window)
+        state = self._roll(key, int(window_no))
+
+        weighted = state[2] * (1 - elapsed / self.window) + state[1]
+        if weighted >= self.limit:
+            return False
+        state[1] += 1
+        return True
+
+    def clear(self) -> None:
+        self._state.clear()
+
+    def should_warn(self, key: Hashable) -> bool:
+        """True один раз за окно — чтобы не отвечать на каждое отклонённое сообщение."""
+        state = self._state.get(key)
+        if state is None or state[3]:
+            return False
+        state[3] = True
+        return True
+
+    def _roll(self, key: Hashable, window_no: int) -> list:
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [window_no, 0, 0, False]
+        elif state[0] != window_no:
+            # сдвиг окна: текущее становится предыдущим (если оно было соседним)
+            state[2] = state[1] if state[0] == window_no - 1 else 0
+            state[0], state[1], state[3] = window_no, 0, False
+        self._state.move_to_end(key)
+        self._evict(window_no)
+        return state
+
+    def _evict(self, window_no: int) -> None:
+        while self._state:
+            oldest_key, oldest = next(iter(self._state.items()))
+            if len(self._state) > self.max_keys or oldest[0] < window_no - 1:
+                del self._state[oldest_key]
+            else:
+                break
+
+
+# === Лимиты процесса ===
+message_limiter = SlidingWindowLimiter(MAX_MSG_PER_MIN)  # любые сообщения / нажатия
+llm_limiter = SlidingWindowLimiter(MAX_LLM_PER_MIN)      # вопросы, дошедшие до LLM
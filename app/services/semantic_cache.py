@@ -0,0 +1,124 @@
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Levenshtein
+
+from app.services.text_norm import TOKEN_RE
+
+logger = logging.getLogger(__name__)
+
+# служебные слова: их замена или пропуск смысл вопроса не меняет
+STOP_WORDS = frozenset(
+    "а и или но да же ли бы не ни в во на с со к ко по о об обо от до из у за для при про под над без через "
+    "как какой какая какое какие сколько где куда откуда когда почему зачем что чем кто можно ли "
+    "я мне меня мы нам нас вы вам вас ты тебе мой наш ваш это этот эта эти тот там тут уже еще ещё".split()
+)
+# опечатка внутри слова: одна правка и только в длинных словах («казань» / «рязань» — разные города)
+TYPO_MIN_LEN = 7
+TYPO_MAX_EDITS = 1
+# сколько лучших по ratio кандидатов проверять по словам
+LOOKUP_CANDIDATES = 5
+
+
+def _content_tokens(norm: str) -> frozenset[str]:
+    return frozenset(t for t in TOKEN_RE.findall(norm) if t not in STOP_WORDS)
+
+
+def _is_typo(a: str, b: str) -> bool:
+    return min(len(a), len(b)) >= TYPO_MIN_LEN and Levenshtein.distance(a, b) <= TYPO_MAX_EDITS
+
+
+def same_content(a: str, b: str) -> bool:
+    """
+    Те же значимые слова в обоих вопросах; отличие допускается только в служебных словах
+    и в опечатках внутри длинных слов. ratio по всей строке этого не различает:
+    «доставка в казань» / «доставка в рязань», «бесплатная доставка» / «платная доставка»,
+    «статус заказа» / «статус заказов» дают 90+.
+    """
+    ta, tb = _content_tokens(a), _content_tokens(b)
+    only_a, only_b = ta - tb, tb - ta
+    if len(only_a) != len(only_b):
+        return False
+    return all(any(_is_typo(x, y) for y in only_b) for x in only_a) and all(
+        any(_is_typo(y, x) for x in only_a) for y in only_b
+    )
+
+
+class SemanticCacheIndex:
+    """
+    Индекс нормализованных вопросов, на которые в gpt_cache уже есть ответ.
+    Позволяет отдать кэшированный ответ на тот же вопрос в другой формулировке
+    («сколько стоит доставка» / «а сколько стоит доставка?», опечатки), а не платить за новый вызов LLM.
+
+    Скорер — fuzz.ratio, а не WRatio: частичное совпадение («доставка в казань»
+    внутри длинного вопроса) здесь как раз опасно. Лучшие по ratio кандидаты
+    дополнительно проверяются по словам (same_content): близкие по буквам строки
+    с другим городом или отрицанием — другой вопрос.
+
+    Похожие вопросы ищутся только среди ответов с тем же FAQ-контекстом
+    (context_key): ответ, сгенерированный по другой версии FAQ, не переиспользуется.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[str, str, datetime]] = {}  # qhash → (norm, context_key, created_at)
+        self._groups: dict[str, dict[str, str]] = {}  # context_key → {qhash: norm}, меняется по месту
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def build(self, rows: Iterable[tuple[str, str, str, datetime]]) -> None:
+        """Строит индекс по строкам (qhash, question_norm, context_key, created_at)."""
+        self._entries = {}
+        self._groups = {}
+        for qhash, norm, context_key, created_at in rows:
+            self.add(qhash, norm, created_at, context_key)
+        self.ready = True
+        logger.info(f"[SEMANTIC CACHE] Загружено {len(self._entries)} вопросов из gpt_cache")
+
+    def reset(self) -> None:
+        self._entries = {}
+        self._groups = {}
+        self.ready = False
+
+    def add(self, qhash: str, norm: str, created_at: datetime, context_key: str = "") -> None:
+        """Добавляет вопрос; меняется только группа его context_key."""
+        self.remove(qhash)  # перезапись могла сменить группу
+        self._entries[qhash] = (norm, context_key, created_at)
+        self._groups.setdefault(context_key, {})[qhash] = norm
+
+    def remove(self, qhash: str) -> None:
+        entry = self._entries.pop(qhash, None)
+        if entry is None:
+            return
+        group = self._groups.get(entry[1])
+        if group is not None:
+            group.pop(qhash, None)
+            if not group:
+                del self._groups[entry[1]]
+
+    def prune(self, cutoff: datetime) -> int:
+        """Удаляет вопросы, ответы на которые старше cutoff (вслед за чисткой gpt_cache)."""
+        expired = [h for h, (_, _, created_at) in self._entries.items() if created_at < cutoff]
+        for h in expired:
+            self.remove(h)
+        return len(expired)
+
+    def lookup(self, norm_q: str, score_cutoff: float, context_key: str = "") -> Optional[tuple[str, float]]:
+        """Самый похожий закэшированный вопрос с тем же контекстом: (qhash, score) или None."""
+        group = self._groups.get(context_key)
+        if not group:
+            return None
+        # кандидаты по убыванию ratio; первый с теми же значимыми словами
+        for norm, score, h in process.extract(
+            norm_q, group, scorer=fuzz.ratio, score_cutoff=score_cutoff, limit=LOOKUP_CANDIDATES
+        ):
+            if same_content(norm_q, norm):
+                return h, score
+        return None
+
+
+# === Общий индекс процесса ===
+semantic_cache = SemanticCacheIndex()
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LeaderCancelled(Exception):
+    """Лидера отменили (пользователь ушёл, таймаут хендлера) — ожидающие повторяют вызов сами."""
+
+
+class SingleFlight:
+    """
+    Склеивает одновременные вызовы с одинаковым ключом:
+    первый вызов (лидер) выполняет fn, остальные ждут тот же future
+    и получают тот же результат (или то же исключение).
+
+    Время одного «полёта» ограничено timeout: по его истечении
+    все ожидающие получают asyncio.TimeoutError, ключ освобождается.
+
+    Отмена лидера не передаётся ожидающим: один из них становится
+    новым лидером и выполняет свой fn, остальные ждут уже его.
+    """
+
+    def __init__(self, name: str, timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self._flights: dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        while (fut := self._flights.get(key)) is not None:
+            metrics.inc(f"{self.name}.coalesced")
+            logger.info(f"[SINGLE FLIGHT] {self.name}: ждём уже идущий вызов key={key}")
+            try:
+                # shield: отмена одного ожидающего не должна отменять общий future
+                return await asyncio.shield(fut)
+            except LeaderCancelled:
+                metrics.inc(f"{self.name}.takeover")
+                logger.info(f"[SINGLE FLIGHT] {self.name}: лидер отменён, повторяем вызов key={key}")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._flights[key] = fut
+        metrics.inc(f"{self.name}.leader")
+        try:
+            result = await asyncio.wait_for(fn(), timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError as e:
+            metrics.inc(f"{self.name}.timeout")
+            fut.set_exception(e)
+            raise
+        except asyncio.CancelledError:
+            fut.set_exception(LeaderCancelled(key))
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+            if fut.done():
+                fut.exception()  # помечаем исключение полученным, если ожидающих не было
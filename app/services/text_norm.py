@@ -1,11 +1,129 @@
 import re
 import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable
 
-try:
-    import pymorphy2
-    morph = pymorphy2.MorphAnalyzer()
-except ImportError:
-    morph = None  # fallback, если pymorphy2 не установлен
+from app.config import LEMMA_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# MorphAnalyzer грузится лениво: словари занимают память и время,
+# а скриптам вроде init_db / clear_cache_all они не нужны вовсе
+_morph = None
+_morph_loaded = False
+_morph_lock = threading.Lock()
+
+TOKEN_RE = re.compile(r"[а-яёa-z0-9]+")
+
+
+def get_morph():
+    """
+    Возвращает общий MorphAnalyzer, создавая его при первом вызове.
+    None — если pymorphy2 не установлен (нормализация без лемматизации).
+    """
+    global _morph, _morph_loaded
+    if _morph_loaded:
+        return _morph
+    with _morph_lock:
+        if not _morph_loaded:
+            start = time.perf_counter()
+            try:
+                import pymorphy2
+                _morph = pymorphy2.MorphAnalyzer()
+                logger.info(f"[MORPH] Словари pymorphy2 загружены за {time.perf_counter() - start:.2f} с")
+            except ImportError:
+                _morph = None  # fallback, если pymorphy2 не установлен
+            _morph_loaded = True
+    return _morph
+
+
+def warm_up() -> None:
+    """
+    Заранее загружает словари pymorphy2.
+    Вызывается в фоне из bot.main, чтобы первый вопрос не ждал загрузки.
+    В многопроцессном запуске достаточно вызвать до fork —
+    дочерние процессы разделят страницы словарей copy-on-write.
+    """
+    get_morph()
+
+
+class LemmaCache:
+    """
+    Ограниченный LRU-кэш токен → лемма со счётчиками попаданий.
+    morph.parse — самый дорогой вызов в обработке вопроса, а словарь
+    живых вопросов — несколько тысяч слов, так что hit rate близок к 100%.
+
+    Потокобезопасен: сборка индекса FAQ лемматизирует в asyncio.to_thread,
+    пока хендлеры нормализуют вопросы в event loop.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> str | None:
+        with self._lock:
+            lemma = self._data.get(token)
+            if lemma is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(token)
+            self.hits += 1
+            return lemma
+
+    def put(self, token: str, lemma: str) -> None:
+        with self._lock:
+            self._data[token] = lemma
+            self._data.move_to_end(token)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+lemma_cache = LemmaCache(LEMMA_CACHE_SIZE)
+
+
+def lemmatize(token: str) -> str:
+    """
+    Лемма токена через кэш. Кэшируется только token → лемма: normal_form
+    pymorphy2 не всегда идемпотентна, и запись «лемма → лемма» сделала бы
+    результат normalize зависимым от того, какие слова встречались раньше.
+    """
+    lemma = lemma_cache.get(token)
+    if lemma is not None:
+        return lemma
+    try:
+        lemma = get_morph().parse(token)[0].normal_form
+    except Exception:
+        lemma = token
+    lemma_cache.put(token, lemma)
+    return lemma
+
+
+def _prepare(text: str) -> str:
+    text = text.lower().strip()
+    return re.sub(r"\s+", " ", text)
 
 
 def normalize(text: str) -> str:
@@ -14,29 +132,41 @@ def normalize(text: str) -> str:
     - приведение к нижнему регистру
     - удаление лишних пробелов
     - опциональная лемматизация (через pymorphy2, если доступна)
+    Результат не зависит от содержимого кэша лемм (он хранится в БД как question_norm / question_hash).
     """
-    text = text.lower().strip()
-    text = re.sub(r"\s+", " ", text)
+    text = _prepare(text)
 
-    if morph:
-        tokens = re.findall(r"[а-яёa-z0-9]+", text)
-        lemmas = []
-        for t in tokens:
-            try:
-                lemma = morph.parse(t)[0].normal_form
-                lemmas.append(lemma)
-            except Exception:
-                lemmas.append(t)
-        return " ".join(lemmas)
+    if get_morph():
+        return " ".join(lemmatize(t) for t in TOKEN_RE.findall(text))
 
     return text
 
 
+def normalize_many(texts: Iterable[str]) -> list[str]:
+    """
+    Пакетная нормализация: каждый уникальный токен пакета лемматизируется один раз.
+    """
+    prepared = [_prepare(t) for t in texts]
+    if not get_morph():
+        return prepared
+
+    tokenized = [TOKEN_RE.findall(t) for t in prepared]
+    lemmas = {token: lemmatize(token) for token in {t for tokens in tokenized for t in tokens}}
+    return [" ".join(lemmas[t] for t in tokens) for tokens in tokenized]
+
+
+def hash_norm(norm: str) -> str:
+    """
+    SHA-256 хэш уже нормализованной строки — без повторной лемматизации.
+    """
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()
+
+
 def qhash(text: str) -> str:
     """
-    SHA-256 хэш нормализованного текста
+    SHA-256 хэш нормализованного текста (для сырого текста; готовый norm — hash_norm)
     """
-    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+    return hash_norm(normalize(text))
 
 
 def shorten(text: str, limit: int = 100) -> str:
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import zlib
+from collections import Counter
+from typing import Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # fallback, если numpy не установлен — остаётся fuzzy-поиск
+
+logger = logging.getLogger(__name__)
+
+NGRAM = 3
+STEM_LEN = 6  # n-граммы берутся только из начала слова — окончания слишком общие
+
+
+def features(norm: str) -> Counter:
+    """
+    Признаки текста: леммы целиком + символьные 3-граммы начала каждой леммы.
+    3-граммы основы ловят однокоренные слова («оплатить» / «оплата»),
+    которые не совпадают ни по лемме, ни по WRatio.
+    """
+    feats = Counter()
+    for token in norm.split():
+        feats[f"w:{token}"] += 1
+        padded = f" {token[:STEM_LEN]}"
+        for i in range(len(padded) - NGRAM + 1):
+            feats[padded[i:i + NGRAM]] += 1
+    return feats
+
+
+class TfidfVectorIndex:
+    """
+    Векторный индекс FAQ: TF-IDF по хэшированным признакам (леммы + 3-граммы),
+    строки — L2-нормированные float32 в memory-mapped файле.
+
+    Файлы на диске неизменяемы: полный build пишет матрицу и DF под именем
+    поколения ({path}.{fingerprint}) через временный файл (mkstemp + os.replace),
+    последним — meta.json со ссылкой на поколение. Несколько воркеров, открывших
+    одно поколение, делят страницы через page cache ОС, а не копируют матрицу.
+    Если файл уже построен по тому же набору вопросов (совпадает fingerprint),
+    build его просто открывает без пересчёта.
+
+    Файл открывается copy-on-write: точечные изменения (upsert / remove) остаются
+    в памяти своего процесса и на диск не пишутся. Когда другой воркер публикует
+    новое поколение (меняется meta), индекс переоткрывает его и повторяет поверх
+    свои локальные изменения.
+
+    Top-k считается одним произведением матрицы на вектор запроса.
+    При точечных изменениях строка пишется с текущими IDF; старые строки
+    не пересчитываются до следующего полного build.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._matrix = None  # np.memmap mode="c" (capacity × dim); после роста — np.ndarray
+        self._slots: list[Optional[int]] = []  # слот → faq_id
+        self._slot_by_id: dict[int, int] = {}
+        self._norms: dict[int, str] = {}
+        self._df = np.zeros(dim, dtype=np.int64)
+        self._generation: Optional[str] = None  # fingerprint открытого поколения
+        self._meta_stamp: Optional[tuple[int, int]] = None
+        # изменения после build: faq_id → norm (None — удалён); повторяются после переоткрытия
+        self._local: dict[int, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot_by_id)
+
+    # === Построение ===
+    def build(self, items: Iterable[tuple[int, str]]) -> None:
+        """Строит индекс по парам (faq_id, нормализованный вопрос)."""
+        self._norms = dict(items)
+        self._local = {}
+        fingerprint = self._fingerprint()
+
+        meta = self._read_meta()
+        if meta and meta["dim"] == self.dim and meta["fingerprint"] == fingerprint and self._load(meta):
+            logger.info(f"[VECTOR INDEX] Открыт готовый файл {self._matrix_path(fingerprint)}: {len(self)} векторов")
+            return
+
+        ids = list(self._norms)
+        capacity = max(16, math.ceil(len(ids) * 1.25))
+        slots = ids + [None] * (capacity - len(ids))
+
+        vectors = [self._hashed(features(self._norms[faq_id])) for faq_id in ids]
+        df = np.zeros(self.dim, dtype=np.int64)
+        for vec in vectors:
+            df[vec.nonzero()] += 1
+
+        idf = self._idf(df, len(ids))
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        for slot, vec in enumerate(vectors):
+            matrix[slot] = self._weigh(vec, idf)
+
+        new_meta = {"dim": self.dim, "fingerprint": fingerprint, "slots": slots}
+        self._publish(new_meta, matrix, df, previous=meta)
+        if not self._load(new_meta):
+            raise RuntimeError(f"не удалось открыть только что построенный {self._matrix_path(fingerprint)}")
+        logger.info(f"[VECTOR INDEX] Построен файл {self._matrix_path(fingerprint)}: {len(self)} векторов, dim={self.dim}")
+
+    # === Точечные изменения (только в памяти процесса) ===
+    def upsert(self, faq_id: int, norm: str) -> None:
+        self._local[faq_id] = norm
+        self._upsert(faq_id, norm)
+
+    def remove(self, faq_id: int) -> None:
+        self._local[faq_id] = None
+        self._remove(faq_id)
+
+    # === Поиск ===
+    def search(self, norm_q: str, limit: int, score_cutoff: float = 0) -> list[tuple[int, float]]:
+        """
+        Возвращает [(faq_id, score)], score — косинус × 100 (шкала как у WRatio).
+        """
+        self.refresh()
+        if not self._slot_by_id:
+            return []
+        query = self._weigh(self._hashed(features(norm_q)), self._idf(self._df, len(self._slot_by_id)))
+        scores = self._matrix @ query * 100
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (self._slots[slot], float(scores[slot]))
+            for slot in top
+            if self._slots[slot] is not None and scores[slot] > 0 and scores[slot] >= score_cutoff
+        ]
+
+    def refresh(self) -> bool:
+        """
+        Переоткрывает индекс, если другой процесс опубликовал новое поколение
+        (проверка — один stat meta.json). Возвращает True, если переоткрыл.
+        """
+        if self._generation is None:
+            return False
+        try:
+            stamp = self._stamp(os.stat(self._meta_path()))
+        except OSError:
+            return False
+        if stamp == self._meta_stamp:
+            return False
+        meta = self._read_meta()
+        if not meta or meta["dim"] != self.dim or meta["fingerprint"] == self._generation:
+            self._meta_stamp = meta["stamp"] if meta else stamp
+            return False
+        local = self._local
+        if not self._load(meta):
+            return False
+        for faq_id, norm in local.items():
+            if norm is None:
+                self._remove(faq_id)
+            else:
+                self._upsert(faq_id, norm)
+        self._local = local
+        logger.info(f"[VECTOR INDEX] Переоткрыт {self._matrix_path(meta['fingerprint'])}: {len(self)} векторов")
+        return True
+
+    # === Внутреннее ===
+    def _upsert(self, faq_id: int, norm: str) -> None:
+        self._remove(faq_id)
+        vec = self._hashed(features(norm))
+        self._df[vec.nonzero()] += 1
+
+        if None not in self._slots:
+            self._grow()
+        slot = self._slots.index(None)
+        self._slots[slot] = faq_id
+        self._slot_by_id[faq_id] = slot
+        self._matrix[slot] = self._weigh(vec, self._idf(self._df, len(self._slot_by_id)))
+
+    def _remove(self, faq_id: int) -> None:
+        slot = self._slot_by_id.pop(faq_id, None)
+        if slot is None:
+            return
+        # ненулевые позиции строки — ровно те признаки, что учитывались в DF (idf > 0)
+        self._df[self._matrix[slot].nonzero()] -= 1
+        self._slots[slot] = None
+        self._matrix[slot] = 0
+
+    def _hashed(self, feats: Counter):
+        # crc32, а не hash(): индексы признаков должны совпадать во всех процессах
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feat, tf in feats.items():
+            vec[zlib.crc32(feat.encode("utf-8")) % self.dim] += 1 + math.log(tf)
+        return vec
+
+    @staticmethod
+    def _idf(df, n_docs: int):
+        return (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+
+    @staticmethod
+    def _weigh(vec, idf):
+        vec = vec * idf
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _load(self, meta: dict) -> bool:
+        """Открывает поколение из meta (copy-on-write). False — файлы уже удалены."""
+        fingerprint = meta["fingerprint"]
+        try:
+            df = np.load(self._df_path(fingerprint))
+            matrix = np.memmap(
+                self._matrix_path(fingerprint), dtype=np.float32, mode="c", shape=(len(meta["slots"]), self.dim)
+            )
+        except (OSError, ValueError) as e:
+            logger.warning(f"[VECTOR INDEX] Не удалось открыть поколение {fingerprint[:16]}: {e}")
+            return False
+        self._matrix = matrix
+        self._df = df
+        self._slots = list(meta["slots"])
+        self._slot_by_id = {faq_id: slot for slot, faq_id in enumerate(self._slots) if faq_id is not None}
+        self._generation = fingerprint
+        # None (только что опубликованное поколение) — refresh сверится с meta при следующем поиске
+        self._meta_stamp = meta.get("stamp")
+        self._local = {}
+        return True
+
+    def _grow(self) -> None:
+        """Удваивает ёмкость (в памяти процесса, строки копируются один раз)."""
+        old_capacity = len(self._slots)
+        matrix = np.zeros((old_capacity * 2, self.dim), dtype=np.float32)
+        matrix[:old_capacity] = self._matrix
+        self._matrix = matrix
+        self._slots.extend([None] * old_capacity)
+
+    def _publish(self, meta: dict, matrix, df, previous: Optional[dict]) -> None:
+        """Пишет поколение: матрица, DF, затем meta — каждый файл атомарно."""
+        fingerprint = meta["fingerprint"]
+        self._write_atomic(self._matrix_path(fingerprint), matrix.tofile)
+        self._write_atomic(self._df_path(fingerprint), lambda f: np.save(f, df))
+        self._write_atomic(self._meta_path(), lambda f: f.write(json.dumps(meta).encode("utf-8")))
+        if previous and previous.get("fingerprint") not in (None, fingerprint):
+            # открытые отображения старого поколения остаются валидными (unlink, а не перезапись)
+            for stale in (self._matrix_path(previous["fingerprint"]), self._df_path(previous["fingerprint"])):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _write_atomic(path: str, write) -> None:
+        # уникальное временное имя в том же каталоге: параллельные build не пишут в один файл
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for faq_id in sorted(self._norms):
+            digest.update(f"{faq_id}:{self._norms[faq_id]}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _matrix_path(self, fingerprint: str) -> str:
+        return f"{self.path}.{fingerprint[:16]}"
+
+    def _df_path(self, fingerprint: str) -> str:
+        return f"{self.path}.{fingerprint[:16]}.df.npy"
+
+    def _meta_path(self) -> str:
+        return f"{self.path}.meta.json"
+
+    @staticmethod
+    def _stamp(st: os.stat_result) -> tuple[int, int]:
+        # os.replace даёт новый inode — публикации различаются, даже если mtime совпал
+        return st.st_ino, st.st_mtime_ns
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self._meta_path(), encoding="utf-8") as f:
+                meta = json.load(f)
+                meta["stamp"] = self._stamp(os.fstat(f.fileno()))  # версия именно прочитанного файла
+                return meta
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,78 @@
+import pytest
+import pytest_asyncio
+from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from aiogram.types import User as TgUser
+
+from app.filters.admin import IsAdmin
+from app.models import Admin
+from app.repositories import admin_repo, user_repo
+from app.services.admin_cache import AdminSet, admin_set
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def session(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    monkeypatch.setattr(admin_set, "static_ids", frozenset({1}))
+    admin_set.build([])
+    user_repo.clear_cache()
+
+    async with async_session_maker() as session:
+        yield session
+
+    admin_set.build([])
+    user_repo.clear_cache()
+    await engine.dispose()
+
+
+# === ТЕСТЫ ===
+
+async def test_admin_set_keeps_static_ids():
+    admins = AdminSet(static_ids=[1])
+    admins.build([2, 3])
+    assert 1 in admins and 2 in admins
+
+    admins.discard(1)  # из .env не снимается
+    admins.discard(2)
+    assert 1 in admins and 2 not in admins
+
+    admins.build([])
+    assert len(admins) == 1
+
+
+async def test_load_admins_from_table(session):
+    user_id = await user_repo.get_or_create_id(session, 500)
+    session.add(Admin(user_id=user_id))
+    await session.commit()
+    assert 500 not in admin_set
+
+    await admin_repo.load_admins(session)
+
+    assert 500 in admin_set and 1 in admin_set
+    assert await admin_repo.admin_tg_ids(session) == {500}
+
+
+async def test_add_and_remove_admin_update_set(session):
+    await admin_repo.add_admin(session, 600)
+    assert 600 in admin_set
+
+    assert await admin_repo.remove_admin(session, 600) is True
+    assert 600 not in admin_set
+    assert await admin_repo.remove_admin(session, 600) is False
+
+
+async def test_is_admin_filter(session):
+    is_admin = IsAdmin()
+    assert await is_admin(object(), event_from_user=TgUser(id=1, is_bot=False, first_name="Админ"))
+    assert not await is_admin(object(), event_from_user=TgUser(id=2, is_bot=False, first_name="Гость"))
+    assert not await is_admin(object())
@@ -0,0 +1,49 @@
+import time
+from datetime import datetime, timedelta, UTC
+
+from app.services.answer_cache import AnswerCache
+
+
+def test_get_set_and_ttl():
+    cache = AnswerCache(maxsize=10, ttl_seconds=3600)
+    assert cache.get("h1") is None
+
+    cache.set("h1", "ответ")
+    assert cache.get("h1") == "ответ"
+
+    # запись из gpt_cache, которой уже больше TTL, в L1 не попадает
+    cache.set("h2", "старый ответ", created_at=datetime.now(UTC) - timedelta(hours=2))
+    assert cache.get("h2") is None
+
+    # собственный короткий TTL
+    cache.set("h3", "ошибка", ttl_seconds=0.01)
+    time.sleep(0.02)
+    assert cache.get("h3") is None
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_lru_eviction():
+    cache = AnswerCache(maxsize=2, ttl_seconds=3600)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None  # вытеснен наименее недавно использованный
+    assert cache.get("a") == "1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_snapshot_roundtrip(tmp_path):
+    path = str(tmp_path / "answers.json")
+    cache = AnswerCache(maxsize=10, ttl_seconds=3600)
+    cache.set("a", "ответ a")
+    cache.set("b", "ответ b")
+    cache.save(path)
+
+    restored = AnswerCache(maxsize=10, ttl_seconds=3600)
+    restored.load(path)
+    assert restored.get("a") == "ответ a"
+    assert len(restored) == 2
@@ -68,3 +68,34 @@ async def test_cache_hits_increment(session):
     entry3 = await cache_repo.upsert(session, h, "Новый ответ", fresh=True)
     assert entry3.answer == "Новый ответ"
     assert entry3.hits == 2
+
+
+async def test_invalidate_by_faq_only_dependent(session):
+    h1, h2, h3 = qhash("про оплату"), qhash("про доставку"), qhash("без контекста")
+    await cache_repo.upsert(session, h1, "Ответ 1", fresh=True, context_key="1@x", faq_ids=[1, 2])
+    await cache_repo.upsert(session, h2, "Ответ 2", fresh=True, context_key="2@x", faq_ids=[2])
+    await cache_repo.upsert(session, h3, "Ответ 3", fresh=True)
+
+    # FAQ 1 изменился → сбрасывается только ответ, где он был в контексте
+    assert await cache_repo.invalidate_by_faq(session, 1) == [h1]
+    assert await cache_repo.get_by_hash(session, h1) is None
+    assert await cache_repo.get_by_hash(session, h2) is not None
+    assert await cache_repo.get_by_hash(session, h3) is not None
+
+    assert await cache_repo.invalidate_by_faq(session, 2) == [h2]
+    assert await cache_repo.invalidate_by_faq(session, 2) == []
+    assert await cache_repo.get_by_hash(session, h3) is not None
+
+
+async def test_add_hits_batched(session):
+    h1, h2 = qhash("первый"), qhash("второй")
+    await cache_repo.upsert(session, h1, "Ответ 1", fresh=True)
+    await cache_repo.upsert(session, h2, "Ответ 2", fresh=True)
+
+    await cache_repo.add_hits(session, {h1: 5, h2: 2, qhash("нет такого"): 1})
+    await session.commit()
+
+    for h, hits in ((h1, 5), (h2, 2)):
+        entry = await cache_repo.get_by_hash(session, h)
+        await session.refresh(entry)
+        assert entry.hits == hits
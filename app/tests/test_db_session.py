@@ -0,0 +1,115 @@
+import pytest
+import pytest_asyncio
+from sqlmodel import SQLModel, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.middlewares.db_session import DbSessionMiddleware
+from app.models import UnansweredQuestion
+from app.repositories import unanswered_repo
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    # файл, а не :memory: — у каждой сессии своё соединение, незакоммиченное снаружи не видно
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'uow.db'}", echo=False)
+    async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    yield async_session_maker
+
+    await engine.dispose()
+
+
+async def _count(session_maker) -> int:
+    async with session_maker() as session:
+        result = await session.execute(select(UnansweredQuestion))
+        return len(result.scalars().all())
+
+
+# === ТЕСТЫ ===
+
+async def test_session_not_opened_when_unused(session_maker):
+    middleware = DbSessionMiddleware(session_maker)
+    seen = {}
+
+    async def handler(event, data):
+        seen["uow"] = data["uow"]
+        return "ok"
+
+    assert await middleware(handler, object(), {}) == "ok"
+    assert not seen["uow"].opened
+
+
+async def test_commit_once_at_end(session_maker):
+    middleware = DbSessionMiddleware(session_maker)
+
+    async def handler(event, data):
+        session = data["uow"].session
+        # в unit of work репозиторий только делает flush
+        await unanswered_repo.add_unanswered(session, user_id=1, question_text="Первый", similar_score=None)
+        await unanswered_repo.add_unanswered(session, user_id=1, question_text="Второй", similar_score=None)
+        assert await _count(session_maker) == 0  # снаружи ещё не видно
+        return "ok"
+
+    assert await middleware(handler, object(), {}) == "ok"
+    assert await _count(session_maker) == 2
+
+
+async def test_rollback_on_error(session_maker):
+    middleware = DbSessionMiddleware(session_maker)
+
+    async def handler(event, data):
+        await unanswered_repo.add_unanswered(data["uow"].session, user_id=1, question_text="Вопрос", similar_score=None)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await middleware(handler, object(), {})
+    assert await _count(session_maker) == 0
+
+
+async def test_cancelled_handler_rolls_back_and_closes(session_maker):
+    import asyncio
+
+    middleware = DbSessionMiddleware(session_maker)
+    seen = {}
+
+    async def handler(event, data):
+        session = seen["session"] = data["uow"].session
+        await unanswered_repo.add_unanswered(session, user_id=1, question_text="Вопрос", similar_score=None)
+        await asyncio.sleep(10)
+
+    task = asyncio.create_task(middleware(handler, object(), {}))
+    await asyncio.sleep(0.05)
+    task.cancel()  # остановка polling
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert not seen["session"].in_transaction()  # откат и close: соединение вернулось в пул
+    assert await _count(session_maker) == 0
+
+
+async def test_release_connection_keeps_one_commit(session_maker):
+    from app.db import release_connection
+
+    middleware = DbSessionMiddleware(session_maker)
+
+    async def handler(event, data):
+        session = data["uow"].session
+        await session.execute(select(UnansweredQuestion))
+        # только чтения — соединение можно отпустить на время ожидания LLM
+        assert await release_connection(session)
+
+        await unanswered_repo.add_unanswered(session, user_id=1, question_text="Вопрос", similar_score=None)
+        # после записи промежуточного коммита нет
+        assert not await release_connection(session)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await middleware(handler, object(), {})
+    assert await _count(session_maker) == 0
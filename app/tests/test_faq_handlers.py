@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.handlers.faq import _page_keyboard
+from app.keyboards.faq_inline import faq_pages
+from app.repositories import faq_repo
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    faq_pages.clear()
+    async with async_session_maker() as session:
+        yield session
+    faq_pages.clear()
+
+    await engine.dispose()
+
+
+# === ТЕСТЫ ===
+
+async def test_page_keyboard_malformed_cursor_falls_back_to_first_page(session):
+    await faq_repo.add_faq(session, "Как сделать заказ?", "Через корзину.")
+    uow = SimpleNamespace(session=session)
+
+    first = await _page_keyboard("", uow)
+    # callback_data присылает клиент: битый курсор — не исключение, а первая страница
+    assert await _page_keyboard("n:abc:1", uow) == first
+    assert await _page_keyboard("p:1:", uow) == first
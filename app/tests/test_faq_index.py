@@ -0,0 +1,114 @@
+from app.models import FAQEntry
+from app.services.faq_index import FAQIndex
+from app.services.text_norm import normalize
+
+
+def make_index() -> FAQIndex:
+    index = FAQIndex()
+    index.build([
+        FAQEntry(id=1, question="Как сделать заказ?", answer="Оформите заказ на сайте."),
+        FAQEntry(id=2, question="Сколько стоит доставка?", answer="Зависит от региона."),
+    ])
+    return index
+
+
+def test_build_and_exact():
+    index = make_index()
+    assert index.ready
+    assert len(index) == 2
+
+    faq = index.exact(normalize("  как СДЕЛАТЬ заказ? "))
+    assert faq is not None
+    assert faq.id == 1
+    assert index.exact(normalize("Что-то другое")) is None
+
+
+def test_upsert_replaces_norm():
+    index = make_index()
+    index.upsert(FAQEntry(id=1, question="Как оплатить заказ?", answer="Картой."))
+
+    assert index.exact(normalize("Как сделать заказ?")) is None
+    faq = index.exact(normalize("Как оплатить заказ?"))
+    assert faq.answer == "Картой."
+    assert len(index) == 2
+
+
+def test_remove():
+    index = make_index()
+    index.remove(2)
+
+    assert index.get(2) is None
+    assert index.exact(normalize("Сколько стоит доставка?")) is None
+    assert [faq.id for faq, _ in index.items()] == [1]
+
+
+def test_upsert_ignored_until_built():
+    index = FAQIndex()
+    index.upsert(FAQEntry(id=1, question="Вопрос", answer="Ответ"))
+    assert not index.ready
+    assert len(index) == 0
+
+
+def test_search_top_k_and_cutoff():
+    index = make_index()
+    index.upsert(FAQEntry(id=3, question="Как вернуть заказ?", answer="В течение 14 дней."))
+
+    results = index.search(normalize("Как сделать заказ?"), limit=2)
+    assert len(results) == 2
+    assert results[0][0].id == 1
+    assert results[0][1] >= results[1][1]
+
+    # всё, что ниже порога, отсекается
+    assert index.search(normalize("Совсем другое"), limit=3, score_cutoff=90) == []
+
+
+def test_shortlist_by_shared_lemmas():
+    index = FAQIndex(shortlist_size=1)
+    index.build([
+        FAQEntry(id=1, question="Сколько стоит доставка в Казань", answer="500"),
+        FAQEntry(id=2, question="Сколько стоит подписка", answer="100"),
+        FAQEntry(id=3, question="Где пункт выдачи", answer="На карте"),
+    ])
+
+    # «сколько стоит» есть в большинстве вопросов — отбор идёт по редкой «доставке»
+    assert index.shortlist(normalize("доставка сколько стоит"), size=3) == [1]
+    assert sorted(index.shortlist(normalize("сколько стоит"), size=3)) == [1, 2]
+    results = index.search(normalize("доставка сколько стоит"), limit=3)
+    assert [faq.id for faq, _ in results] == [1]
+
+    # нет общих лемм → полный перебор
+    assert index.shortlist(normalize("тарифы"), size=3) == []
+    assert index.search(normalize("тарифы"), limit=3)
+
+
+def test_version_changes_on_updates():
+    index = FAQIndex()
+    v0 = index.version
+    index.build([FAQEntry(id=1, question="Как оплатить?", answer="Картой")])
+    assert index.version > v0
+
+    v1 = index.version
+    index.upsert(FAQEntry(id=2, question="Где заказ?", answer="В пути"))
+    assert index.version > v1
+
+    v2 = index.version
+    index.remove(2)
+    assert index.version > v2
+
+
+def test_changes_during_build_are_applied():
+    index = FAQIndex()
+
+    def snapshot():
+        # снимок из БД уже прочитан, а правки приходят, пока build идёт в другом потоке
+        yield FAQEntry(id=1, question="Как сделать заказ?", answer="Оформите заказ на сайте.")
+        index.upsert(FAQEntry(id=3, question="Как вернуть товар?", answer="В течение 14 дней."))
+        index.remove(2)
+        yield FAQEntry(id=2, question="Сколько стоит доставка?", answer="Зависит от региона.")
+
+    index.build(snapshot())
+
+    assert index.ready
+    assert index.exact(normalize("Как вернуть товар?")).id == 3
+    assert index.get(2) is None
+    assert len(index) == 2
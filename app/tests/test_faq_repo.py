@@ -0,0 +1,104 @@
+import pytest
+import pytest_asyncio
+from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models import FAQEntry
+from app.repositories import faq_repo
+from app.services.text_norm import hash_norm, normalize
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    async with async_session_maker() as session:
+        yield session
+
+    await engine.dispose()
+
+
+# === ТЕСТЫ ===
+
+async def test_add_faq_stores_norm(session):
+    entry = await faq_repo.add_faq(session, "Как сделать заказ?", "Через корзину.")
+
+    assert entry.question_norm == normalize("Как сделать заказ?")
+    assert entry.question_hash == hash_norm(entry.question_norm)
+
+
+async def test_get_by_question_norm(session):
+    await faq_repo.add_faq(session, "Как сделать заказ?", "Через корзину.")
+    await faq_repo.add_faq(session, "Сколько стоит доставка?", "Зависит от региона.")
+
+    found = await faq_repo.get_by_question_norm(session, normalize("  как СДЕЛАТЬ заказ? "))
+    assert found is not None
+    assert found.answer == "Через корзину."
+
+    assert await faq_repo.get_by_question_norm(session, normalize("Другой вопрос")) is None
+
+    # строки без question_norm (до backfill) этим запросом не находятся
+    session.add(FAQEntry(question="Как вернуть товар?", answer="В течение 14 дней."))
+    await session.commit()
+    assert await faq_repo.get_by_question_norm(session, normalize("Как вернуть товар?")) is None
+
+
+async def test_add_popularity_batched(session):
+    a = await faq_repo.create_faq(session, "Вопрос A?", "A")
+    b = await faq_repo.create_faq(session, "Вопрос B?", "B")
+
+    await faq_repo.add_popularity(session, {a.id: 3, b.id: 1})
+    await session.commit()
+    await faq_repo.inc_popularity(session, a.id)
+
+    await session.refresh(a)
+    await session.refresh(b)
+    assert (a.popularity, b.popularity) == (4, 1)
+
+
+async def test_top_faq_page_keyset(session):
+    popularity = [5, 3, 3, 3, 1, 0, 0]
+    for i, pop in enumerate(popularity):
+        entry = await faq_repo.create_faq(session, f"Вопрос {i}?", "Ответ")
+        entry.popularity = pop
+    await session.commit()
+    expected = [f.id for f in sorted(await faq_repo.all_faqs(session), key=lambda f: (-f.popularity, f.id))]
+
+    page1, more = await faq_repo.top_faq_page(session, 3)
+    assert [f.id for f in page1] == expected[:3] and more
+
+    last = page1[-1]
+    page2, more = await faq_repo.top_faq_page(session, 3, (last.popularity, last.id))
+    assert [f.id for f in page2] == expected[3:6] and more
+
+    last = page2[-1]
+    page3, more = await faq_repo.top_faq_page(session, 3, (last.popularity, last.id))
+    assert [f.id for f in page3] == expected[6:] and not more
+
+    # назад от первого вопроса третьей страницы — снова вторая
+    first = page3[0]
+    back, more = await faq_repo.top_faq_page(session, 3, (first.popularity, first.id), backward=True)
+    assert [f.id for f in back] == expected[3:6] and more
+    first = back[0]
+    back, more = await faq_repo.top_faq_page(session, 3, (first.popularity, first.id), backward=True)
+    assert [f.id for f in back] == expected[:3] and not more
+
+
+async def test_get_many_by_ids_keeps_order(session):
+    a = await faq_repo.add_faq(session, "Вопрос A", "Ответ A")
+    b = await faq_repo.add_faq(session, "Вопрос B", "Ответ B")
+    c = await faq_repo.add_faq(session, "Вопрос C", "Ответ C")
+
+    items = await faq_repo.get_many_by_ids(session, [c.id, 9999, a.id, c.id])
+
+    assert [f.id for f in items] == [c.id, a.id]
+    assert await faq_repo.get_many_by_ids(session, []) == []
+    assert b.id not in [f.id for f in items]
@@ -4,9 +4,25 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sess
 from sqlmodel import SQLModel
 
 from app.models import FAQEntry
+from app.services import faq_service
+from app.services.counters import cache_hits, faq_popularity, flush_counters
+from app.services.faq_index import faq_index
+from app.services.rate_limiter import llm_limiter
 from app.services.faq_service import get_answer_from_faq
 
 
+@pytest.fixture(autouse=True)
+def reset_faq_index():
+    # индекс общий на процесс — у каждого теста своя БД
+    faq_index.reset()
+    faq_popularity.clear()
+    cache_hits.clear()
+    llm_limiter.clear()
+    faq_service.llm_error_cache.clear()
+    yield
+    faq_index.reset()
+
+
 @pytest_asyncio.fixture
 async def session():
     engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
@@ -30,33 +46,276 @@ async def seed_faq(session: AsyncSession):
 
 @pytest.mark.asyncio
 async def test_exact_match(session, seed_faq):
-    answer, ctx = await get_answer_from_faq(session, user_id=123, text="Как сделать заказ?")
+    answer, ctx, need_clarification = await get_answer_from_faq(session, user_id=123, text="Как сделать заказ?")
     assert answer is not None
+    assert need_clarification is False
     assert "оформите заказ" in answer
     assert len(ctx) == 1
 
-    # проверим, что популярность увеличилась
+    # популярность копится в памяти и пишется в БД при flush
     faq = ctx[0]
+    assert faq_popularity.pending(faq.id) == 1
+    assert await flush_counters(session) == 1
     fresh = await session.get(FAQEntry, faq.id)
+    await session.refresh(fresh)
     assert fresh.popularity > 0
+    assert len(faq_popularity) == 0
 
 
 @pytest.mark.asyncio
-async def test_fuzzy_match(session, seed_faq):
-    answer, ctx = await get_answer_from_faq(session, user_id=123, text="Как оформить заказ?")
+async def test_fuzzy_match(session, seed_faq, monkeypatch):
+    # уверенный fuzzy-match (выше порога автоответа) отвечает сразу, без уточнения
+    monkeypatch.setattr(faq_service, "FAQ_AUTO_ANSWER_SCORE", 65)
+    answer, ctx, need_clarification = await get_answer_from_faq(session, user_id=123, text="Как оформить заказ?")
     assert answer is not None
+    assert need_clarification is False
     assert "оформите заказ" in answer
     assert len(ctx) >= 1
 
     # лучший FAQ должен быть первый
     best_faq = ctx[0]
+    await flush_counters(session)
     fresh = await session.get(FAQEntry, best_faq.id)
+    await session.refresh(fresh)
     assert fresh.popularity > 0
 
 
+@pytest.mark.asyncio
+async def test_clarification_between_thresholds(session, seed_faq):
+    answer, ctx, need_clarification = await get_answer_from_faq(session, user_id=123, text="Как оформить заказ?")
+    assert answer is None
+    assert need_clarification is True
+    assert "заказ" in ctx[0].question
+
+
 @pytest.mark.asyncio
 async def test_no_match_low_score(session, seed_faq):
-    answer, ctx = await get_answer_from_faq(session, user_id=123, text="Что вы думаете о космосе?")
+    answer, ctx, need_clarification = await get_answer_from_faq(session, user_id=123, text="Что вы думаете о космосе?")
     assert answer is None
-    # кандидаты должны вернуться, но без уверенного ответа
-    assert len(ctx) > 0
+    # без уверенного ответа и без уточнения — вопрос уходит сразу в LLM
+    assert need_clarification is False
+
+
+def test_decide_requires_margin():
+    a = FAQEntry(id=1, question="a", answer="a")
+    b = FAQEntry(id=2, question="b", answer="b")
+    assert faq_service.decide([(a, 95), (b, 60)]) == "auto"
+    assert faq_service.decide([(a, 95), (b, 93)]) == "clarify"  # два почти равных кандидата
+    assert faq_service.decide([(a, 40)]) == "llm"
+    assert faq_service.decide([]) == "llm"
+
+
+def test_cache_key_hashes_context_without_normalizing(monkeypatch):
+    from app.services import text_norm
+    from app.services.text_norm import qhash
+
+    norm_q = faq_service.normalize("Сколько идёт доставка?")
+    assert faq_service._make_cache_key(norm_q, "") == qhash("Сколько идёт доставка?")
+
+    calls = []
+    monkeypatch.setattr(text_norm, "lemmatize", lambda token: calls.append(token) or token)
+    monkeypatch.setattr(text_norm, "get_morph", lambda: object())
+    faq_service._make_cache_key(norm_q, "")
+    k1 = faq_service._make_cache_key(norm_q, "1@2024-01-01T10:00:00+00:00")
+    k2 = faq_service._make_cache_key(norm_q, "1@2024-01-01T10:00:01+00:00")
+    assert calls == []  # ни вопрос, ни строка контекста повторно не лемматизируются
+    assert k1 != k2 and len(k1) == 64
+
+
+@pytest.mark.asyncio
+async def test_cache_key_follows_faq_version(session, seed_faq, monkeypatch):
+    from app.repositories import faq_repo
+    from app.services.answer_cache import answer_cache
+    from app.services.semantic_cache import semantic_cache
+
+    calls = []
+
+    class FakeProvider:
+        name = "fake"
+
+        async def answer(self, text, context_chunks):
+            calls.append(context_chunks)
+            return f"ответ #{len(calls)}"
+
+    monkeypatch.setattr(faq_service, "get_llm_provider", lambda: FakeProvider())
+    answer_cache.clear()
+    semantic_cache.reset()
+
+    order, payment = seed_faq
+    ask = faq_service.get_answer_from_gpt_cache_or_llm
+    assert await ask(session, 1, "Можно ли оплатить частями?", [payment]) == "ответ #1"
+    assert await ask(session, 1, "Можно ли оплатить частями?", [payment]) == "ответ #1"
+    # тот же вопрос с другим контекстом — отдельная запись кэша
+    assert await ask(session, 1, "Можно ли оплатить частями?", [order]) == "ответ #2"
+
+    # правка FAQ сбрасывает только ответы, где он был в контексте
+    await faq_repo.update_faq(session, payment.id, answer="Только картой.")
+    assert await ask(session, 1, "Можно ли оплатить частями?", [payment]) == "ответ #3"
+    assert await ask(session, 1, "Можно ли оплатить частями?", [order]) == "ответ #2"
+    assert len(calls) == 3
+
+    answer_cache.clear()
+    semantic_cache.reset()
+
+
+@pytest.mark.asyncio
+async def test_streaming_caches_only_final_text(session, monkeypatch):
+    from app.repositories import cache_repo
+    from app.services.answer_cache import answer_cache
+    from app.services.semantic_cache import semantic_cache
+
+    class FakeProvider:
+        name = "fake"
+
+        async def stream(self, text, context_chunks):
+            for chunk in ["Доставка ", "занимает ", "3 дня."]:
+                yield chunk
+
+    monkeypatch.setattr(faq_service, "get_llm_provider", lambda: FakeProvider())
+    answer_cache.clear()
+    semantic_cache.reset()
+
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    ask = faq_service.get_answer_from_gpt_cache_or_llm
+    answer = await ask(session, 1, "Сколько идёт доставка?", on_partial=on_partial)
+    assert answer == "Доставка занимает 3 дня."
+    # "" — плейсхолдер; дальше накопленный текст (куски, пришедшие во время правки, склеиваются)
+    assert partials[0] == ""
+    assert all(answer.startswith(p) for p in partials)
+
+    h = faq_service._make_cache_key(faq_service.normalize("Сколько идёт доставка?"), "")
+    entry = await cache_repo.get_by_hash(session, h)
+    assert entry.answer == "Доставка занимает 3 дня."
+
+    # из кэша — без частичных ответов
+    partials.clear()
+    assert await ask(session, 1, "Сколько идёт доставка?", on_partial=on_partial) == answer
+    assert partials == []
+
+    answer_cache.clear()
+    semantic_cache.reset()
+
+
+@pytest.mark.asyncio
+async def test_llm_error_not_cached(session, monkeypatch):
+    from app.repositories import cache_repo
+    from app.services.answer_cache import answer_cache
+    from app.services.llm_provider import LLMError
+    from app.services.semantic_cache import semantic_cache
+
+    class FailingProvider:
+        name = "fake"
+        calls = 0
+
+        async def answer(self, text, context_chunks):
+            FailingProvider.calls += 1
+            raise LLMError("YandexGPT вернул 500")
+
+    monkeypatch.setattr(faq_service, "get_llm_provider", lambda: FailingProvider())
+    answer_cache.clear()
+    semantic_cache.reset()
+
+    ask = faq_service.get_answer_from_gpt_cache_or_llm
+    assert await ask(session, 1, "Где мой заказ?") == LLMError.user_message
+    h = faq_service._make_cache_key(faq_service.normalize("Где мой заказ?"), "")
+    assert await cache_repo.get_by_hash(session, h) is None
+
+    # повтор в течение LLM_ERROR_CACHE_SECONDS — из негативного кэша, без вызова LLM
+    assert await ask(session, 1, "Где мой заказ?") == LLMError.user_message
+    assert FailingProvider.calls == 1
+    assert cache_hits.pending(h) == 0  # строки в gpt_cache нет — hits не копятся
+    assert answer_cache.get(h) is None
+
+    answer_cache.clear()
+    semantic_cache.reset()
+
+
+@pytest.mark.asyncio
+async def test_llm_rate_limit(session, monkeypatch):
+    from app.services.answer_cache import answer_cache
+    from app.services.semantic_cache import semantic_cache
+
+    class FakeProvider:
+        name = "fake"
+
+        async def answer(self, text, context_chunks):
+            return f"ответ на {text}"
+
+    monkeypatch.setattr(faq_service, "get_llm_provider", lambda: FakeProvider())
+    answer_cache.clear()
+    semantic_cache.reset()
+
+    ask = faq_service.get_answer_from_gpt_cache_or_llm
+    questions = ["Первый вопрос про погоду", "Второй про космос", "Третий про кино", "Четвёртый про музыку"]
+    answers = [await ask(session, 7, q) for q in questions]
+    assert answers[:3] == [f"ответ на {q}" for q in questions[:3]]
+    assert answers[3] == faq_service.LLM_LIMIT_TEXT
+
+    # ответ из кэша лимит не расходует
+    assert await ask(session, 7, questions[0]) == f"ответ на {questions[0]}"
+
+    answer_cache.clear()
+    semantic_cache.reset()
+
+
+@pytest.mark.asyncio
+async def test_provider_errors_and_slow_partials(session, monkeypatch):
+    import asyncio
+    from app.services.answer_cache import answer_cache
+    from app.services.llm_dispatcher import llm_dispatcher
+    from app.services.llm_provider import LLMError
+    from app.services.semantic_cache import semantic_cache
+
+    class BrokenProvider:
+        name = "fake"
+
+        async def answer(self, text, context_chunks):
+            raise ValueError("битый JSON")  # не LLMError
+
+    monkeypatch.setattr(faq_service, "get_llm_provider", lambda: BrokenProvider())
+    answer_cache.clear()
+    semantic_cache.reset()
+    ask = faq_service.get_answer_from_gpt_cache_or_llm
+
+    # ошибка провайдера любого типа → сообщение пользователю, а не исключение из хендлера
+    assert await ask(session, 1, "Вопрос про сломанный провайдер") == LLMError.user_message
+
+    started, go = asyncio.Event(), asyncio.Event()
+
+    class StreamProvider:
+        name = "fake"
+
+        async def stream(self, text, context_chunks):
+            started.set()
+            await go.wait()
+            for chunk in ["раз ", "два ", "три"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+
+    class FloodWait(Exception):
+        pass
+
+    async def on_partial(text):
+        raise FloodWait()  # ошибка Telegram у лидера: бот заблокирован / flood-wait
+
+    monkeypatch.setattr(faq_service, "get_llm_provider", lambda: StreamProvider())
+    question = "Вопрос с потоком"
+    leader = asyncio.create_task(ask(session, 1, question, on_partial=on_partial))
+    await started.wait()
+    waiter = asyncio.create_task(ask(session, 2, question))
+    await asyncio.sleep(0.01)  # ожидающий присоединился к тому же вызову
+    go.set()
+
+    # ответ дочитан и достался обоим, ошибка Telegram лидера до ожидающего не дошла
+    assert await asyncio.gather(leader, waiter) == ["раз два три", "раз два три"]
+    h = faq_service._make_cache_key(faq_service.normalize(question), "")
+    assert answer_cache.get(h) == "раз два три"
+    # ошибка правки — не ошибка LLM: вызов успешный, breaker сброшен
+    assert llm_dispatcher._failures == 0
+
+    answer_cache.clear()
+    semantic_cache.reset()
@@ -2,6 +2,7 @@ import pytest
 import pytest_asyncio
 from sqlmodel import SQLModel
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, UTC, timedelta
 
@@ -82,3 +83,40 @@ async def test_cleanup_old_limits(session):
     # Чистим старые
     deleted = await limits_repo.cleanup_old_limits(session, keep_minutes=5)
     assert deleted >= 1
+
+
+async def test_count_never_exceeds_limit(session):
+    user_id = 4
+    for _ in range(5):
+        await limits_repo.check_and_increment(session, user_id, max_per_minute=2)
+
+    result = await session.execute(
+        UsageLimit.__table__.select().where(UsageLimit.user_id == user_id)
+    )
+    rows = result.all()
+    assert len(rows) == 1  # одна строка на окно
+    assert rows[0].count == 2
+
+
+async def test_unique_user_window(session):
+    window_start = datetime.now(UTC).replace(second=0, microsecond=0)
+    session.add(UsageLimit(user_id=5, window_start=window_start, count=1))
+    await session.commit()
+
+    session.add(UsageLimit(user_id=5, window_start=window_start, count=1))
+    with pytest.raises(IntegrityError):
+        await session.commit()
+    await session.rollback()
+
+
+async def test_cleanup_in_batches(session):
+    old = datetime.now(UTC) - timedelta(minutes=30)
+    session.add_all(UsageLimit(user_id=uid, window_start=old, count=1) for uid in range(100, 125))
+    await session.commit()
+    assert await limits_repo.check_and_increment(session, 1, max_per_minute=5) is True
+
+    deleted = await limits_repo.cleanup_old_limits(session, keep_minutes=5, batch_size=10)
+    assert deleted == 25
+
+    result = await session.execute(UsageLimit.__table__.select())
+    assert len(result.all()) == 1  # запись текущей минуты осталась
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.services.llm_dispatcher import LLMDispatcher, LLMOverloaded, LLMUnavailable
+from app.services.llm_provider import LLMError
+
+pytestmark = pytest.mark.asyncio
+
+
+async def call(dispatcher: LLMDispatcher, result="ok", delay=0.0):
+    async with dispatcher.slot():
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+async def test_concurrency_limit_and_queue_fail_fast():
+    dispatcher = LLMDispatcher(max_concurrency=2, max_queue=1, breaker_threshold=5, cooldown=30)
+
+    tasks = [asyncio.create_task(call(dispatcher, delay=0.05)) for _ in range(3)]
+    await asyncio.sleep(0.01)  # 2 выполняются, 1 в очереди
+    with pytest.raises(LLMOverloaded):
+        await call(dispatcher)
+
+    assert await asyncio.gather(*tasks) == ["ok"] * 3
+    assert await call(dispatcher) == "ok"
+
+
+async def test_breaker_opens_and_recovers(monkeypatch):
+    dispatcher = LLMDispatcher(max_concurrency=4, max_queue=10, breaker_threshold=3, cooldown=30)
+
+    for _ in range(3):
+        with pytest.raises(LLMError):
+            await call(dispatcher, LLMError("500"))
+    assert dispatcher.state == "open"
+    with pytest.raises(LLMUnavailable):
+        await call(dispatcher)
+
+    # cooldown прошёл → один пробный запрос; ошибка снова открывает breaker
+    dispatcher._opened_at -= 31
+    assert dispatcher.state == "half_open"
+    with pytest.raises(LLMError):
+        await call(dispatcher, LLMError("500"))
+    assert dispatcher.state == "open"
+
+    dispatcher._opened_at -= 31
+    assert await call(dispatcher) == "ok"
+    assert dispatcher.state == "closed"
+
+
+async def test_success_resets_failures():
+    dispatcher = LLMDispatcher(max_concurrency=1, max_queue=1, breaker_threshold=2, cooldown=30)
+    with pytest.raises(LLMError):
+        await call(dispatcher, LLMError("500"))
+    await call(dispatcher)
+    with pytest.raises(LLMError):
+        await call(dispatcher, LLMError("500"))
+    assert dispatcher.state == "closed"
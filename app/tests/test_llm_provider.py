@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from app.services import llm_provider
+from app.services.llm_provider import LLMError, YandexGPTProvider
+
+pytestmark = pytest.mark.asyncio
+
+
+# Фикстура: локальный HTTP-сервер вместо YandexGPT
+@pytest_asyncio.fixture
+async def stub_server():
+    requests = []
+
+    async def completion(request: web.Request):
+        payload = await request.json()
+        requests.append((request.headers["Authorization"], payload))
+        question = payload["messages"][-1]["text"]
+        if question == "медленно":
+            await asyncio.sleep(0.2)
+        if question == "ошибка":
+            return web.Response(status=500, text="internal")
+        if payload["completionOptions"]["stream"]:
+            # как YandexGPT: JSON-строки, в каждой — весь текст на данный момент
+            response = web.StreamResponse()
+            await response.prepare(request)
+            text = ""
+            for word in question.split():
+                text = f"{text} {word}".strip()
+                chunk = {"result": {"alternatives": [{"message": {"text": text}}]}}
+                await response.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+            await response.write_eof()
+            return response
+        return web.json_response(
+            {"result": {"alternatives": [{"message": {"role": "assistant", "text": f"ответ: {question}"}}]}}
+        )
+
+    app = web.Application()
+    app.router.add_post("/completion", completion)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    yield f"http://127.0.0.1:{port}/completion", requests
+
+    await llm_provider.close_http_session()
+    await runner.cleanup()
+
+
+def make_provider(url: str) -> YandexGPTProvider:
+    provider = YandexGPTProvider(url=url)
+    provider.api_key = "test-key"
+    provider.catalog_id = "catalog"
+    return provider
+
+
+async def test_answer_via_shared_session(stub_server):
+    url, requests = stub_server
+    provider = make_provider(url)
+
+    assert await provider.answer("привет", ["Вопрос: а\nОтвет: б"]) == "ответ: привет"
+    session = llm_provider.get_http_session()
+    assert await provider.answer("ещё", []) == "ответ: ещё"
+    assert llm_provider.get_http_session() is session  # одна сессия на процесс
+
+    auth, payload = requests[0]
+    assert auth == "Api-Key test-key"
+    assert payload["messages"][1]["text"].startswith("Контекст:")
+
+
+async def test_requests_do_not_block_each_other(stub_server):
+    url, _ = stub_server
+    provider = make_provider(url)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    answers = await asyncio.gather(*(provider.answer("медленно", []) for _ in range(5)))
+    assert answers == ["ответ: медленно"] * 5
+    assert loop.time() - start < 0.2 * 5  # запросы идут параллельно, event loop не блокируется
+
+
+async def test_error_status_raises(stub_server):
+    url, _ = stub_server
+    with pytest.raises(LLMError):
+        await make_provider(url).answer("ошибка", [])
+    with pytest.raises(LLMError):
+        [chunk async for chunk in make_provider(url).stream("ошибка", [])]
+
+
+async def test_missing_config_raises():
+    provider = YandexGPTProvider(url="http://127.0.0.1:1/completion")
+    provider.api_key = None
+    with pytest.raises(LLMError):
+        await provider.answer("вопрос", [])
+
+
+async def test_stream_yields_increments(stub_server):
+    url, _ = stub_server
+    chunks = [chunk async for chunk in make_provider(url).stream("доставка занимает три дня", [])]
+    assert chunks == ["доставка", " занимает", " три", " дня"]
+
+
+async def test_default_stream_is_single_chunk():
+    class OneShot(llm_provider.LLMProvider):
+        async def answer(self, question, context_chunks):
+            return "целиком"
+
+    assert [chunk async for chunk in OneShot().stream("вопрос", [])] == ["целиком"]
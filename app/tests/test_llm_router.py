@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from app.services import llm_provider, llm_router
+from app.services.llm_provider import LLMError, OpenAICompatibleProvider, YandexGPTProvider
+from app.services.llm_router import HedgedProvider, TimedProvider
+from app.services.metrics import metrics
+
+pytestmark = pytest.mark.asyncio
+
+
+async def start_stub(handler, path: str):
+    app = web.Application()
+    app.router.add_post(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+# Фикстура: два локальных сервера — YandexGPT (основной) и OpenAI-совместимый (запасной)
+@pytest_asyncio.fixture
+async def stubs():
+    state = {"yandex_delay": 0.0, "yandex_status": 200}
+
+    async def yandex(request: web.Request):
+        payload = await request.json()
+        await asyncio.sleep(state["yandex_delay"])
+        if state["yandex_status"] != 200:
+            return web.Response(status=state["yandex_status"], text="error")
+        text = f"yandex: {payload['messages'][-1]['text']}"
+        return web.json_response({"result": {"alternatives": [{"message": {"text": text}}]}})
+
+    async def openai(request: web.Request):
+        payload = await request.json()
+        text = f"openai: {payload['messages'][-1]['content']}"
+        if payload["stream"]:
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for word in text.split(" "):
+                chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": text}}]})
+
+    metrics.reset()
+    yandex_runner, yandex_port = await start_stub(yandex, "/completion")
+    openai_runner, openai_port = await start_stub(openai, "/v1/chat/completions")
+
+    primary = YandexGPTProvider(url=f"http://127.0.0.1:{yandex_port}/completion")
+    primary.api_key, primary.catalog_id = "key", "catalog"
+    secondary = OpenAICompatibleProvider(base_url=f"http://127.0.0.1:{openai_port}/v1", api_key="key", model="stub")
+
+    yield state, TimedProvider(primary), TimedProvider(secondary)
+
+    await llm_provider.close_http_session()
+    await yandex_runner.cleanup()
+    await openai_runner.cleanup()
+
+
+async def test_openai_compatible_answer_and_stream(stubs):
+    _, _, secondary = stubs
+    assert await secondary.answer("привет", []) == "openai: привет"
+    chunks = [chunk async for chunk in secondary.stream("привет", [])]
+    assert "".join(chunks).strip() == "openai: привет"
+    assert metrics.histogram("llm.latency_ms.openai").count == 1
+    assert metrics.histogram("llm.first_chunk_ms.openai").count == 1
+
+
+async def test_fast_primary_no_hedge(stubs, monkeypatch):
+    _, primary, secondary = stubs
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DELAY_MS", 500)
+
+    assert await HedgedProvider(primary, secondary).answer("вопрос", []) == "yandex: вопрос"
+    assert metrics.counter("llm.hedge.fired") == 0
+
+
+async def test_slow_primary_hedged_and_cancelled(stubs, monkeypatch):
+    state, primary, secondary = stubs
+    state["yandex_delay"] = 0.5
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DELAY_MS", 50)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY_MS", 0)
+
+    hedged = HedgedProvider(primary, secondary)
+    assert await hedged.answer("вопрос", []) == "openai: вопрос"
+    assert metrics.counter("llm.hedge.fired") == 1
+    assert metrics.counter("llm.hedge.won_secondary") == 1
+
+    chunks = [chunk async for chunk in hedged.stream("поток", [])]
+    assert "".join(chunks).strip() == "openai: поток"
+
+
+async def test_loser_cancelled():
+    cancelled = []
+
+    class Slow(llm_provider.LLMProvider):
+        name = "slow"
+
+        async def answer(self, question, context_chunks):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(self.name)
+                raise
+
+    class Fast(llm_provider.LLMProvider):
+        name = "fast"
+
+        async def answer(self, question, context_chunks):
+            await asyncio.sleep(0.01)
+            return "быстрый ответ"
+
+    hedged = HedgedProvider(Slow(), Fast())
+    hedged.hedge_delay = lambda metric: 0.01
+    assert await hedged.answer("вопрос", []) == "быстрый ответ"
+    assert cancelled == ["slow"]
+
+
+async def test_primary_error_fails_over_immediately(stubs, monkeypatch):
+    state, primary, secondary = stubs
+    state["yandex_status"] = 500
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DELAY_MS", 10_000)
+
+    assert await asyncio.wait_for(HedgedProvider(primary, secondary).answer("вопрос", []), 2) == "openai: вопрос"
+
+
+async def test_both_fail_raises(stubs, monkeypatch):
+    state, primary, _ = stubs
+    state["yandex_status"] = 500
+    broken = TimedProvider(OpenAICompatibleProvider(base_url="http://127.0.0.1:1/v1", api_key="key"))
+    with pytest.raises(LLMError):
+        await HedgedProvider(primary, broken).answer("вопрос", [])
+
+
+async def test_hedge_delay_from_p95(monkeypatch):
+    metrics.reset()
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_SAMPLES", 20)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY_MS", 0)
+    hedged = HedgedProvider(YandexGPTProvider(), OpenAICompatibleProvider(api_key="key"))
+    assert hedged.hedge_delay("llm.latency_ms") == llm_router.LLM_HEDGE_DELAY_MS / 1000
+
+    for ms in range(1, 101):
+        metrics.observe("llm.latency_ms.yandex", ms * 10)
+    assert hedged.hedge_delay("llm.latency_ms") == pytest.approx(0.96)
+
+    # нижняя граница: быстрая история не опускает задержку ниже LLM_HEDGE_MIN_DELAY_MS
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY_MS", 1500)
+    assert hedged.hedge_delay("llm.latency_ms") == 1.5
+
+
+async def test_cancelled_call_latency_recorded():
+    metrics.reset()
+
+    class Slow(llm_provider.LLMProvider):
+        name = "slow"
+
+        async def answer(self, question, context_chunks):
+            await asyncio.sleep(10)
+
+    class Fast(llm_provider.LLMProvider):
+        name = "fast"
+
+        async def answer(self, question, context_chunks):
+            await asyncio.sleep(0.05)
+            return "быстрый ответ"
+
+    hedged = HedgedProvider(TimedProvider(Slow()), TimedProvider(Fast()))
+    hedged.hedge_delay = lambda metric: 0.01
+    assert await hedged.answer("вопрос", []) == "быстрый ответ"
+
+    # отменённый основной тоже попал в выборку — с временем не меньше задержки хеджирования
+    slow = metrics.histogram("llm.latency_ms.slow")
+    assert slow.count == 1
+    assert slow.quantile(0.5) >= 10
+
+
+async def test_registry():
+    assert isinstance(llm_router.build_provider("openai", "").provider, OpenAICompatibleProvider)
+    assert isinstance(llm_router.build_provider("yandex", "openai"), HedgedProvider)
+    with pytest.raises(ValueError):
+        llm_router.build_provider("gemini", "")
+    assert llm_router.get_llm_provider() is llm_router.get_llm_provider()
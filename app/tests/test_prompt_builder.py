@@ -0,0 +1,60 @@
+from datetime import datetime, UTC
+
+from app.models import FAQEntry
+from app.services import prompt_builder
+from app.services.prompt_builder import build_context, estimate_tokens, render_chunk, truncate_sentences
+
+LONG_ANSWER = (
+    "Доставка по Москве занимает один день. "
+    "В регионы — от трёх до семи дней в зависимости от удалённости. "
+    "Отследить посылку можно по трек-номеру в личном кабинете. "
+    "Если посылка задерживается, напишите в поддержку."
+)
+
+
+def test_truncate_at_sentence_boundary():
+    short = truncate_sentences(LONG_ANSWER, 40)
+    assert short == "Доставка по Москве занимает один день. В регионы — от трёх до семи дней в зависимости от удалённости."
+    assert estimate_tokens(short) <= 40
+    assert truncate_sentences(LONG_ANSWER, 1000) == LONG_ANSWER
+
+    # первое предложение не влезает — режем по слову
+    cut = truncate_sentences(LONG_ANSWER, 5)
+    assert cut.endswith("…")
+    assert len(cut) <= 5 * prompt_builder.CHARS_PER_TOKEN
+
+
+def test_build_context_respects_budget_and_order():
+    faqs = [
+        FAQEntry(id=i, question=f"Вопрос {i}?", answer=LONG_ANSWER, updated_at=datetime.now(UTC))
+        for i in range(1, 6)
+    ]
+    chunks = build_context(faqs + [faqs[0]], budget=150, chunk_max_tokens=60)
+
+    assert chunks[0].startswith("Вопрос: Вопрос 1?")  # лучший кандидат первым
+    assert len(chunks) < len(faqs)
+    assert sum(estimate_tokens(c) for c in chunks) <= 150
+    assert all(estimate_tokens(c) <= 60 for c in chunks)
+
+
+def test_render_chunk_memo_follows_updated_at():
+    faq = FAQEntry(id=42, question="Как вернуть товар?", answer="В течение 14 дней.", updated_at=datetime(2025, 1, 1, tzinfo=UTC))
+    assert render_chunk(faq, 100) == "Вопрос: Как вернуть товар?\nОтвет: В течение 14 дней."
+
+    faq.answer = "В течение 30 дней."
+    assert render_chunk(faq, 100).endswith("14 дней.")  # та же версия — из кэша
+    faq.updated_at = datetime(2025, 2, 1, tzinfo=UTC)
+    assert render_chunk(faq, 100).endswith("30 дней.")
+
+
+def test_long_question_counts_against_budget():
+    long_question = "Подскажите, пожалуйста, " + "как оформить возврат товара, купленного по акции, " * 20 + "?"
+    faqs = [
+        FAQEntry(id=100, question=long_question, answer=LONG_ANSWER, updated_at=datetime.now(UTC)),
+        FAQEntry(id=101, question="Сроки доставки?", answer=LONG_ANSWER, updated_at=datetime.now(UTC)),
+    ]
+    chunks = build_context(faqs, budget=120, chunk_max_tokens=80)
+
+    assert estimate_tokens(chunks[0]) <= 80  # заголовок с вопросом тоже в лимите куска
+    assert "Ответ: Доставка" in chunks[0]  # ответу место осталось
+    assert sum(estimate_tokens(c) for c in chunks) <= 120
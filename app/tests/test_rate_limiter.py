@@ -0,0 +1,68 @@
+import pytest
+
+from app.services.rate_limiter import SlidingWindowLimiter
+
+
+def test_limit_within_window():
+    limiter = SlidingWindowLimiter(limit=3, window=60)
+    assert [limiter.hit(1, now=0.0 + i) for i in range(4)] == [True, True, True, False]
+    assert limiter.hit(2, now=5.0) is True  # у другого пользователя свой счётчик
+
+
+def test_sliding_window_decays_previous():
+    limiter = SlidingWindowLimiter(limit=4, window=60)
+    for _ in range(4):
+        assert limiter.hit(1, now=50.0)
+
+    # четверть следующего окна: предыдущее весит 4 * 0.75 = 3 → можно ещё одно
+    assert limiter.hit(1, now=75.0) is True
+    assert limiter.hit(1, now=75.0) is False
+    # три четверти окна: 4 * 0.25 + 1 = 2 → можно ещё два
+    assert limiter.hit(1, now=105.0) is True
+    assert limiter.hit(1, now=105.0) is True
+    assert limiter.hit(1, now=105.0) is False
+    # через окно предыдущее уже не влияет
+    assert limiter.hit(1, now=200.0) is True
+
+
+def test_warn_once_per_window():
+    limiter = SlidingWindowLimiter(limit=1, window=60)
+    limiter.hit(1, now=1.0)
+    assert limiter.hit(1, now=2.0) is False
+    assert limiter.should_warn(1) is True
+    assert limiter.should_warn(1) is False
+    limiter.hit(1, now=125.0)
+    assert limiter.should_warn(1) is True
+
+
+def test_idle_keys_evicted_and_size_bounded():
+    limiter = SlidingWindowLimiter(limit=5, window=60, max_keys=100)
+    for user in range(50):
+        limiter.hit(user, now=1.0)
+    assert len(limiter) == 50
+
+    limiter.hit("active", now=200.0)  # прошло больше двух окон — старые ключи вытеснены
+    assert len(limiter) == 1
+
+    for user in range(500):
+        limiter.hit(user, now=300.0)
+    assert len(limiter) == 100
+
+
+@pytest.mark.asyncio
+async def test_middleware_blocks_over_limit():
+    from aiogram.types import User
+
+    from app.middlewares.rate_limit import RateLimitMiddleware
+
+    middleware = RateLimitMiddleware(SlidingWindowLimiter(limit=2, window=60), backend="memory")
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event)
+        return "ok"
+
+    data = {"event_from_user": User(id=555, is_bot=False, first_name="Тест")}
+    results = [await middleware(handler, object(), data) for _ in range(3)]
+    assert results == ["ok", "ok", None]
+    assert len(calls) == 2
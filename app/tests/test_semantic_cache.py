@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+from app.services.semantic_cache import SemanticCacheIndex, same_content
+
+
+def test_lookup_paraphrase():
+    now = datetime.now(UTC)
+    index = SemanticCacheIndex()
+    index.build([
+        ("h1", "сколько стоить доставка в казань", "", now),
+        ("h2", "как вернуть товар", "", now),
+    ])
+
+    # отличие в служебных словах и опечатка в длинном слове — тот же вопрос
+    assert index.lookup("а сколько стоить доставка в казань", score_cutoff=85)[0] == "h1"
+    assert index.lookup("сколько стоить доствка в казань", score_cutoff=85)[0] == "h1"
+
+    # другой город — уже другой вопрос
+    assert index.lookup("сколько стоить доставка в москва", score_cutoff=85) is None
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("доставка в казань", "доставка в рязань"),
+    ("бесплатная доставка", "платная доставка"),
+    ("статус заказа", "статус заказов"),
+    ("казань", "казахстан"),
+])
+def test_lookup_rejects_close_strings_with_other_words(cached, asked):
+    index = SemanticCacheIndex()
+    index.build([("h1", cached, "", datetime.now(UTC))])
+
+    # по буквам похоже (ratio до ~95), но значимые слова другие
+    assert index.lookup(asked, score_cutoff=60) is None
+    assert not same_content(cached, asked)
+
+
+def test_add_updates_only_its_group():
+    now = datetime.now(UTC)
+    index = SemanticCacheIndex()
+    index.build([("a", "как оплатить заказ", "", now), ("b", "как оплатить заказ", "ctx", now)])
+    other = index._groups["ctx"]
+
+    index.add("c", "как отследить заказ", now)
+    assert index._groups["ctx"] is other  # чужая группа не пересобиралась
+    assert index.lookup("как отследить заказ", score_cutoff=90)[0] == "c"
+
+    # перезапись с другим контекстом переносит вопрос между группами
+    index.add("c", "как отследить заказ", now, "ctx")
+    assert index.lookup("как отследить заказ", score_cutoff=90) is None
+    assert index.lookup("как отследить заказ", score_cutoff=90, context_key="ctx")[0] == "c"
+
+
+def test_add_remove_prune():
+    now = datetime.now(UTC)
+    index = SemanticCacheIndex()
+    index.build([("old", "как оплатить заказ", "", now - timedelta(hours=100))])
+    index.add("new", "как отследить заказ", now)
+
+    assert index.lookup("как отследить заказ", score_cutoff=90)[0] == "new"
+
+    assert index.prune(now - timedelta(hours=72)) == 1
+    assert index.lookup("как оплатить заказ", score_cutoff=90) is None
+
+    index.remove("new")
+    assert len(index) == 0
+    assert index.lookup("как отследить заказ", score_cutoff=90) is None
+
+
+def test_lookup_same_context_only():
+    now = datetime.now(UTC)
+    index = SemanticCacheIndex()
+    index.build([
+        ("plain", "как оплатить заказ картой", "", now),
+        ("ctx", "как мне оплатить заказ картой", "3@2025-01-01T00:00:00+00:00", now),
+    ])
+
+    assert index.lookup("как оплатить заказ картой", score_cutoff=80)[0] == "plain"
+    match = index.lookup("как оплатить заказ картой", score_cutoff=80, context_key="3@2025-01-01T00:00:00+00:00")
+    assert match[0] == "ctx"
+    # FAQ изменился → новая версия контекста, старый ответ не подходит
+    assert index.lookup("как оплатить заказ картой", score_cutoff=80, context_key="3@2025-02-01T00:00:00+00:00") is None
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.services.metrics import metrics
+from app.services.single_flight import SingleFlight
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_concurrent_calls_coalesced():
+    metrics.reset()
+    flight = SingleFlight("test.flight", timeout=5)
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ответ"
+
+    results = await asyncio.gather(*(flight.do("k", fn) for _ in range(10)))
+    assert results == ["ответ"] * 10
+    assert calls == 1
+    assert metrics.counter("test.flight.leader") == 1
+    assert metrics.counter("test.flight.coalesced") == 9
+    assert len(flight) == 0
+
+    # после завершения ключ свободен — следующий вызов идёт заново
+    assert await flight.do("k", fn) == "ответ"
+    assert calls == 2
+
+
+async def test_different_keys_not_coalesced():
+    flight = SingleFlight("test.flight", timeout=5)
+
+    async def fn(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    assert await asyncio.gather(flight.do("a", lambda: fn(1)), flight.do("b", lambda: fn(2))) == [1, 2]
+
+
+async def test_error_and_timeout_shared():
+    flight = SingleFlight("test.flight", timeout=5)
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM недоступна")
+
+    results = await asyncio.gather(flight.do("k", boom), flight.do("k", boom), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    results = await asyncio.gather(
+        flight.do("k", slow, timeout=0.05), flight.do("k", slow), return_exceptions=True
+    )
+    assert all(isinstance(r, asyncio.TimeoutError) for r in results)
+    assert len(flight) == 0
+
+
+async def test_leader_cancel_not_spread_to_waiters():
+    metrics.reset()
+    flight = SingleFlight("test.flight", timeout=5)
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ответ"
+
+    leader = asyncio.create_task(flight.do("k", fn))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(flight.do("k", fn)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+
+    leader.cancel()  # пользователь лидера ушёл
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+    # один из ожидающих повторил вызов, остальные дождались его
+    assert await asyncio.gather(*waiters) == ["ответ"] * 3
+    assert calls == 2
+    assert metrics.counter("test.flight.takeover") == 3
+    assert len(flight) == 0
@@ -1,4 +1,7 @@
-from app.services.text_norm import normalize, qhash, shorten
+import threading
+
+from app.services import text_norm
+from app.services.text_norm import hash_norm, normalize, normalize_many, qhash, shorten
 
 
 def test_normalize():
@@ -23,3 +26,95 @@ def test_shorten():
 
     text2 = "короткий текст"
     assert shorten(text2, max_len=50) == text2
+
+
+class FakeParse:
+    def __init__(self, normal_form):
+        self.normal_form = normal_form
+
+
+class FakeMorph:
+    """Подсчитывает вызовы parse; «лемма» — слово без последней буквы у длинных слов."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def parse(self, token):
+        self.calls += 1
+        return [FakeParse(token[:-1] if len(token) > 4 else token)]
+
+
+def test_lemma_cache_and_idempotence(monkeypatch):
+    fake = FakeMorph()
+    monkeypatch.setattr(text_norm, "get_morph", lambda: fake)
+    monkeypatch.setattr(text_norm, "lemma_cache", text_norm.LemmaCache(maxsize=100))
+
+    norm = normalize("Доставка доставка заказы")
+    assert norm == "доставк доставк заказ"
+    assert fake.calls == 2  # повторный токен взят из кэша
+
+    # лемма не кэшируется сама на себя: результат не зависит от того, что встречалось раньше
+    fresh = FakeMorph()
+    monkeypatch.setattr(text_norm, "get_morph", lambda: fresh)
+    monkeypatch.setattr(text_norm, "lemma_cache", text_norm.LemmaCache(maxsize=100))
+    expected = normalize("доставк")
+    normalize("Доставка")
+    assert normalize("доставк") == expected
+
+    info = text_norm.lemma_cache.info()
+    assert info["hits"] > 0
+    assert info["size"] <= 100
+
+
+def test_hash_norm_does_not_lemmatize(monkeypatch):
+    fake = FakeMorph()
+    monkeypatch.setattr(text_norm, "get_morph", lambda: fake)
+    monkeypatch.setattr(text_norm, "lemma_cache", text_norm.LemmaCache(maxsize=100))
+
+    norm = normalize("Доставка заказов")
+    calls = fake.calls
+    assert hash_norm(norm) == qhash("Доставка заказов")
+    assert fake.calls == calls  # готовый norm хэшируется как есть
+
+
+def test_normalize_many(monkeypatch):
+    fake = FakeMorph()
+    monkeypatch.setattr(text_norm, "get_morph", lambda: fake)
+    monkeypatch.setattr(text_norm, "lemma_cache", text_norm.LemmaCache(maxsize=100))
+
+    texts = ["Сроки доставки", "Стоимость доставки", "  сроки  "]
+    assert normalize_many(texts) == [normalize(t) for t in texts]
+    assert fake.calls == 3  # уникальные токены: сроки, доставки, стоимость
+
+
+def test_lemma_cache_eviction():
+    cache = text_norm.LemmaCache(maxsize=2)
+    cache.put("a", "a")
+    cache.put("b", "b")
+    cache.get("a")
+    cache.put("c", "c")
+    assert cache.get("b") is None  # вытеснен самый старый
+    assert cache.get("a") == "a"
+
+
+def test_lemma_cache_thread_safe():
+    cache = text_norm.LemmaCache(maxsize=8)
+    errors = []
+
+    def worker(offset):
+        try:
+            for i in range(20000):
+                token = str((i + offset) % 32)
+                if cache.get(token) is None:
+                    cache.put(token, token)
+        except Exception as e:  # без блокировки move_to_end / popitem падают с KeyError
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert cache.info()["size"] <= 8
@@ -0,0 +1,81 @@
+import pytest
+import pytest_asyncio
+from sqlmodel import SQLModel, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from aiogram.types import User as TgUser
+
+from app.middlewares.db_session import UnitOfWork
+from app.middlewares.user import UserMiddleware
+from app.models import User
+from app.repositories import user_repo
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def session_maker():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    user_repo.clear_cache()
+    yield async_session_maker
+    user_repo.clear_cache()
+
+    await engine.dispose()
+
+
+# === ТЕСТЫ ===
+
+async def test_get_or_create_id_registers_once(session_maker):
+    async with session_maker() as session:
+        first = await user_repo.get_or_create_id(session, 111)
+        user_repo.clear_cache()  # как другая реплика: строка есть, кэша нет → ON CONFLICT DO NOTHING
+        second = await user_repo.get_or_create_id(session, 111)
+        users = (await session.execute(select(User))).scalars().all()
+
+    assert first == second
+    assert len(users) == 1
+    assert user_repo.cached_id(111) == first
+
+
+async def test_get_id_by_tg_id_uses_cache(session_maker):
+    async with session_maker() as session:
+        assert await user_repo.get_id_by_tg_id(session, 222) is None
+        user_id = await user_repo.get_or_create_id(session, 222)
+        await session.execute(User.__table__.delete())
+        await session.commit()
+        # id пользователя не меняется — повторный запрос в БД не нужен
+        assert await user_repo.get_id_by_tg_id(session, 222) == user_id
+
+
+async def test_cache_is_bounded(session_maker, monkeypatch):
+    monkeypatch.setattr(user_repo, "USER_CACHE_SIZE", 2)
+    async with session_maker() as session:
+        for tg_id in (1, 2, 3):
+            await user_repo.get_or_create_id(session, tg_id)
+
+    assert user_repo.cached_id(1) is None
+    assert user_repo.cached_id(3) is not None
+
+
+async def test_middleware_sets_internal_user_id(session_maker):
+    middleware = UserMiddleware()
+    uow = UnitOfWork(session_maker)
+    seen = []
+
+    async def handler(event, data):
+        seen.append(data["db_user_id"])
+
+    data = {"event_from_user": TgUser(id=333, is_bot=False, first_name="Тест"), "uow": uow}
+    await middleware(handler, object(), dict(data))
+    await middleware(handler, object(), dict(data))
+    await uow.finish()
+
+    assert seen[0] == seen[1] == user_repo.cached_id(333)
+
@@ -0,0 +1,72 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.text_norm import normalize
+from app.services.vector_index import TfidfVectorIndex
+
+
+ITEMS = [
+    (1, normalize("Какие способы оплаты доступны")),
+    (2, normalize("Сколько стоит доставка")),
+    (3, normalize("Как вернуть товар")),
+    (4, normalize("Как сделать заказ")),
+    (5, normalize("Как отследить заказ")),
+]
+
+
+def test_paraphrase_ranks_first(tmp_path):
+    index = TfidfVectorIndex(str(tmp_path / "vectors.f32"), dim=1024)
+    index.build(ITEMS)
+
+    results = index.search(normalize("как оплатить"), limit=2)
+    assert results[0][0] == 1
+    assert 0 < results[0][1] <= 100
+
+
+def test_upsert_remove_and_grow(tmp_path):
+    index = TfidfVectorIndex(str(tmp_path / "vectors.f32"), dim=1024)
+    index.build(ITEMS)
+
+    # больше, чем начальная ёмкость файла → файл расширяется
+    for faq_id in range(10, 40):
+        index.upsert(faq_id, normalize(f"вопрос номер {faq_id}"))
+    index.upsert(2, normalize("Сроки доставки по России"))
+    index.remove(3)
+
+    assert len(index) == 34
+    assert index.search(normalize("сроки доставки"), limit=1)[0][0] == 2
+    assert all(faq_id != 3 for faq_id, _ in index.search(normalize("вернуть товар"), limit=5))
+
+
+def test_reopens_existing_file(tmp_path):
+    path = str(tmp_path / "vectors.f32")
+    TfidfVectorIndex(path, dim=1024).build(ITEMS)
+
+    # второй воркер с тем же набором вопросов открывает готовый файл
+    other = TfidfVectorIndex(path, dim=1024)
+    other.build(ITEMS)
+    assert len(other) == 5
+    assert other.search(normalize("как оплатить"), limit=1)[0][0] == 1
+
+
+def test_two_workers_on_one_path(tmp_path):
+    path = str(tmp_path / "vectors.f32")
+    first = TfidfVectorIndex(path, dim=1024)
+    first.build(ITEMS)
+    second = TfidfVectorIndex(path, dim=1024)
+    second.build(ITEMS)
+
+    # точечные изменения одного воркера не портят слоты другого
+    first.remove(1)
+    first.upsert(6, normalize("Как оплатить картой"))
+    assert second.search(normalize("как оплатить"), limit=1)[0][0] == 1
+    assert first.search(normalize("оплатить картой"), limit=1)[0][0] == 6
+
+    # полный build второго публикует новое поколение — первый переоткрывает его
+    # и повторяет поверх свои локальные изменения
+    second.build(ITEMS + [(7, normalize("Где мой чек"))])
+    assert first.search(normalize("где мой чек"), limit=1)[0][0] == 7
+    assert first.search(normalize("оплатить картой"), limit=1)[0][0] == 6
+    assert all(faq_id != 1 for faq_id, _ in first.search(normalize("способы оплаты"), limit=5))
+    assert not list(tmp_path.glob("*.tmp"))